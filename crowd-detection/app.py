@@ -11,14 +11,16 @@ import matplotlib
 matplotlib.use('Agg')  # Use non-GUI backend for web applications
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
-import base64
 import io
-from flask import Flask, request, render_template, jsonify, send_file, make_response
+from flask import Flask, request, render_template, jsonify, send_file, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import tempfile
 import json
+import shutil
 from datetime import datetime
 import logging
+import queue
+from urllib.parse import urlparse
 from pathlib import Path
 
 # Custom JSON encoder to handle numpy types
@@ -33,7 +35,12 @@ class NumpyEncoder(json.JSONEncoder):
         return super(NumpyEncoder, self).default(obj)
 
 # Import our crowd analyzer
-from crowd_analyzer import CrowdAnalyzer
+from crowd_analyzer import (CrowdAnalyzer, ZoneLayout, PerspectiveMap, StageProfiler, FrameSeries, VideoRange,
+                            TilePyramid, SERIES_FORMATS, PYRAMID_LAYERS, parse_timestamp, convert_numpy_types,
+                            KeyedLocks)
+from jobs import Job, JobManager, JobQueueFull
+from result_cache import ResultCache
+from streams import StreamSession, StreamManager, StreamLimitReached
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -43,14 +50,95 @@ app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['OUTPUT_FOLDER'] = 'outputs'
+# Reduced-resolution analysis, e.g. CROWD_ANALYSIS_MAX_SIDE=960 for 4K drone footage
+app.config['ANALYSIS_SCALE'] = float(os.environ.get('CROWD_ANALYSIS_SCALE', '1.0'))
+app.config['ANALYSIS_MAX_SIDE'] = int(os.environ.get('CROWD_ANALYSIS_MAX_SIDE', '0')) or None
+# Analysis worker threads for the video pipeline (1 = serial loop)
+app.config['VIDEO_WORKERS'] = int(os.environ.get('CROWD_VIDEO_WORKERS', '1'))
+# Video decoder: opencv, or pyav for threaded FFmpeg decoding (requires PyAV)
+app.config['VIDEO_DECODER'] = os.environ.get('CROWD_VIDEO_DECODER', 'opencv')
+# Longest side of the crowd flow field for videos and live streams (0 = no flow)
+app.config['FLOW_MAX_SIDE'] = int(os.environ.get('CROWD_FLOW_MAX_SIDE', '0')) or None
+# Running normalization decay for videos, e.g. 0.05 (0 = normalize each frame on its own)
+app.config['RUNNING_NORMALIZATION'] = float(os.environ.get('CROWD_RUNNING_NORMALIZATION', '0')) or None
+# Per-stage profiling for /api/metrics (CROWD_PROFILING=allocations also traces allocations, slower)
+app.config['PROFILING'] = os.environ.get('CROWD_PROFILING', '').lower()
+# Per-camera zone profiles, <camera>.json, selected by the 'camera' form field
+app.config['CAMERA_PROFILE_FOLDER'] = os.environ.get('CROWD_CAMERA_PROFILES', 'camera_profiles')
+# Background analysis jobs: concurrent analyses, waiting-job limit, seconds finished jobs are kept
+app.config['JOB_WORKERS'] = int(os.environ.get('CROWD_JOB_WORKERS', '2'))
+app.config['MAX_QUEUED_JOBS'] = int(os.environ.get('CROWD_MAX_QUEUED_JOBS', '32'))
+app.config['JOB_RETENTION'] = float(os.environ.get('CROWD_JOB_RETENTION', '3600'))
+# Results of repeat uploads are reused from here, least recently used first out (0 MB = no cache)
+app.config['RESULT_CACHE_FOLDER'] = os.environ.get('CROWD_RESULT_CACHE', os.path.join('cache', 'results'))
+app.config['RESULT_CACHE_MAX_MB'] = int(os.environ.get('CROWD_RESULT_CACHE_MAX_MB', '2048'))
+# Per-frame video metrics file format (npz, or parquet / arrow with pyarrow) and points in response timelines
+app.config['SERIES_FORMAT'] = os.environ.get('CROWD_SERIES_FORMAT', 'npz')
+app.config['TIMELINE_POINTS'] = int(os.environ.get('CROWD_TIMELINE_POINTS', '300'))
+# Browser cache lifetime (seconds) of analysis artifacts; outputs never change once written
+app.config['ARTIFACT_MAX_AGE'] = int(os.environ.get('CROWD_ARTIFACT_MAX_AGE', '3600'))
+# Images of at least this many megapixels are analyzed in tiles (0 disables)
+app.config['TILED_MIN_MEGAPIXELS'] = float(os.environ.get('CROWD_TILED_MIN_MEGAPIXELS', '40'))
+# Images of at least this many megapixels get zoomable heatmap/blended tile pyramids (0 disables)
+app.config['PYRAMID_MIN_MEGAPIXELS'] = float(os.environ.get('CROWD_PYRAMID_MIN_MEGAPIXELS', '12'))
+# Live stream analysis: concurrent stream limit and default time budget per frame
+app.config['MAX_STREAMS'] = int(os.environ.get('CROWD_MAX_STREAMS', '4'))
+app.config['STREAM_FRAME_BUDGET_MS'] = float(os.environ.get('CROWD_STREAM_FRAME_BUDGET_MS', '500'))
 app.json_encoder = NumpyEncoder
 
 # Create necessary directories
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
 
+# Stage histograms shared by every analyzer
+profiler = StageProfiler(enabled=app.config['PROFILING'] in ('1', 'true', 'allocations'),
+                         track_allocations=app.config['PROFILING'] == 'allocations')
+
+# Content-addressed result cache shared by every analyzer (keys include analyzer settings)
+result_cache = None
+if app.config['RESULT_CACHE_MAX_MB'] > 0:
+    result_cache = ResultCache(app.config['RESULT_CACHE_FOLDER'], app.config['RESULT_CACHE_MAX_MB'] * 1024 * 1024)
+
 # Initialize crowd analyzer
-crowd_analyzer = CrowdAnalyzer()
+crowd_analyzer = CrowdAnalyzer(analysis_scale=app.config['ANALYSIS_SCALE'],
+                               analysis_max_side=app.config['ANALYSIS_MAX_SIDE'],
+                               workers=app.config['VIDEO_WORKERS'],
+                               decoder=app.config['VIDEO_DECODER'],
+                               flow_max_side=app.config['FLOW_MAX_SIDE'],
+                               running_normalization=app.config['RUNNING_NORMALIZATION'],
+                               profiler=profiler,
+                               cache=result_cache,
+                               series_format=app.config['SERIES_FORMAT'],
+                               tiled_min_pixels=int(app.config['TILED_MIN_MEGAPIXELS'] * 1e6) or None,
+                               pyramid_min_pixels=int(app.config['PYRAMID_MIN_MEGAPIXELS'] * 1e6) or None)
+
+# Analyzers for cameras with zone profiles, created on first use
+camera_analyzers = {}
+
+def get_crowd_analyzer(camera=None):
+    """Get the analyzer for a camera profile (the default analyzer if none)"""
+    if not camera:
+        return crowd_analyzer
+    
+    camera = secure_filename(camera)
+    if camera not in camera_analyzers:
+        profile_path = os.path.join(app.config['CAMERA_PROFILE_FOLDER'], f"{camera}.json")
+        if not os.path.exists(profile_path):
+            raise FileNotFoundError(f"Unknown camera profile: {camera}")
+        camera_analyzers[camera] = CrowdAnalyzer(analysis_scale=app.config['ANALYSIS_SCALE'],
+                                                 analysis_max_side=app.config['ANALYSIS_MAX_SIDE'],
+                                                 workers=app.config['VIDEO_WORKERS'],
+                                                 decoder=app.config['VIDEO_DECODER'],
+                                                 flow_max_side=app.config['FLOW_MAX_SIDE'],
+                                                 running_normalization=app.config['RUNNING_NORMALIZATION'],
+                                                 profiler=profiler,
+                                                 zones=ZoneLayout.from_file(profile_path),
+                                                 perspective=PerspectiveMap.from_file(profile_path),
+                                                 cache=result_cache,
+                                                 series_format=app.config['SERIES_FORMAT'],
+                                                 tiled_min_pixels=int(app.config['TILED_MIN_MEGAPIXELS'] * 1e6) or None,
+                                                 pyramid_min_pixels=int(app.config['PYRAMID_MIN_MEGAPIXELS'] * 1e6) or None)
+    return camera_analyzers[camera]
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'mp4', 'avi', 'mov', 'mkv', 'wmv'}
@@ -69,25 +157,70 @@ def is_image_file(filename):
     image_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in image_extensions
 
-def encode_image_to_base64(image_path):
-    """Encode image to base64 for web display"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
-
-def convert_numpy_types(obj):
-    """Convert numpy types to Python native types for JSON serialization"""
-    if isinstance(obj, np.integer):
-        return int(obj)
-    elif isinstance(obj, np.floating):
-        return float(obj)
-    elif isinstance(obj, np.ndarray):
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        return {key: convert_numpy_types(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_numpy_types(item) for item in obj]
-    else:
-        return obj
+# Thumbnail widths served for image and video artifacts (?width=...)
+THUMBNAIL_WIDTHS = (160, 320, 640)
+THUMBNAIL_WIDTH = 320
+
+def artifact_url(analysis_id, name):
+    """Get the URL of an analysis output file (<analysis_id>_<name>)"""
+    return f"/api/analysis/{analysis_id}/artifacts/{name}"
+
+def tiles_response(analysis_id, pyramid):
+    """Describe an image's tile pyramids for the viewer (None without them)"""
+    if not pyramid:
+        return None
+    return dict(pyramid, layers={layer: f"/api/analysis/{analysis_id}/tiles/{layer}/{{z}}/{{x}}/{{y}}.{tile_format}"
+                                 for layer, tile_format in PYRAMID_LAYERS.items()})
+
+def send_artifact(file_path, as_attachment=False):
+    """Send a file with ETag/Last-Modified revalidation and byte-range support"""
+    return send_file(os.path.abspath(file_path), conditional=True, etag=True, as_attachment=as_attachment,
+                     max_age=app.config['ARTIFACT_MAX_AGE'])
+
+def find_output_file(filename):
+    """Find an output file by name; outputs are named <analysis_id>_<suffix> inside <analysis_id>/"""
+    filename = secure_filename(filename)
+    for analysis_id in os.listdir(app.config['OUTPUT_FOLDER']):
+        if filename.startswith(f"{analysis_id}_"):
+            file_path = os.path.join(app.config['OUTPUT_FOLDER'], analysis_id, filename)
+            if os.path.isfile(file_path):
+                return file_path
+    return None
+
+thumbnail_locks = KeyedLocks()
+
+def get_thumbnail(file_path, width):
+    """Get a JPEG thumbnail of an image (or a video's first frame), rendering it on first request"""
+    thumbnail_dir = os.path.join(os.path.dirname(file_path), '.thumbnails')
+    thumbnail_path = os.path.join(thumbnail_dir, f"{os.path.basename(file_path)}.{width}.jpg")
+    
+    with thumbnail_locks.hold(thumbnail_path):
+        if os.path.exists(thumbnail_path):
+            return thumbnail_path
+        
+        if is_video_file(file_path):
+            cap = cv2.VideoCapture(file_path)
+            ok, image = cap.read()
+            cap.release()
+            if not ok:
+                image = None
+        else:
+            image = cv2.imread(file_path)
+        if image is None:
+            raise ValueError(f"No thumbnail for {os.path.basename(file_path)}")
+        
+        # Only ever downscale
+        if image.shape[1] > width:
+            height = max(1, round(image.shape[0] * width / image.shape[1]))
+            image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        
+        # Write to a temporary name so readers never see a partial file
+        os.makedirs(thumbnail_dir, exist_ok=True)
+        temp_path = f"{thumbnail_path}.tmp.jpg"
+        cv2.imwrite(temp_path, image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+        os.replace(temp_path, thumbnail_path)
+    
+    return thumbnail_path
 
 def create_response_data(analysis_result, file_type, output_dir, filename):
     """Create response data for API"""
@@ -100,18 +233,34 @@ def create_response_data(analysis_result, file_type, output_dir, filename):
             'crowd_level': str(analysis_result['analysis']['overall']['crowd_level']),
             'confidence': float(analysis_result['analysis']['estimated_count']['confidence']),
             'highest_density_region': str(analysis_result['analysis']['highest_density_region']),
-            'regions': convert_numpy_types(analysis_result['analysis']['regions'])
+            'regions': convert_numpy_types(analysis_result['analysis']['regions']),
+            'zones': convert_numpy_types(analysis_result['analysis'].get('zones', {})),
+            'hotspots': convert_numpy_types(analysis_result['analysis'].get('hotspots', []))
         }
         
         return {
             'success': True,
             'type': 'image',
             'analysis': analysis_data,
+            'tiled': bool(analysis_result.get('tiled')),
+            'tiles': tiles_response(base_name, analysis_result.get('pyramid')),
             'images': {
-                'heatmap': encode_image_to_base64(os.path.join(output_dir, f"{base_name}_heatmap.png")),
-                'blended': encode_image_to_base64(os.path.join(output_dir, f"{base_name}_blended.jpg")),
-                'analysis': encode_image_to_base64(os.path.join(output_dir, f"{base_name}_analysis.png"))
+                'heatmap': artifact_url(base_name, 'heatmap.png'),
+                'blended': artifact_url(base_name, 'blended.jpg')
+            },
+            'thumbnails': {
+                'heatmap': f"{artifact_url(base_name, 'heatmap.png')}?width={THUMBNAIL_WIDTH}",
+                'blended': f"{artifact_url(base_name, 'blended.jpg')}?width={THUMBNAIL_WIDTH}"
+            },
+            'figures': {
+                'analysis': f"/api/analysis/{base_name}/figure"
             },
+            'downloads': {
+                'density_map': artifact_url(base_name, 'density.npy'),
+                'analysis': artifact_url(base_name, 'analysis.json'),
+                'report': artifact_url(base_name, 'report.txt')
+            },
+            'cached': bool(analysis_result.get('cached')),
             'timestamp': datetime.now().isoformat()
         }
     
@@ -123,7 +272,14 @@ def create_response_data(analysis_result, file_type, output_dir, filename):
             'average_people_per_frame': float(analysis_result['average_people_per_frame']),
             'max_people_in_frame': int(analysis_result['max_people_in_frame']),
             'final_crowd_level': str(analysis_result['final_analysis']['overall']['crowd_level']),
-            'final_regions': convert_numpy_types(analysis_result['final_analysis']['regions'])
+            'final_regions': convert_numpy_types(analysis_result['final_analysis']['regions']),
+            'final_zones': convert_numpy_types(analysis_result['final_analysis'].get('zones', {})),
+            'hotspot_tracks': convert_numpy_types(analysis_result.get('hotspot_tracks', [])),
+            'fps': analysis_result.get('fps'),
+            'first_frame': analysis_result.get('first_frame'),
+            'last_frame': analysis_result.get('last_frame'),
+            'start_time': analysis_result.get('start_time'),
+            'end_time': analysis_result.get('end_time')
         }
         
         return {
@@ -131,16 +287,139 @@ def create_response_data(analysis_result, file_type, output_dir, filename):
             'type': 'video',
             'analysis': analysis_data,
             'videos': {
-                'blended_video': f"/video/{base_name}_blended_output.mp4",
-                'heatmap_video': f"/video/{base_name}_heatmap_video.mp4"
+                'blended_video': artifact_url(base_name, 'blended_output.mp4'),
+                'heatmap_video': artifact_url(base_name, 'heatmap_video.mp4')
             },
             'images': {
-                'final_heatmap': encode_image_to_base64(os.path.join(output_dir, f"{base_name}_final_heatmap.png")),
-                'final_analysis': encode_image_to_base64(os.path.join(output_dir, f"{base_name}_final_analysis.png"))
+                'final_heatmap': artifact_url(base_name, 'final_heatmap.png')
+            },
+            'thumbnails': {
+                'blended_video': f"{artifact_url(base_name, 'blended_output.mp4')}?width={THUMBNAIL_WIDTH}",
+                'heatmap_video': f"{artifact_url(base_name, 'heatmap_video.mp4')}?width={THUMBNAIL_WIDTH}",
+                'final_heatmap': f"{artifact_url(base_name, 'final_heatmap.png')}?width={THUMBNAIL_WIDTH}"
+            },
+            'figures': {
+                'final_analysis': f"/api/analysis/{base_name}/figure"
             },
+            'timeline': analysis_result['series'].downsample(app.config['TIMELINE_POINTS']),
+            'timeline_url': f"/api/analysis/{base_name}/timeline",
+            'downloads': {
+                'frames': artifact_url(base_name, 'frames.jsonl'),
+                'series': artifact_url(base_name, f"frames{Path(analysis_result['series_path']).suffix}"),
+                'density_map': artifact_url(base_name, 'final_density.npy'),
+                'analysis': artifact_url(base_name, 'final_analysis.json'),
+                'report': artifact_url(base_name, 'video_report.txt')
+            },
+            'cached': bool(analysis_result.get('cached')),
             'timestamp': datetime.now().isoformat()
         }
 
+def parse_video_range(form):
+    """Get the VideoRange from 'start'/'end' (timestamps) or 'start_frame'/'end_frame' form fields (None if absent)"""
+    start, end, start_frame, end_frame = (form.get(name) or None
+                                          for name in ('start', 'end', 'start_frame', 'end_frame'))
+    if start is None and end is None and start_frame is None and end_frame is None:
+        return None
+    try:
+        start_frame = int(start_frame) if start_frame is not None else None
+        end_frame = int(end_frame) if end_frame is not None else None
+    except ValueError:
+        raise ValueError("start_frame and end_frame must be whole frame numbers")
+    return VideoRange(parse_timestamp(start) if start is not None else None,
+                      parse_timestamp(end) if end is not None else None,
+                      start_frame, end_frame)
+
+def save_upload(file):
+    """Save an uploaded file; returns (filename, file_path, output_dir, file_type)"""
+    filename = secure_filename(file.filename)
+    # Microseconds keep simultaneous uploads of the same file apart
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    filename = f"{timestamp}_{filename}"
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    file.save(file_path)
+    
+    # Create output directory
+    output_dir = os.path.join(app.config['OUTPUT_FOLDER'], Path(filename).stem)
+    os.makedirs(output_dir, exist_ok=True)
+    
+    file_type = 'image' if is_image_file(filename) else 'video'
+    return filename, file_path, output_dir, file_type
+
+def run_job(job):
+    """Analyze a job's upload and build the API response (runs on a job worker)"""
+    try:
+        analyzer = get_crowd_analyzer(job.camera)
+        if job.file_type == 'image':
+            logger.info(f"Processing image: {job.filename}")
+            job.update_progress(0, 1)
+            result = analyzer.process_image(job.file_path, job.output_dir)
+            job.update_progress(1, 1)
+        else:
+            logger.info(f"Processing video: {job.filename}")
+            result = analyzer.process_video(job.file_path, job.output_dir, progress=job.update_progress,
+                                            video_range=job.video_range)
+        
+        response_data = create_response_data(result, job.file_type, job.output_dir, job.filename)
+        response_data['job_id'] = job.id
+        return response_data
+    except Exception:
+        # Cancelled or failed jobs leave no partial outputs behind
+        shutil.rmtree(job.output_dir, ignore_errors=True)
+        raise
+    finally:
+        # Clean up uploaded file
+        if os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+def discard_job(job):
+    """Remove the upload and output directory of a job cancelled before it started"""
+    if os.path.exists(job.file_path):
+        os.remove(job.file_path)
+    shutil.rmtree(job.output_dir, ignore_errors=True)
+
+job_manager = JobManager(run_job, workers=app.config['JOB_WORKERS'], max_queued=app.config['MAX_QUEUED_JOBS'],
+                         retention=app.config['JOB_RETENTION'], discard_job=discard_job)
+
+# Live sources: network streams or a local camera index (never server-side file paths)
+STREAM_SCHEMES = {'rtsp', 'rtsps', 'http', 'https'}
+
+def parse_stream_source(source):
+    """Get the capture source for a stream URL or camera index, raising ValueError otherwise"""
+    source = (source or '').strip()
+    if source.isdigit():
+        return int(source)
+    parsed = urlparse(source)
+    if parsed.scheme.lower() not in STREAM_SCHEMES or not parsed.netloc:
+        raise ValueError("source must be an rtsp://, http(s):// URL or a camera index")
+    return source
+
+def run_stream(session):
+    """Analyze a live stream until stopped (runs on the session's thread)"""
+    analyzer = get_crowd_analyzer(session.camera)
+    return analyzer.process_stream(session.source,
+                                   lambda update, jpeg: session.publish(convert_numpy_types(update), jpeg),
+                                   stop=session.stop_event, frame_budget=session.frame_budget)
+
+stream_manager = StreamManager(run_stream, max_streams=app.config['MAX_STREAMS'])
+
+def stream_response(session):
+    """Build the status response for a live stream"""
+    data = session.to_dict()
+    data['success'] = session.status != 'failed'
+    data['events_url'] = f"/api/streams/{session.id}/events"
+    data['heatmap_url'] = f"/api/streams/{session.id}/heatmap.jpg"
+    return data
+
+def job_response(job):
+    """Build the status response for a job"""
+    data = job.to_dict()
+    data['success'] = job.status != 'failed'
+    data['queue_position'] = job_manager.queue_position(job)
+    data['status_url'] = f"/api/jobs/{job.id}"
+    if job.status == 'completed':
+        data['result_url'] = f"/api/jobs/{job.id}/result"
+    return data
+
 @app.route('/')
 def index():
     """Main page"""
@@ -160,26 +439,24 @@ def analyze_file():
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': 'File type not supported'}), 400
         
-        # Save uploaded file
-        filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
+        try:
+            analyzer = get_crowd_analyzer(request.form.get('camera'))
+            video_range = parse_video_range(request.form)
+        except (FileNotFoundError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
-        # Create output directory
-        output_dir = os.path.join(app.config['OUTPUT_FOLDER'], Path(filename).stem)
-        os.makedirs(output_dir, exist_ok=True)
+        # Save uploaded file
+        filename, file_path, output_dir, _ = save_upload(file)
         
         # Analyze file
         if is_image_file(filename):
             logger.info(f"Processing image: {filename}")
-            result = crowd_analyzer.process_image(file_path, output_dir)
+            result = analyzer.process_image(file_path, output_dir)
             response_data = create_response_data(result, 'image', output_dir, filename)
             
         elif is_video_file(filename):
             logger.info(f"Processing video: {filename}")
-            result = crowd_analyzer.process_video(file_path, output_dir)
+            result = analyzer.process_video(file_path, output_dir, video_range=video_range)
             response_data = create_response_data(result, 'video', output_dir, filename)
             
         else:
@@ -197,17 +474,157 @@ def analyze_file():
         logger.error(f"Traceback: {traceback.format_exc()}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """Queue a file for background analysis and return its job ID at once"""
+    try:
+        if 'file' not in request.files:
+            return jsonify({'success': False, 'error': 'No file provided'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'success': False, 'error': 'No file selected'}), 400
+        
+        if not allowed_file(file.filename):
+            return jsonify({'success': False, 'error': 'File type not supported'}), 400
+        
+        camera = request.form.get('camera') or None
+        try:
+            get_crowd_analyzer(camera)
+            video_range = parse_video_range(request.form)
+        except (FileNotFoundError, ValueError) as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        filename, file_path, output_dir, file_type = save_upload(file)
+        job = Job(filename, file_path, output_dir, file_type, camera=camera, video_range=video_range)
+        try:
+            job_manager.submit(job)
+        except JobQueueFull as e:
+            discard_job(job)
+            response = jsonify({'success': False, 'error': str(e)})
+            response.headers['Retry-After'] = '30'
+            return response, 503
+        
+        return jsonify(job_response(job)), 202
+        
+    except Exception as e:
+        logger.error(f"Error submitting job: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Job status with progress (frames done, fps, ETA)"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(job_response(job))
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Analysis result of a completed job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    if job.status != 'completed':
+        return jsonify(job_response(job)), 409
+    return jsonify(job.result)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify(job_response(job))
+
+@app.route('/api/streams', methods=['POST'])
+def start_stream():
+    """Start live analysis of an RTSP/HTTP stream or camera ('source', optional 'camera' and 'budget_ms')"""
+    params = request.get_json(silent=True) or request.form
+    camera = params.get('camera') or None
+    try:
+        source = parse_stream_source(params.get('source'))
+        get_crowd_analyzer(camera)
+        budget_ms = float(params.get('budget_ms') or app.config['STREAM_FRAME_BUDGET_MS'])
+        if budget_ms <= 0:
+            raise ValueError("budget_ms must be positive")
+    except (FileNotFoundError, ValueError) as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        session = stream_manager.start(StreamSession(source, camera=camera, frame_budget=budget_ms / 1000))
+    except StreamLimitReached as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    return jsonify(stream_response(session)), 201
+
+@app.route('/api/streams', methods=['GET'])
+def list_streams():
+    """Live streams with their latest statistics"""
+    return jsonify({'streams': [stream_response(session) for session in stream_manager.sessions()]})
+
+@app.route('/api/streams/<stream_id>', methods=['GET'])
+def stream_status(stream_id):
+    """Live stream status with the latest rolling statistics"""
+    session = stream_manager.get(stream_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Stream not found'}), 404
+    return jsonify(stream_response(session))
+
+@app.route('/api/streams/<stream_id>/events')
+def stream_events(stream_id):
+    """Server-sent events: one 'data' message per analyzed frame, 'end' when the stream stops"""
+    session = stream_manager.get(stream_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Stream not found'}), 404
+    
+    def events():
+        subscriber = session.subscribe()
+        try:
+            while True:
+                try:
+                    update = subscriber.get(timeout=15)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                if update is None:
+                    yield f"event: end\ndata: {json.dumps({'status': session.status, 'error': session.error})}\n\n"
+                    return
+                yield f"data: {json.dumps(update)}\n\n"
+        finally:
+            session.unsubscribe(subscriber)
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/streams/<stream_id>/heatmap.jpg')
+def stream_heatmap(stream_id):
+    """Latest blended heatmap of a live stream"""
+    session = stream_manager.get(stream_id)
+    if session is None or session.jpeg is None:
+        return jsonify({'success': False, 'error': 'No heatmap available'}), 404
+    response = Response(session.jpeg, mimetype='image/jpeg')
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/streams/<stream_id>', methods=['DELETE'])
+def stop_stream(stream_id):
+    """Stop a live stream"""
+    session = stream_manager.stop(stream_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Stream not found'}), 404
+    return jsonify(stream_response(session))
+
 @app.route('/download/<filename>')
 def download_file(filename):
     """Download generated files"""
     try:
-        # Find the file in outputs directory
-        for root, dirs, files in os.walk(app.config['OUTPUT_FOLDER']):
-            if filename in files:
-                file_path = os.path.join(root, filename)
-                return send_file(file_path, as_attachment=True)
-        
-        return jsonify({'error': 'File not found'}), 404
+        file_path = find_output_file(filename)
+        if file_path is None:
+            return jsonify({'error': 'File not found'}), 404
+        return send_artifact(file_path, as_attachment=True)
         
     except Exception as e:
         logger.error(f"Error downloading file: {str(e)}")
@@ -215,27 +632,157 @@ def download_file(filename):
 
 @app.route('/video/<filename>')
 def serve_video(filename):
-    """Serve video files for inline playback"""
+    """Serve video files for inline playback (with byte ranges for seeking)"""
     try:
-        # Find the file in outputs directory
-        for root, dirs, files in os.walk(app.config['OUTPUT_FOLDER']):
-            if filename in files:
-                file_path = os.path.join(root, filename)
-                
-                # Set proper headers for video streaming
-                response = make_response(send_file(file_path))
-                response.headers['Content-Type'] = 'video/mp4'
-                response.headers['Accept-Ranges'] = 'bytes'
-                response.headers['Cache-Control'] = 'no-cache'
-                
-                return response
-        
-        return jsonify({'error': 'File not found'}), 404
+        file_path = find_output_file(filename)
+        if file_path is None:
+            return jsonify({'error': 'File not found'}), 404
+        return send_artifact(file_path)
         
     except Exception as e:
         logger.error(f"Error serving video: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analysis/<analysis_id>/artifacts/<name>')
+def analysis_artifact(analysis_id, name):
+    """Serve an analysis output file
+    
+    Responses carry ETag and Last-Modified for conditional requests and
+    support byte ranges, so browsers cache images and seek in videos without
+    downloading them again. ?width=160|320|640 serves a JPEG thumbnail (the
+    first frame for videos); ?download=1 serves the file as an attachment.
+    """
+    try:
+        analysis_id = secure_filename(analysis_id)
+        file_path = os.path.join(app.config['OUTPUT_FOLDER'], analysis_id, f"{analysis_id}_{secure_filename(name)}")
+        if not os.path.isfile(file_path):
+            return jsonify({'error': 'Artifact not found'}), 404
+        
+        width = request.args.get('width', type=int)
+        if width is not None:
+            if width not in THUMBNAIL_WIDTHS:
+                return jsonify({'error': f"Thumbnail width must be one of {list(THUMBNAIL_WIDTHS)}"}), 400
+            try:
+                file_path = get_thumbnail(file_path, width)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        return send_artifact(file_path, as_attachment=request.args.get('download') == '1')
+        
+    except Exception as e:
+        logger.error(f"Error serving artifact: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analysis/<analysis_id>/tiles')
+def analysis_tiles(analysis_id):
+    """Describe an image's tile pyramids: size, tile size, zoom levels and tile URL templates"""
+    try:
+        analysis_id = secure_filename(analysis_id)
+        pyramid_path = TilePyramid.path(os.path.join(app.config['OUTPUT_FOLDER'], analysis_id), analysis_id, 'heatmap')
+        if not os.path.isfile(pyramid_path):
+            return jsonify({'error': 'Tiles not found'}), 404
+        return jsonify(tiles_response(analysis_id, TilePyramid.read_metadata(pyramid_path)))
+    
+    except Exception as e:
+        logger.error(f"Error reading tile pyramid: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analysis/<analysis_id>/tiles/<layer>/<int:z>/<int:x>/<int:y>.<ext>')
+def analysis_tile(analysis_id, layer, z, x, y, ext):
+    """Serve one XYZ tile of the heatmap or blended pyramid
+    
+    Tiles never change for an analysis, so they carry an ETag and the
+    artifact cache lifetime; viewers only request the tiles in view.
+    """
+    try:
+        if PYRAMID_LAYERS.get(layer) != ext:
+            return jsonify({'error': 'Tile layer not found'}), 404
+        analysis_id = secure_filename(analysis_id)
+        pyramid_path = TilePyramid.path(os.path.join(app.config['OUTPUT_FOLDER'], analysis_id), analysis_id, layer)
+        if not os.path.isfile(pyramid_path):
+            return jsonify({'error': 'Tiles not found'}), 404
+        tile = TilePyramid.read_tile(pyramid_path, z, x, y)
+        if tile is None:
+            return jsonify({'error': 'Tile not found'}), 404
+        
+        stat = os.stat(pyramid_path)
+        response = Response(tile, mimetype='image/png' if ext == 'png' else 'image/jpeg')
+        response.set_etag(f"{int(stat.st_mtime)}-{stat.st_size}-{z}-{x}-{y}")
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config['ARTIFACT_MAX_AGE']
+        return response.make_conditional(request)
+    
+    except Exception as e:
+        logger.error(f"Error serving tile: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analysis/<analysis_id>/figure')
+def analysis_figure(analysis_id):
+    """Serve the analysis figure, rendering it on first request"""
+    try:
+        analysis_id = secure_filename(analysis_id)
+        output_dir = os.path.join(app.config['OUTPUT_FOLDER'], analysis_id)
+        
+        # Images save <id>_analysis.json, videos <id>_final_analysis.json
+        prefix = analysis_id
+        if not os.path.exists(os.path.join(output_dir, f"{prefix}_analysis.json")):
+            prefix = f"{analysis_id}_final"
+        
+        figure_path = crowd_analyzer.get_analysis_figure(output_dir, prefix)
+        return send_artifact(figure_path)
+        
+    except FileNotFoundError:
+        return jsonify({'error': 'Analysis not found'}), 404
+    except Exception as e:
+        logger.error(f"Error rendering analysis figure: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/analysis/<analysis_id>/timeline')
+def analysis_timeline(analysis_id):
+    """Per-frame video metrics downsampled to ?points=N buckets (default: CROWD_TIMELINE_POINTS)"""
+    try:
+        analysis_id = secure_filename(analysis_id)
+        output_dir = os.path.join(app.config['OUTPUT_FOLDER'], analysis_id)
+        points = request.args.get('points', app.config['TIMELINE_POINTS'], type=int)
+        if not 1 <= points <= 10000:
+            return jsonify({'error': 'points must be between 1 and 10000'}), 400
+        
+        for series_format in SERIES_FORMATS:
+            series_path = os.path.join(output_dir, f"{analysis_id}_frames.{series_format}")
+            if os.path.exists(series_path):
+                return jsonify(FrameSeries.load(series_path).downsample(points))
+        return jsonify({'error': 'Timeline not found'}), 404
+        
+    except Exception as e:
+        logger.error(f"Error loading timeline: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/cameras')
+def list_cameras():
+    """List camera profiles and their zone names"""
+    cameras = {}
+    folder = app.config['CAMERA_PROFILE_FOLDER']
+    if os.path.isdir(folder):
+        for profile_file in sorted(os.listdir(folder)):
+            if profile_file.endswith('.json'):
+                try:
+                    layout = ZoneLayout.from_file(os.path.join(folder, profile_file))
+                except (ValueError, KeyError, json.JSONDecodeError) as e:
+                    logger.error(f"Invalid camera profile {profile_file}: {str(e)}")
+                    continue
+                cameras[Path(profile_file).stem] = [zone['name'] for zone in layout.zones]
+    return jsonify({'cameras': cameras})
+
+@app.route('/api/metrics')
+def metrics():
+    """Per-stage timing (and allocation) histograms since startup"""
+    return jsonify({
+        'profiling': profiler.enabled,
+        'track_allocations': profiler.track_allocations,
+        'stages': convert_numpy_types(profiler.summary()),
+        'timestamp': datetime.now().isoformat()
+    })
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
@@ -243,6 +790,9 @@ def health_check():
         'status': 'healthy',
         'service': 'Trinetra - Crowd Analysis',
         'version': '1.0.0',
+        'jobs': job_manager.stats(),
+        'streams': stream_manager.stats(),
+        'result_cache': result_cache.stats() if result_cache else None,
         'timestamp': datetime.now().isoformat()
     })
 
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the crowd-detection analyzers
+Synthetic crowd frames and videos, per-stage timings and JSON results for comparing commits
+"""
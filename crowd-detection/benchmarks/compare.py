@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Compare two benchmark result files
+Prints per-stage median times side by side and exits non-zero on regressions
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Dict
+
+def compare_results(baseline: Dict, candidate: Dict, threshold: float) -> List[Dict]:
+    """Compare median stage times and video throughput of two benchmark runs"""
+    rows = []
+    for resolution, base_result in baseline['resolutions'].items():
+        result = candidate['resolutions'].get(resolution)
+        if result is None:
+            continue
+        
+        for stage, base_stats in base_result['stages'].items():
+            stats = result['stages'].get(stage)
+            if stats is None:
+                continue
+            ratio = stats['median_ms'] / base_stats['median_ms']
+            rows.append({
+                'resolution': resolution,
+                'metric': stage,
+                'baseline': base_stats['median_ms'],
+                'candidate': stats['median_ms'],
+                'unit': 'ms',
+                'ratio': ratio,
+                'regression': ratio > 1 + threshold
+            })
+        
+        # Throughput: higher is better, so the ratio is inverted
+        videos = {video['workers']: video for video in result.get('video', [])}
+        for base_video in base_result.get('video', []):
+            video = videos.get(base_video['workers'])
+            if video is None:
+                continue
+            ratio = base_video['frames_per_second'] / video['frames_per_second']
+            rows.append({
+                'resolution': resolution,
+                'metric': f"video_{base_video['workers']}w",
+                'baseline': base_video['frames_per_second'],
+                'candidate': video['frames_per_second'],
+                'unit': 'fps',
+                'ratio': ratio,
+                'regression': ratio > 1 + threshold
+            })
+        
+        ratio = result['peak_rss_mb'] / base_result['peak_rss_mb']
+        rows.append({
+            'resolution': resolution,
+            'metric': 'peak_rss',
+            'baseline': base_result['peak_rss_mb'],
+            'candidate': result['peak_rss_mb'],
+            'unit': 'MB',
+            'ratio': ratio,
+            'regression': ratio > 1 + threshold
+        })
+    return rows
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Compare two crowd analyzer benchmark results')
+    parser.add_argument('baseline', help='Baseline results JSON')
+    parser.add_argument('candidate', help='Candidate results JSON')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative slowdown reported as a regression (default: 0.1 = 10%%)')
+    
+    args = parser.parse_args()
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    
+    print(f"Baseline:  {baseline['environment']['commit']} ({baseline['environment']['timestamp']})")
+    print(f"Candidate: {candidate['environment']['commit']} ({candidate['environment']['timestamp']})")
+    if baseline['environment']['platform'] != candidate['environment']['platform']:
+        print("Warning: results come from different platforms")
+    
+    rows = compare_results(baseline, candidate, args.threshold)
+    resolution = None
+    for row in rows:
+        if row['resolution'] != resolution:
+            resolution = row['resolution']
+            print(f"\n{resolution}:")
+        # Ratio is cost relative to baseline: below 1 is faster (or smaller)
+        flag = "  REGRESSION" if row['regression'] else ""
+        print(f"  {row['metric']:<16} {row['baseline']:9.2f} -> {row['candidate']:9.2f} {row['unit']:<3} "
+              f"(x{row['ratio']:.2f} cost){flag}")
+    
+    regressions = [row for row in rows if row['regression']]
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
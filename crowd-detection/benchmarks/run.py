@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Crowd analyzer benchmark runner
+Times each analysis stage on synthetic frames and end-to-end video processing,
+and writes the results as JSON for comparison between commits
+
+Run from the crowd-detection directory:
+    python -m benchmarks.run --resolutions 720p 1080p 4k
+    python -m benchmarks.compare old.json new.json
+"""
+
+import cv2
+import numpy as np
+import argparse
+import os
+import sys
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+import logging
+from datetime import datetime
+from typing import List, Dict
+
+from crowd_analyzer import CrowdDensityAnalyzer, HeatmapGenerator, VideoProcessor
+from benchmarks.synthetic import RESOLUTIONS, generate_frames, write_video
+
+def peak_rss_mb() -> float:
+    """Get the process peak resident set size in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def summarize_times(times: List[float]) -> Dict:
+    """Summarize stage durations (seconds) in milliseconds"""
+    times_ms = np.array(times) * 1000
+    return {
+        'mean_ms': float(np.mean(times_ms)),
+        'median_ms': float(np.median(times_ms)),
+        'p90_ms': float(np.percentile(times_ms, 90)),
+        'min_ms': float(np.min(times_ms)),
+        'samples': len(times_ms)
+    }
+
+def time_call(times: Dict[str, List[float]], stage: str, func, *args):
+    """Call func(*args), record its duration under stage and return its result"""
+    start = time.perf_counter()
+    result = func(*args)
+    times.setdefault(stage, []).append(time.perf_counter() - start)
+    return result
+
+def benchmark_stages(resolution: str, repeats: int, warmup: int, analysis_scale: float, seed: int) -> Dict:
+    """Time each analysis stage on synthetic frames of one resolution"""
+    frames = generate_frames(resolution, repeats + warmup, seed=seed)
+    analyzer = CrowdDensityAnalyzer(analysis_scale=analysis_scale)
+    heatmap_gen = HeatmapGenerator(reuse_buffers=True)
+    width, height = RESOLUTIONS[resolution]
+    
+    encode_path = os.path.join(tempfile.mkdtemp(prefix='crowd_bench_'), 'encode.mp4')
+    writer = cv2.VideoWriter(encode_path, cv2.VideoWriter_fourcc(*'mp4v'), 30, (width, height))
+    
+    times = {}
+    try:
+        for i, frame in enumerate(frames):
+            if i == warmup:
+                times = {}
+            
+            gray = time_call(times, 'gray', cv2.cvtColor, frame, cv2.COLOR_BGR2GRAY)
+            scale = analyzer.get_analysis_scale(frame.shape)
+            if scale < 1.0:
+                gray = time_call(times, 'downscale', cv2.resize, gray, None, scale, scale, cv2.INTER_AREA)
+            
+            # Per-method kernels (fused=False path) and the fused kernel used by default
+            time_call(times, 'edge', analyzer._calculate_edge_density, gray, scale)
+            time_call(times, 'variance', analyzer._calculate_variance_density, gray, scale)
+            time_call(times, 'gradient', analyzer._calculate_gradient_density, gray, scale)
+            combined = time_call(times, 'fused_density', analyzer._calculate_combined_density, gray, scale)
+            
+            density_map = time_call(times, 'normalization', analyzer._normalize_density, combined, scale)
+            # distribution includes its own count estimate; count_estimate is also timed alone
+            time_call(times, 'distribution', analyzer._analyze_distribution, density_map, frame.shape)
+            time_call(times, 'count_estimate', analyzer._estimate_crowd_count, density_map, frame.shape)
+            time_call(times, 'analyze_frame', analyzer.analyze_frame, frame)
+            
+            time_call(times, 'colorize', heatmap_gen.colorize, density_map, (width, height))
+            _, blended = time_call(times, 'heatmap_blend', heatmap_gen.generate_heatmap, density_map, frame)
+            time_call(times, 'encode', writer.write, blended)
+    finally:
+        writer.release()
+        os.remove(encode_path)
+        os.rmdir(os.path.dirname(encode_path))
+    
+    stages = {stage: summarize_times(stage_times) for stage, stage_times in times.items()}
+    return {
+        'frame_size': [width, height],
+        'analysis_shape': list(density_map.shape[:2]),
+        'stages': stages,
+        'analyze_frames_per_second': 1000 / stages['analyze_frame']['median_ms'],
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def benchmark_video(resolution: str, frame_count: int, workers: int, analysis_scale: float, seed: int) -> Dict:
+    """Time VideoProcessor end to end (decode, analyze, colorize, encode) on a synthetic video"""
+    work_dir = tempfile.mkdtemp(prefix='crowd_bench_')
+    video_path = os.path.join(work_dir, f"synthetic_{resolution}.mp4")
+    write_video(video_path, resolution, frame_count, seed=seed)
+    
+    processor = VideoProcessor(CrowdDensityAnalyzer(analysis_scale=analysis_scale), workers=workers)
+    outputs = [os.path.join(work_dir, name) for name in ('blended.mp4', 'heatmap.mp4', 'frames.jsonl')]
+    try:
+        start = time.perf_counter()
+        stats = processor.process_video(video_path, outputs[0], outputs[1], streaming=True, records_path=outputs[2])
+        elapsed = time.perf_counter() - start
+    finally:
+        for path in outputs + [video_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(work_dir)
+    
+    return {
+        'frames': stats['total_frames'],
+        'workers': workers,
+        'seconds': elapsed,
+        'frames_per_second': stats['total_frames'] / elapsed,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def environment_info() -> Dict:
+    """Describe the machine, library versions and commit the benchmark ran on"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'opencv_threads': cv2.getNumThreads()
+    }
+
+def print_results(results: Dict):
+    """Print a per-resolution stage table"""
+    for resolution, result in results['resolutions'].items():
+        print(f"\n{resolution} ({result['frame_size'][0]}x{result['frame_size'][1]}, "
+              f"analyzed at {result['analysis_shape'][1]}x{result['analysis_shape'][0]})")
+        for stage, stats in result['stages'].items():
+            print(f"  {stage:<16} {stats['median_ms']:9.2f} ms  (p90 {stats['p90_ms']:.2f} ms)")
+        print(f"  analyze_frame throughput: {result['analyze_frames_per_second']:.1f} frames/s")
+        for video in result.get('video', []):
+            print(f"  video, {video['workers']} worker(s): {video['frames_per_second']:.1f} frames/s "
+                  f"({video['frames']} frames in {video['seconds']:.2f} s)")
+        print(f"  peak RSS: {result['peak_rss_mb']:.0f} MB")
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark the crowd analyzer on synthetic frames')
+    parser.add_argument('--resolutions', nargs='+', choices=list(RESOLUTIONS), default=list(RESOLUTIONS),
+                        help='Frame sizes to benchmark')
+    parser.add_argument('--repeats', type=int, default=10, help='Timed frames per resolution')
+    parser.add_argument('--warmup', type=int, default=2, help='Untimed frames per resolution')
+    parser.add_argument('--analysis-scale', type=float, default=1.0, help='Analyzer downscale factor')
+    parser.add_argument('--video-frames', type=int, default=60,
+                        help='Frames in the end-to-end video benchmark (0 = skip it)')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1],
+                        help='Worker counts for the end-to-end video benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='Synthetic scene seed')
+    parser.add_argument('-o', '--output', help='Results JSON path (default: benchmarks/results/<commit>_<time>.json)')
+    
+    args = parser.parse_args()
+    
+    # Keep per-video progress logging out of the timing output
+    logging.getLogger('crowd_analyzer').setLevel(logging.WARNING)
+    
+    results = {
+        'environment': environment_info(),
+        'config': {
+            'repeats': args.repeats,
+            'warmup': args.warmup,
+            'analysis_scale': args.analysis_scale,
+            'video_frames': args.video_frames,
+            'seed': args.seed
+        },
+        'resolutions': {}
+    }
+    
+    # Peak RSS is a process-wide high-water mark, so resolutions run smallest first
+    for resolution in sorted(args.resolutions, key=lambda name: RESOLUTIONS[name][0]):
+        print(f"Benchmarking {resolution}...")
+        result = benchmark_stages(resolution, args.repeats, args.warmup, args.analysis_scale, args.seed)
+        if args.video_frames:
+            result['video'] = [benchmark_video(resolution, args.video_frames, workers, args.analysis_scale, args.seed)
+                               for workers in args.workers]
+        result['peak_rss_mb'] = peak_rss_mb()
+        results['resolutions'][resolution] = result
+    
+    output = args.output
+    if not output:
+        results_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+        os.makedirs(results_dir, exist_ok=True)
+        commit = results['environment']['commit'] or 'unknown'
+        output = os.path.join(results_dir, f"{commit}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    
+    print_results(results)
+    print(f"\nResults saved to: {output}")
+
+if __name__ == "__main__":
+    main()
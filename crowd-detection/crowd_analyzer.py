@@ -14,83 +14,1156 @@ import argparse
 import os
 from pathlib import Path
 import logging
+import json
+import queue
+import threading
 from typing import Tuple, List, Dict
 import time
+import tracemalloc
+import copy
+from collections import deque
+from contextlib import nullcontext, contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor, wait, FIRST_COMPLETED
+import shutil
+import glob
+import sqlite3
+import tempfile
+import warnings
+from PIL import Image
+
+from result_cache import ResultCache
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet and Arrow IPC export of per-frame series are optional
+    pa = None
+
+try:
+    import av
+except ImportError:  # Threaded PyAV decoding with luma-only frames is optional
+    av = None
+
+# Image file extensions analyzed as stills (CLI and batch runs)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+
+# Analysis figure renderers: native OpenCV ('fast') or the 300-dpi matplotlib figure
+FIGURE_RENDERERS = ('fast', 'matplotlib')
+
+# Output files (<name>_<suffix>) kept in the result cache
+IMAGE_OUTPUTS = ('heatmap.png', 'blended.jpg', 'density.npy', 'analysis.json', 'report.txt', 'analysis.png',
+                 'heatmap_tiles.mbtiles', 'blended_tiles.mbtiles')
+VIDEO_OUTPUTS = ('blended_output.mp4', 'heatmap_video.mp4', 'frames.jsonl', 'frames.npz', 'frames.parquet',
+                 'frames.arrow', 'final_heatmap.png', 'final_density.npy', 'final_analysis.json', 'video_report.txt',
+                 'final_analysis.png', 'features.f16', 'features.json')
+
+# Zoomable tile pyramids of image outputs (<name>_<layer>_tiles.mbtiles) and their tile formats
+PYRAMID_LAYERS = {'heatmap': 'png', 'blended': 'jpg'}
+
+# Video decoder backends: OpenCV's VideoCapture, or PyAV (threaded, can hand over luma planes)
+VIDEO_DECODERS = ('opencv', 'pyav')
+
+# Rendered output videos (<name>_blended_output.mp4, <name>_heatmap_video.mp4)
+OUTPUT_VIDEOS = ('blended', 'heatmap')
+
+# Per-frame series file formats (<name>_frames.<format>); Parquet and Arrow IPC need pyarrow
+SERIES_FORMATS = ('npz', 'parquet', 'arrow')
+
+# Crowd levels in increasing order (stored as codes in per-frame series)
+CROWD_LEVELS = ('Very Low', 'Low', 'Medium', 'High', 'Very High', 'Extremely High')
+
+# Density feature maps combined by the analyzer's edge/variance/gradient weights, in stacking order
+FEATURE_NAMES = ('edge', 'variance', 'gradient')
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class CrowdDensityAnalyzer:
+def convert_numpy_types(obj):
+    """Convert numpy types to Python native types for JSON serialization (also usable as json.dump's default)"""
+    if isinstance(obj, np.integer):
+        return int(obj)
+    elif isinstance(obj, np.floating):
+        return float(obj)
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        return {key: convert_numpy_types(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [convert_numpy_types(item) for item in obj]
+    else:
+        return obj
+
+class KeyedLocks:
     def __init__(self):
+        """Initialize per-key locks (e.g. one per output file) that are dropped once no thread holds or waits on them"""
+        self._locks = {}  # Key -> [lock, threads holding or waiting]
+        self._guard = threading.Lock()
+    
+    @contextmanager
+    def hold(self, key):
+        """Hold the lock of key for the duration of a with block"""
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+    
+    def __len__(self) -> int:
+        with self._guard:
+            return len(self._locks)
+
+def parse_timestamp(value: str) -> float:
+    """Parse a video timestamp ('SS', 'MM:SS' or 'HH:MM:SS', with optional fractional seconds) in seconds"""
+    try:
+        parts = [float(part) for part in str(value).strip().split(':')]
+    except ValueError:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    if not 1 <= len(parts) <= 3 or any(part < 0 for part in parts) or any(part >= 60 for part in parts[1:]):
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
+
+def format_timestamp(seconds: float) -> str:
+    """Format seconds as HH:MM:SS.mmm"""
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds / 1000:06.3f}"
+
+def image_pixels(image_path: str) -> int:
+    """Get an image's pixel count from its header without decoding it (None if it cannot be read)"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+        try:
+            with Image.open(image_path) as image:
+                return image.width * image.height
+        except Image.DecompressionBombError:
+            # Larger than Pillow will open at all
+            return 2 * Image.MAX_IMAGE_PIXELS
+        except (OSError, ValueError):
+            return None
+
+def downsample_smooth(image: np.ndarray, max_side: int) -> np.ndarray:
+    """Area-downsample an already smooth map (e.g. a density map) so its longest side is at most max_side
+    
+    Only every other row and column of each output cell is read, which is
+    several times faster than INTER_AREA on the whole float map.
+    """
+    height, width = image.shape[:2]
+    scale = min(1.0, max_side / max(height, width))
+    if scale >= 1.0:
+        return image
+    step = max(1, int(1 / scale) // 2)
+    return cv2.resize(image[::step, ::step], (max(1, int(round(width * scale))), max(1, int(round(height * scale)))),
+                      interpolation=cv2.INTER_AREA)
+
+def aligned_empty(shape: Tuple[int, ...], dtype=np.float32, alignment: int = 64) -> np.ndarray:
+    """Get an uninitialized array whose data starts on an alignment-byte boundary
+    
+    Some OpenCV SIMD kernels (cv2.magnitude) round the unaligned head of a
+    buffer differently, so their results would depend on where numpy
+    happened to allocate it.
+    """
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape)) * dtype.itemsize
+    buffer = np.empty(size + alignment, dtype=np.uint8)
+    offset = -buffer.ctypes.data % alignment
+    return buffer[offset:offset + size].view(dtype).reshape(shape)
+
+class ZoneLayout:
+    def __init__(self, zones: List[Dict], name: str = None):
+        """Initialize a set of named analysis zones
+        
+        Each zone is {'name': ..., 'rect': [x0, y0, x1, y1]} or
+        {'name': ..., 'polygon': [[x, y], ...]} in fractions (0-1) of the frame
+        width and height, so one layout works at any analysis scale.
+        """
+        self.name = name
+        self.zones = []
+        seen = set()
+        for zone in zones:
+            zone_name = zone.get('name')
+            if not zone_name or zone_name in seen:
+                raise ValueError(f"Zone names must be unique and non-empty, got {zone_name!r}")
+            seen.add(zone_name)
+            
+            if 'rect' in zone:
+                x0, y0, x1, y1 = (float(v) for v in zone['rect'])
+                if not (0 <= x0 < x1 <= 1 and 0 <= y0 < y1 <= 1):
+                    raise ValueError(f"Zone {zone_name!r}: rect must be [x0, y0, x1, y1] within 0-1, got {zone['rect']}")
+                self.zones.append({'name': zone_name, 'rect': (x0, y0, x1, y1)})
+            elif 'polygon' in zone:
+                points = np.clip(np.asarray(zone['polygon'], dtype=np.float64), 0.0, 1.0)
+                if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+                    raise ValueError(f"Zone {zone_name!r}: polygon needs at least 3 [x, y] points")
+                self.zones.append({'name': zone_name, 'polygon': points})
+            else:
+                raise ValueError(f"Zone {zone_name!r} needs a 'rect' or a 'polygon'")
+        
+        # Pixel bounds and masks, compiled once per density map shape
+        self._compiled = {}
+    
+    @classmethod
+    def default_regions(cls) -> 'ZoneLayout':
+        """Get the built-in road regions (assuming road runs horizontally)"""
+        return cls([
+            {'name': 'left_side', 'rect': [0, 0, 1 / 3, 1]},
+            {'name': 'center', 'rect': [1 / 3, 0, 2 / 3, 1]},
+            {'name': 'right_side', 'rect': [2 / 3, 0, 1, 1]},
+            {'name': 'top_half', 'rect': [0, 0, 1, 1 / 2]},
+            {'name': 'bottom_half', 'rect': [0, 1 / 2, 1, 1]},
+            {'name': 'road_center', 'rect': [1 / 4, 1 / 4, 3 / 4, 3 / 4]}
+        ])
+    
+    @classmethod
+    def from_file(cls, path: str) -> 'ZoneLayout':
+        """Load a camera profile JSON file: {"camera": ..., "zones": [...]}"""
+        with open(path) as f:
+            profile = json.load(f)
+        return cls(profile.get('zones', []), name=profile.get('camera', Path(path).stem))
+    
+    def __len__(self) -> int:
+        return len(self.zones)
+    
+    @staticmethod
+    def rect_bounds(zone: Dict, shape: Tuple[int, int]) -> Tuple[int, int, int, int]:
+        """Get a rect zone's pixel bounds (y0, y1, x0, x1) in a map of the given shape"""
+        height, width = shape
+        
+        def to_pixels(value, size):
+            # Floor with a little slack so 1/3 of 300 is 100, as width//3 was
+            return min(size, max(0, int(value * size + 1e-9)))
+        
+        x0, y0, x1, y1 = zone['rect']
+        px0, py0 = to_pixels(x0, width), to_pixels(y0, height)
+        px0, py0 = min(px0, width - 1), min(py0, height - 1)
+        px1 = max(to_pixels(x1, width), px0 + 1)
+        py1 = max(to_pixels(y1, height), py0 + 1)
+        return py0, py1, px0, px1
+    
+    @staticmethod
+    def polygon_points(zone: Dict, shape: Tuple[int, int]) -> np.ndarray:
+        """Get a polygon zone's vertices as pixel edges of a map of the given shape, snapped as in rect_bounds"""
+        height, width = shape
+        return np.floor(zone['polygon'] * [width, height] + 1e-9).astype(np.int32)
+    
+    @staticmethod
+    def polygon_bounds(points: np.ndarray, shape: Tuple[int, int]) -> Tuple[int, int, int, int]:
+        """Get the pixel bounds (y0, y1, x0, x1) of polygon_points in a map of the given shape"""
+        height, width = shape
+        x0, y0 = np.minimum(points.min(axis=0), [width - 1, height - 1])
+        x1, y1 = points.max(axis=0)
+        return int(y0), int(max(y1, y0 + 1)), int(x0), int(max(x1, x0 + 1))
+    
+    @staticmethod
+    def _polygon_spans(points: np.ndarray, top: int, height: int, left: int, width: int) -> Tuple[np.ndarray, ...]:
+        """Get the row, first and end column of each run of window pixels whose centers are inside the polygon
+        
+        Each row's edge crossings are found at the pixel centers (even-odd
+        rule) and pixel j is in the span [x_in, x_out) of a pair of them when
+        x_in <= left + j + 0.5 < x_out. Rows and columns are window-relative.
+        """
+        start = points.astype(np.float64)
+        end = np.roll(start, -1, axis=0)
+        centers = top + np.arange(height, dtype=np.float64)[:, None] + 0.5
+        
+        # Crossing x of every edge at every row center (inf where the edge does not cross the row)
+        crosses = (start[:, 1] <= centers) != (end[:, 1] <= centers)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x = start[:, 0] + (centers - start[:, 1]) * (end[:, 0] - start[:, 0]) / (end[:, 1] - start[:, 1])
+        x = np.sort(np.where(crosses, x, np.inf), axis=1)
+        
+        pairs = x.shape[1] // 2
+        rows = np.repeat(np.arange(height), pairs)
+        x_in, x_out = x[:, 0:2 * pairs:2].ravel(), x[:, 1:2 * pairs:2].ravel()
+        first = np.clip(np.ceil(x_in - 0.5 - left), 0, width)
+        last = np.clip(np.ceil(x_out - 0.5 - left), 0, width)
+        keep = np.isfinite(x_out) & (last > first)
+        return rows[keep], first[keep].astype(np.intp), last[keep].astype(np.intp)
+    
+    @classmethod
+    def polygon_is_thin(cls, points: np.ndarray, shape: Tuple[int, int]) -> bool:
+        """Check whether polygon_points contain no pixel center of a map of the given shape"""
+        y0, y1, x0, x1 = cls.polygon_bounds(points, shape)
+        return not len(cls._polygon_spans(points, y0, y1 - y0, x0, x1 - x0)[0])
+    
+    @classmethod
+    def polygon_mask(cls, points: np.ndarray, shape: Tuple[int, int], top: int = 0, left: int = 0,
+                     thin: bool = None) -> np.ndarray:
+        """Get a uint8 mask (255 inside) of a map window of the given shape at (top, left) for polygon_points
+        
+        A pixel is inside when its center is, so a polygon covers the same
+        pixels as a rect zone with the same corners, and a window gets the
+        same pixels as the full map (fillPoly does neither). A thin polygon
+        (see polygon_is_thin) keeps the pixels along its outline instead, as
+        rects keep at least one pixel; thin=None decides from this window,
+        which must then hold the whole polygon.
+        """
+        height, width = shape
+        rows, first, last = cls._polygon_spans(points, top, height, left, width)
+        if thin is None:
+            thin = not len(rows)
+        
+        mask = np.zeros(shape, dtype=np.uint8)
+        if thin:
+            # Step along each edge in map pixels, so every window marks the same ones
+            outline = np.minimum(points, np.maximum(points.max(axis=0) - 1, points.min(axis=0)))
+            pixels = np.concatenate([np.round(np.linspace(a, b, int(np.abs(b - a).max()) + 1)).astype(np.intp)
+                                     for a, b in zip(outline, np.roll(outline, -1, axis=0))]) - [left, top]
+            inside = (pixels >= 0).all(axis=1) & (pixels[:, 0] < width) & (pixels[:, 1] < height)
+            mask[pixels[inside, 1], pixels[inside, 0]] = 255
+        elif len(rows):
+            # Mark span starts and ends, then a running sum along each row fills them
+            edges = np.zeros((height, width + 1), dtype=np.int32)
+            np.add.at(edges, (rows, first), 1)
+            np.add.at(edges, (rows, last), -1)
+            mask[np.cumsum(edges[:, :width], axis=1) > 0] = 255
+        return mask
+    
+    def masks(self, shape: Tuple[int, int]) -> List[Tuple[str, np.ndarray]]:
+        """Get each zone's name and full-size uint8 mask (255 inside) for a small map of the given shape"""
+        key = ('masks', shape)
+        if key not in self._compiled:
+            masks = []
+            for zone in self.zones:
+                mask = np.zeros(shape, dtype=np.uint8)
+                if 'rect' in zone:
+                    y0, y1, x0, x1 = self.rect_bounds(zone, shape)
+                    mask[y0:y1, x0:x1] = 255
+                else:
+                    mask = self.polygon_mask(self.polygon_points(zone, shape), shape)
+                masks.append((zone['name'], mask))
+            self._compiled[key] = masks
+        return self._compiled[key]
+    
+    def _compile(self, shape: Tuple[int, int]) -> Dict:
+        """Convert zones to pixel bounds and polygon masks for a map shape"""
+        compiled = self._compiled.get(shape)
+        if compiled is not None:
+            return compiled
+        
+        rect_names, rect_bounds, polygons = [], [], []
+        for zone in self.zones:
+            if 'rect' in zone:
+                rect_names.append(zone['name'])
+                rect_bounds.append(self.rect_bounds(zone, shape))
+            else:
+                points = self.polygon_points(zone, shape)
+                y0, y1, x0, x1 = self.polygon_bounds(points, shape)
+                mask = self.polygon_mask(points, (y1 - y0, x1 - x0), y0, x0)
+                polygons.append({'name': zone['name'], 'bounds': (y0, y1, x0, x1), 'mask': mask,
+                                 'area': cv2.countNonZero(mask)})
+        
+        bounds = np.array(rect_bounds, dtype=np.intp).reshape(-1, 4)
+        
+        # Rectangle maxima come from per-strip column maxima: rows are split at
+        # every rectangle edge, so each rectangle spans a run of whole strips
+        cuts = np.unique(bounds[:, :2]) if len(bounds) else np.array([], dtype=np.intp)
+        strip_index = {row: i for i, row in enumerate(cuts)}
+        
+        compiled = {
+            'rect_names': rect_names,
+            'rect_bounds': bounds,
+            'rect_areas': (bounds[:, 1] - bounds[:, 0]) * (bounds[:, 3] - bounds[:, 2]),
+            'strips': list(zip(cuts[:-1], cuts[1:])),
+            'rect_strips': [(strip_index[y0], strip_index[y1]) for y0, y1, _, _ in bounds],
+            'polygons': polygons
+        }
+        self._compiled[shape] = compiled
+        return compiled
+    
+    def measure(self, density_map: np.ndarray, integral: np.ndarray, pixel_scale: float, classify,
+                count_map: np.ndarray = None, estimated_count: int = None) -> Dict:
+        """Get mean/max/total density and crowd level for every zone
+        
+        integral is the summed-area table of density_map (cv2.integral), so
+        each rectangle sum is four lookups. With count_map (the high-density
+        pixel mask, or people per pixel with a PerspectiveMap), the estimated
+        count is split across zones by their share of its sum (zones may
+        overlap, so the zone counts need not add up).
+        """
+        compiled = self._compile(density_map.shape[:2])
+        zone_stats = {}
+        
+        # Rectangles: sums from the summed-area table, maxima from strip column maxima
+        bounds = compiled['rect_bounds']
+        y0, y1, x0, x1 = bounds.T
+        sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        means = sums / compiled['rect_areas']
+        strip_max = np.array([density_map[top:bottom].max(axis=0) for top, bottom in compiled['strips']])
+        if count_map is not None:
+            count_integral = cv2.integral(count_map, sdepth=cv2.CV_64F)
+            shares = count_integral[y1, x1] - count_integral[y0, x1] - count_integral[y1, x0] + count_integral[y0, x0]
+            total_share = count_integral[-1, -1] or 1.0
+        
+        for i, name in enumerate(compiled['rect_names']):
+            first_strip, last_strip = compiled['rect_strips'][i]
+            stats = {
+                'mean_density': float(means[i]),
+                'max_density': float(strip_max[first_strip:last_strip, x0[i]:x1[i]].max()),
+                'total_density': float(sums[i]) * pixel_scale,
+                'crowd_level': classify(means[i])
+            }
+            if count_map is not None:
+                stats['estimated_count'] = int(round(estimated_count * shares[i] / total_share))
+            zone_stats[name] = stats
+        
+        # Polygons: masked statistics inside the bounding box
+        for polygon in compiled['polygons']:
+            top, bottom, left, right = polygon['bounds']
+            region = density_map[top:bottom, left:right]
+            mask = polygon['mask']
+            mean = cv2.mean(region, mask=mask)[0]
+            stats = {
+                'mean_density': mean,
+                'max_density': cv2.minMaxLoc(region, mask=mask)[1],
+                'total_density': mean * polygon['area'] * pixel_scale,
+                'crowd_level': classify(mean)
+            }
+            if count_map is not None:
+                zone_share = cv2.mean(count_map[top:bottom, left:right], mask=mask)[0] * polygon['area']
+                stats['estimated_count'] = int(round(estimated_count * zone_share / total_share))
+            zone_stats[polygon['name']] = stats
+        
+        # Keep the configured zone order
+        return {zone['name']: zone_stats[zone['name']] for zone in self.zones}
+
+class TiledZoneStatistics:
+    def __init__(self, layout: ZoneLayout, shape: Tuple[int, int]):
+        """Initialize ZoneLayout.measure statistics accumulated tile by tile over a map of the given shape
+        
+        For maps too large to hold in memory: polygon masks are drawn per
+        tile, so memory stays proportional to the tile size.
+        """
+        self.layout = layout
+        self.shape = shape
+        self._geometry = []  # (bounds (y0, y1, x0, x1), (polygon points, thin) or None) per zone
+        for zone in layout.zones:
+            if 'rect' in zone:
+                self._geometry.append((layout.rect_bounds(zone, shape), None))
+            else:
+                points = layout.polygon_points(zone, shape)
+                self._geometry.append((layout.polygon_bounds(points, shape),
+                                       (points, layout.polygon_is_thin(points, shape))))
+        
+        count = len(layout.zones)
+        self.sums = np.zeros(count)
+        self.maxima = np.full(count, -np.inf)
+        self.areas = np.zeros(count, dtype=np.int64)
+        self.count_shares = np.zeros(count)
+    
+    def add(self, tile: np.ndarray, top: int, left: int, high_threshold: float, row_weights: np.ndarray = None):
+        """Add a tile whose top-left pixel is at (top, left)
+        
+        Zones' shares of the count are their pixels above high_threshold, or
+        with row_weights (PerspectiveMap.row_weights of the whole map) the
+        people in them.
+        """
+        for i, ((y0, y1, x0, x1), polygon) in enumerate(self._geometry):
+            y0, y1 = max(y0, top), min(y1, top + tile.shape[0])
+            x0, x1 = max(x0, left), min(x1, left + tile.shape[1])
+            if y0 >= y1 or x0 >= x1:
+                continue
+            region = tile[y0 - top:y1 - top, x0 - left:x1 - left]
+            high = (region > high_threshold).view(np.uint8)
+            if row_weights is not None:
+                counted = cv2.threshold(region, high_threshold, 0, cv2.THRESH_TOZERO)[1]
+            if polygon is None:
+                self.sums[i] += cv2.sumElems(region)[0]
+                self.maxima[i] = max(self.maxima[i], float(region.max()))
+                self.areas[i] += region.size
+                if row_weights is None:
+                    self.count_shares[i] += cv2.countNonZero(high)
+                else:
+                    self.count_shares[i] += self._people(counted, row_weights[y0:y1])
+            else:
+                points, thin = polygon
+                mask = ZoneLayout.polygon_mask(points, region.shape, y0, x0, thin)
+                area = cv2.countNonZero(mask)
+                if not area:
+                    continue
+                self.sums[i] += cv2.mean(region, mask=mask)[0] * area
+                self.maxima[i] = max(self.maxima[i], cv2.minMaxLoc(region, mask=mask)[1])
+                self.areas[i] += area
+                if row_weights is None:
+                    self.count_shares[i] += cv2.countNonZero(cv2.bitwise_and(high, mask))
+                else:
+                    self.count_shares[i] += self._people(np.where(mask > 0, counted, 0), row_weights[y0:y1])
+    
+    @staticmethod
+    def _people(counted: np.ndarray, row_weights: np.ndarray) -> float:
+        return float(cv2.reduce(counted, 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F).ravel() @ row_weights)
+    
+    def results(self, pixel_scale: float, classify, estimated_count: int = None, total_share: float = None) -> Dict:
+        """Get the statistics in the form of ZoneLayout.measure (with the count split when estimated_count is given)"""
+        zone_stats = {}
+        for i, zone in enumerate(self.layout.zones):
+            mean = self.sums[i] / max(1, self.areas[i])
+            stats = {
+                'mean_density': float(mean),
+                'max_density': float(self.maxima[i]) if self.areas[i] else 0.0,
+                'total_density': float(self.sums[i]) * pixel_scale,
+                'crowd_level': classify(mean)
+            }
+            if estimated_count is not None:
+                stats['estimated_count'] = int(round(estimated_count * self.count_shares[i] / (total_share or 1.0)))
+            zone_stats[zone['name']] = stats
+        return zone_stats
+
+class PerspectiveMap:
+    def __init__(self, head_size: Tuple[float, float], person_heads: float = 3.0):
+        """Initialize a camera's perspective from its head size at the top and bottom of the frame
+        
+        Head sizes are fractions of the frame height and vary linearly down
+        the frame, as on flat ground seen at an angle. A packed crowd holds one
+        person per (person_heads x head size)^2 pixels, so density near the
+        horizon of an oblique shot stands for more people than in the
+        foreground.
+        """
+        top, bottom = (float(size) for size in head_size)
+        if top <= 0 or bottom <= 0:
+            raise ValueError(f"Head sizes must be positive at the top and bottom of the frame, got {top:.4g}, {bottom:.4g} "
+                             f"(is the horizon in view? annotate heads across the crowd)")
+        if person_heads <= 0:
+            raise ValueError(f"person_heads must be positive, got {person_heads}")
+        self.head_size = (top, bottom)
+        self.person_heads = float(person_heads)
+        
+        # People per unit density in each map row, computed once per map and frame shape
+        self._row_weights = {}
+    
+    @classmethod
+    def calibrate(cls, heads: List, image_size: Tuple[int, int], person_heads: float = 3.0) -> 'PerspectiveMap':
+        """Fit head size to image row from annotated heads [[x, y, size], ...] in pixels of an image_size (width, height) image"""
+        heads = np.asarray(heads, dtype=np.float64)
+        if heads.ndim != 2 or heads.shape[1] != 3 or len(heads) < 2:
+            raise ValueError("Perspective calibration needs at least 2 annotated heads [x, y, size]")
+        height = float(image_size[1])
+        rows, sizes = heads[:, 1] / height, heads[:, 2] / height
+        if np.ptp(rows) < 0.1:
+            raise ValueError("Annotated heads must span at least a tenth of the image height")
+        
+        # Least squares line through the annotations, evaluated at the top and bottom rows
+        slope, intercept = np.polyfit(rows, sizes, 1)
+        return cls((intercept, intercept + slope), person_heads)
+    
+    @classmethod
+    def from_profile(cls, profile: Dict) -> 'PerspectiveMap':
+        """Get the perspective of a camera profile (None without one)
+        
+        Uses the fitted "head_size" when present, else calibrates from the
+        annotated "heads" and "image_size".
+        """
+        perspective = profile.get('perspective')
+        if not perspective:
+            return None
+        person_heads = perspective.get('person_heads', 3.0)
+        if 'head_size' in perspective:
+            return cls(perspective['head_size'], person_heads)
+        return cls.calibrate(perspective.get('heads', []), perspective.get('image_size', (1, 1)), person_heads)
+    
+    @classmethod
+    def from_file(cls, path: str) -> 'PerspectiveMap':
+        """Load the perspective of a camera profile JSON file (None without one)"""
+        with open(path) as f:
+            return cls.from_profile(json.load(f))
+    
+    def to_profile(self) -> Dict:
+        """Get the fitted perspective as saved in camera profiles"""
+        return {'head_size': list(self.head_size), 'person_heads': self.person_heads}
+    
+    def row_weights(self, shape: Tuple[int, int], frame_shape: Tuple[int, ...]) -> np.ndarray:
+        """Get the people per unit density in each row of a map of shape computed from a frame of frame_shape"""
+        key = (tuple(shape[:2]), tuple(frame_shape[:2]))
+        weights = self._row_weights.get(key)
+        if weights is None:
+            height, width = shape[:2]
+            pixel_scale = (frame_shape[0] * frame_shape[1]) / (height * width)
+            top, bottom = self.head_size
+            rows = (np.arange(height) + 0.5) / height
+            head_pixels = (top + (bottom - top) * rows) * frame_shape[0]
+            weights = self._row_weights[key] = pixel_scale / (self.person_heads * head_pixels) ** 2
+        return weights
+    
+    def count(self, density_map: np.ndarray, threshold: float, frame_shape: Tuple[int, ...]) -> float:
+        """Get the people in a density map: the weighted sum of its density above threshold"""
+        counted = cv2.threshold(density_map, threshold, 0, cv2.THRESH_TOZERO)[1]
+        row_sums = cv2.reduce(counted, 1, cv2.REDUCE_SUM, dtype=cv2.CV_64F).ravel()
+        return float(row_sums @ self.row_weights(density_map.shape, frame_shape))
+    
+    def people_map(self, density_map: np.ndarray, threshold: float, frame_shape: Tuple[int, ...]) -> np.ndarray:
+        """Get the people in each pixel of a density map (its density above threshold, weighted by row)"""
+        counted = cv2.threshold(density_map, threshold, 0, cv2.THRESH_TOZERO)[1]
+        weights = self.row_weights(density_map.shape, frame_shape).astype(np.float32)
+        return np.multiply(counted, weights[:, np.newaxis], out=counted)
+
+class RunningNormalization:
+    def __init__(self, decay: float = 0.05):
+        """Initialize an exponentially-weighted percentile range for one video
+        
+        Each analyzed frame moves the normalization range decay of the way
+        toward its own 5th-95th percentile range, so densities stay comparable
+        between frames and heatmaps do not flicker.
+        """
+        if not 0 < decay <= 1:
+            raise ValueError(f"decay must be in (0, 1], got {decay}")
+        self.decay = decay
+        self.low = None
+        self.high = None
+    
+    def update(self, low: float, high: float) -> Tuple[float, float]:
+        """Blend a frame's percentile range into the running range and return it"""
+        if self.low is None:
+            self.low, self.high = low, high
+        else:
+            self.low += self.decay * (low - self.low)
+            self.high += self.decay * (high - self.high)
+        return self.low, self.high
+
+class HotspotTracker:
+    def __init__(self, max_distance: float = 0.1, max_missed: float = 1.0, smoothing: float = 0.5):
+        """Initialize frame-to-frame tracking of the hotspots of one video or stream
+        
+        Each frame's hotspots are matched greedily, closest pair first, to the
+        tracks' predicted centroids within max_distance (a fraction of the
+        frame diagonal); unmatched hotspots start new tracks and tracks not
+        seen for max_missed seconds end. Growth rate (relative area change per
+        second) and drift velocity (frame pixels per second) are exponentially
+        smoothed by smoothing.
+        """
+        if not 0 < smoothing <= 1:
+            raise ValueError(f"smoothing must be in (0, 1], got {smoothing}")
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.smoothing = smoothing
+        self.tracks = []  # Active tracks
+        self.finished = []  # Summaries of ended tracks seen in more than one frame
+        self._next_id = 1
+    
+    def update(self, hotspots: List[Dict], timestamp: float, frame_shape: Tuple[int, ...]) -> List[Dict]:
+        """Associate one analyzed frame's hotspots (frames in order), adding track fields to them in place
+        
+        Each hotspot gets 'id', 'age' (seconds since the track started),
+        'growth_rate' and 'velocity' ([x, y]); new tracks start at zero.
+        """
+        # End tracks not seen recently
+        active = []
+        for track in self.tracks:
+            if timestamp - track['last_seen'] > self.max_missed:
+                self._finish(track)
+            else:
+                active.append(track)
+        self.tracks = active
+        
+        # Candidate pairs by distance to each track's predicted centroid
+        gate = self.max_distance * np.hypot(frame_shape[0], frame_shape[1])
+        pairs = []
+        for t, track in enumerate(self.tracks):
+            predicted = track['centroid'] + track['velocity'] * (timestamp - track['last_seen'])
+            for h, hotspot in enumerate(hotspots):
+                distance = float(np.hypot(*(np.asarray(hotspot['centroid']) - predicted)))
+                if distance <= gate:
+                    pairs.append((distance, t, h))
+        pairs.sort()
+        
+        matched_tracks, matched_hotspots = set(), {}
+        for _, t, h in pairs:
+            if t not in matched_tracks and h not in matched_hotspots:
+                matched_tracks.add(t)
+                matched_hotspots[h] = self.tracks[t]
+        
+        for h, hotspot in enumerate(hotspots):
+            centroid = np.asarray(hotspot['centroid'], dtype=np.float64)
+            track = matched_hotspots.get(h)
+            if track is None:
+                track = {
+                    'id': self._next_id, 'first_seen': timestamp, 'frames': 0, 'centroid': centroid,
+                    'start_centroid': centroid, 'area': hotspot['area'], 'start_area': hotspot['area'],
+                    'max_area': 0, 'max_peak': 0.0, 'velocity': np.zeros(2), 'growth_rate': 0.0
+                }
+                self._next_id += 1
+                self.tracks.append(track)
+            else:
+                elapsed = timestamp - track['last_seen']
+                if elapsed > 0:
+                    velocity = (centroid - track['centroid']) / elapsed
+                    growth = np.log(max(hotspot['area'], 1) / max(track['area'], 1)) / elapsed
+                    track['velocity'] = track['velocity'] + self.smoothing * (velocity - track['velocity'])
+                    track['growth_rate'] += self.smoothing * (growth - track['growth_rate'])
+                track['centroid'] = centroid
+                track['area'] = hotspot['area']
+            
+            track['last_seen'] = timestamp
+            track['frames'] += 1
+            track['max_area'] = max(track['max_area'], hotspot['area'])
+            track['max_peak'] = max(track['max_peak'], hotspot['peak_density'])
+            hotspot.update({
+                'id': track['id'],
+                'age': timestamp - track['first_seen'],
+                'growth_rate': float(track['growth_rate']),
+                'velocity': [float(v) for v in track['velocity']]
+            })
+        return hotspots
+    
+    def summary(self, limit: int = 20) -> List[Dict]:
+        """Get the largest tracks seen in more than one frame (ended and active), largest first"""
+        tracks = self.finished + [self._describe(track) for track in self.tracks if track['frames'] > 1]
+        return sorted(tracks, key=lambda track: track['max_area'], reverse=True)[:limit]
+    
+    def _finish(self, track: Dict):
+        if track['frames'] > 1:
+            self.finished.append(self._describe(track))
+    
+    @staticmethod
+    def _describe(track: Dict) -> Dict:
+        """Summarize a track: lifetime, size and overall growth and drift"""
+        duration = track['last_seen'] - track['first_seen']
+        drift = track['centroid'] - track['start_centroid']
+        return {
+            'id': track['id'],
+            'first_seen': track['first_seen'],
+            'last_seen': track['last_seen'],
+            'frames': track['frames'],
+            'start_area': int(track['start_area']),
+            'end_area': int(track['area']),
+            'max_area': int(track['max_area']),
+            'max_peak_density': float(track['max_peak']),
+            'growth_rate': float(np.log(max(track['area'], 1) / max(track['start_area'], 1)) / duration) if duration > 0 else 0.0,
+            'drift': [float(v) for v in drift],
+            'drift_speed': float(np.hypot(*drift) / duration) if duration > 0 else 0.0
+        }
+
+class FlowEstimator:
+    def __init__(self, max_side: int = 160, budget: float = None, grid: Tuple[int, int] = (8, 6), min_side: int = 48):
+        """Initialize dense crowd flow between consecutive analyzed frames of one video or stream
+        
+        Farneback optical flow runs on each frame's analysis grayscale
+        downscaled to at most max_side pixels (a two-level pyramid). With a
+        budget (a fraction, for live sources), the resolution adapts so flow
+        takes at most that share of the wall-clock time between frames: it
+        shrinks when flow runs over and grows back toward max_side when well
+        inside. Without one, it stays at max_side, so results do not depend on
+        the machine or worker count. Vectors are in frame pixels per
+        second, weighted by density (so empty ground does not dilute crowd
+        motion) and averaged over the frame, each region and zone and a
+        grid of (columns, rows) cells.
+        """
+        if budget is not None and not 0 < budget < 1:
+            raise ValueError(f"budget must be in (0, 1), got {budget}")
+        self.max_side = max_side
+        self.min_side = min(min_side, max_side)
+        self.budget = budget
+        self.grid = grid
+        self.side = max_side
+        self.frames = 0
+        self.total_time = 0.0
+        self._pending = {}  # Frame number -> flow-sized grayscale, added by analysis workers
+        self._lock = threading.Lock()
+        self._previous = None  # (flow-sized grayscale, timestamp) of the last frame
+        self._last_update = None
+    
+    def add_frame(self, frame_number: int, gray: np.ndarray):
+        """Keep an analyzed frame's analysis grayscale, downscaled for flow (thread-safe, any order)"""
+        # By a whole factor (dropping the remainder rows and columns), OpenCV's fast area-averaging path
+        height, width = gray.shape[:2]
+        factor = int(np.ceil(max(height, width) / self.side))
+        if factor > 1:
+            height, width = max(1, height // factor), max(1, width // factor)
+            gray = cv2.resize(gray[:height * factor, :width * factor], (width, height), interpolation=cv2.INTER_AREA)
+        with self._lock:
+            self._pending[frame_number] = gray
+    
+    def update(self, frame_number: int, density_map: np.ndarray, timestamp: float, frame_shape: Tuple[int, ...],
+               regions: ZoneLayout, zones: ZoneLayout = None) -> Dict:
+        """Estimate flow from the previous analyzed frame to this one (frames in order)
+        
+        Returns None for the first frame and frames without add_frame.
+        """
+        with self._lock:
+            current = self._pending.pop(frame_number, None)
+        if current is None:
+            return None
+        previous, self._previous = self._previous, (current, timestamp)
+        now = time.perf_counter()
+        interval, self._last_update = (now - self._last_update if self._last_update else None), now
+        if previous is None or timestamp <= previous[1]:
+            return None
+        
+        start = time.perf_counter()
+        previous_gray, elapsed_time = previous[0], timestamp - previous[1]
+        height, width = current.shape
+        if previous_gray.shape != current.shape:
+            previous_gray = cv2.resize(previous_gray, (width, height), interpolation=cv2.INTER_AREA)
+        flow = cv2.calcOpticalFlowFarneback(previous_gray, current, None, 0.5, 2, 9, 2, 5, 1.1, 0)
+        
+        # Components in frame pixels per second, and speed
+        flow_x, flow_y = aligned_empty((height, width)), aligned_empty((height, width))
+        cv2.split(flow, [flow_x, flow_y])
+        flow_x *= frame_shape[1] / width / elapsed_time
+        flow_y *= frame_shape[0] / height / elapsed_time
+        speed = cv2.magnitude(flow_x, flow_y)
+        
+        # Density-weighted sums as one 4-channel image: weight, x, y, speed
+        weights = cv2.resize(downsample_smooth(density_map, max(width, height)), (width, height),
+                             interpolation=cv2.INTER_LINEAR)
+        weighted = cv2.merge([weights, flow_x * weights, flow_y * weights, speed * weights])
+        
+        report = self._summarize(cv2.mean(weighted))
+        columns, rows = self.grid
+        cells = cv2.resize(weighted, (columns, rows), interpolation=cv2.INTER_AREA)
+        report['grid'] = {
+            'columns': columns,
+            'rows': rows,
+            'velocity': [[self._summarize(cell)['velocity'] for cell in row] for row in cells]
+        }
+        report['regions'] = {name: self._summarize(cv2.mean(weighted, mask)) for name, mask in regions.masks((height, width))}
+        if zones:
+            report['zones'] = {name: self._summarize(cv2.mean(weighted, mask)) for name, mask in zones.masks((height, width))}
+        report['interval'] = elapsed_time
+        report['resolution'] = [width, height]
+        
+        # Keep flow within its share of the time per frame
+        flow_time = time.perf_counter() - start
+        self.frames += 1
+        self.total_time += flow_time
+        if self.budget and interval:
+            limit = self.budget * interval
+            if flow_time > limit:
+                self.side = max(self.min_side, int(self.side * max(0.5, (limit / flow_time) ** 0.5)))
+            elif flow_time < 0.5 * limit:
+                self.side = min(self.max_side, int(self.side * 1.1) + 1)
+        return report
+    
+    @staticmethod
+    def _summarize(sums) -> Dict:
+        """Get the mean velocity, speed and coherence from density-weighted sums (weight, x, y, speed)
+        
+        Coherence is the mean velocity's length over the mean speed: 1 when
+        everyone moves the same way, near 0 for counter-flows or milling.
+        """
+        weight, x, y, speed = (float(value) for value in sums[:4])
+        if weight <= 1e-9:
+            return {'velocity': [0.0, 0.0], 'speed': 0.0, 'coherence': None}
+        velocity = [round(x / weight, 2), round(y / weight, 2)]
+        speed /= weight
+        return {
+            'velocity': velocity,
+            'speed': round(speed, 2),
+            'coherence': round(np.hypot(x, y) / weight / speed, 3) if speed > 1e-6 else None
+        }
+    
+    def summary(self) -> Dict:
+        """Get the flow frames, mean flow time and final resolution"""
+        return {
+            'frames': self.frames,
+            'mean_time_ms': self.total_time / self.frames * 1000 if self.frames else None,
+            'budget': self.budget,
+            'max_side': self.side
+        }
+
+class CrowdDensityAnalyzer:
+    def __init__(self, fused: bool = True, analysis_scale: float = 1.0, analysis_max_side: int = None,
+                 zones: ZoneLayout = None, profiler: 'StageProfiler' = None, perspective: PerspectiveMap = None):
         """Initialize the crowd density analyzer"""
         # Parameters for crowd detection
         self.blur_kernel_size = 15
         self.edge_threshold_low = 30
         self.edge_threshold_high = 100
+        self.variance_window = 21
+        self.density_blur_size = 25
+        
+        # Weights used to combine the three density methods
+        self.edge_weight = 0.4
+        self.variance_weight = 0.35
+        self.gradient_weight = 0.25
+        
+        # Mean density at which each crowd level above 'Very Low' starts (see CROWD_LEVELS)
+        self.crowd_level_thresholds = (0.1, 0.25, 0.4, 0.6, 0.8)
+        
+        # Pixels above this fraction of the frame's max density count toward the crowd estimate
+        self.count_threshold = 0.3
+        
+        # Hotspots: connected areas above this density, labeled on the map downsampled to at most
+        # hotspot_max_side pixels; areas under hotspot_min_area of the frame are dropped
+        self.hotspot_threshold = 0.6
+        self.hotspot_max_side = 128
+        self.hotspot_min_area = 0.001
+        self.max_hotspots = 16
+        
+        # Per-camera perspective: counts become a weighted sum of density instead of the pixels-per-person table
+        self.perspective = perspective
+        
+        # Use the single-pass float32 kernel instead of the per-method maps.
+        # Matches fused=False to within 1e-5 on the normalized map (see test_crowd_analyzer.py).
+        self.fused = fused
+        
+        # Reduced-resolution analysis: the frame is downscaled by analysis_scale
+        # (and further, if needed, so its longest side fits analysis_max_side).
+        # Kernel sizes shrink with the frame so the physical support stays the same.
+        if not 0 < analysis_scale <= 1.0:
+            raise ValueError(f"analysis_scale must be in (0, 1], got {analysis_scale}")
+        self.analysis_scale = analysis_scale
+        self.analysis_max_side = analysis_max_side
+        
+        # Percentiles for normalization are read from a histogram with this many bins
+        self.percentile_bins = 2048
+        
+        # Built-in road regions plus optional per-camera zones (reported under 'zones')
+        self.regions = ZoneLayout.default_regions()
+        self.zones = zones if zones else None
+        
+        # Per-stage profiling (disabled by default; analyze_frame can also take one per call)
+        self.profiler = profiler or StageProfiler(enabled=False)
         
         # Create custom colormap for heatmaps
         colors = ['darkblue', 'blue', 'cyan', 'yellow', 'orange', 'red', 'darkred']
         self.colormap = LinearSegmentedColormap.from_list('crowd_density', colors, N=256)
         
-    def analyze_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, Dict]:
-        """Analyze a single frame for crowd density"""
-        # Convert to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    def analyze_frame(self, frame: np.ndarray, normalizer: RunningNormalization = None,
+                      profiler: 'StageProfiler' = None, gray: np.ndarray = None) -> Tuple[np.ndarray, Dict]:
+        """Analyze a single frame for crowd density
         
-        # Method 1: Edge density analysis
-        edge_density = self._calculate_edge_density(gray)
+        With a normalizer, frames of one video share a running normalization
+        range; frames must then be analyzed in order. Stages are recorded in
+        profiler (default: self.profiler). frame is BGR or, as from a luma
+        PyAVCapture, already a single-channel grayscale plane. gray is the
+        frame's prepare_gray result, when the caller already has it.
+        """
+        profiler = profiler or self.profiler
         
-        # Method 2: Local variance analysis
-        variance_density = self._calculate_variance_density(gray)
+        # Grayscale at the analysis resolution
+        if gray is None:
+            gray = self.prepare_gray(frame, profiler)
+        scale = self.get_analysis_scale(frame.shape)
         
-        # Method 3: Gradient magnitude analysis
-        gradient_density = self._calculate_gradient_density(gray)
+        if self.fused:
+            # Edge, variance and gradient density in one pass
+            with profiler.stage('fused_density'):
+                combined_density = self._calculate_combined_density(gray, scale)
+        else:
+            # Method 1: Edge density analysis
+            with profiler.stage('edge'):
+                edge_density = self._calculate_edge_density(gray, scale)
         
-        # Combine methods
-        combined_density = (
-            0.4 * edge_density +
-            0.35 * variance_density +
-            0.25 * gradient_density
-        )
+            # Method 2: Local variance analysis
+            with profiler.stage('variance'):
+                variance_density = self._calculate_variance_density(gray, scale)
+            
+            # Method 3: Gradient magnitude analysis
+            with profiler.stage('gradient'):
+                gradient_density = self._calculate_gradient_density(gray, scale)
+            
+            # Combine methods
+            combined_density = (
+                self.edge_weight * edge_density +
+                self.variance_weight * variance_density +
+                self.gradient_weight * gradient_density
+            )
         
         # Normalize and smooth
-        density_map = self._normalize_density(combined_density)
+        with profiler.stage('normalization'):
+            density_map = self._normalize_density(combined_density, scale, normalizer)
+        
+        # Analyze crowd distribution (the density map may be smaller than the frame)
+        with profiler.stage('distribution'):
+            analysis = self._analyze_distribution(density_map, frame.shape, profiler)
+        
+        return density_map, analysis
+    
+    def extract_features(self, frame: np.ndarray, profiler: 'StageProfiler' = None,
+                         gray: np.ndarray = None) -> np.ndarray:
+        """Get the smoothed edge, variance and gradient maps of a frame, stacked as (3, height, width) float32
+        
+        These are the inputs of the weighted combination (see FEATURE_NAMES):
+        analyze_features on them gives the same result as analyze_frame, and
+        re-analysis with other weights or thresholds can start from them.
+        """
+        profiler = profiler or self.profiler
+        if gray is None:
+            gray = self.prepare_gray(frame, profiler)
+        
+        with profiler.stage('features'):
+            return self._calculate_feature_maps(gray, self.get_analysis_scale(frame.shape))
+    
+    def prepare_gray(self, frame: np.ndarray, profiler: 'StageProfiler' = None) -> np.ndarray:
+        """Get a frame in grayscale at the analysis resolution (see get_analysis_scale)"""
+        profiler = profiler or self.profiler
+        gray = self._grayscale(frame, profiler)
+        
+        # Downscale for reduced-resolution analysis
+        scale = self.get_analysis_scale(frame.shape)
+        if scale < 1.0:
+            with profiler.stage('downscale'):
+                gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return gray
+    
+    def analyze_features(self, features: np.ndarray, frame_shape: Tuple[int, ...],
+                         normalizer: RunningNormalization = None, profiler: 'StageProfiler' = None
+                         ) -> Tuple[np.ndarray, Dict]:
+        """Analyze a frame from its extract_features maps with the current weights and thresholds
+        
+        Only the combination, normalization and distribution run, so this is
+        much cheaper than analyze_frame. features may be float16 and smaller
+        than the analysis resolution; frame_shape is the original frame's.
+        """
+        profiler = profiler or self.profiler
+        scale = features.shape[2] / frame_shape[1]
+        
+        with profiler.stage('combine'):
+            combined = features[1].astype(np.float32)
+            combined *= self.variance_weight
+            combined += self.gradient_weight * features[2].astype(np.float32)
+            combined += self.edge_weight * features[0].astype(np.float32)
         
-        # Analyze crowd distribution
-        analysis = self._analyze_distribution(density_map, frame.shape)
+        with profiler.stage('normalization'):
+            density_map = self._normalize_density(combined, scale, normalizer)
+        
+        with profiler.stage('distribution'):
+            analysis = self._analyze_distribution(density_map, frame_shape, profiler)
         
         return density_map, analysis
     
-    def _calculate_edge_density(self, gray: np.ndarray) -> np.ndarray:
+    def feature_params(self) -> Dict:
+        """Get the settings extract_features depends on (re-analysis can change all others)"""
+        return {name: getattr(self, name) for name in (
+            'blur_kernel_size', 'edge_threshold_low', 'edge_threshold_high', 'variance_window', 'density_blur_size',
+            'analysis_scale', 'analysis_max_side')}
+    
+    @staticmethod
+    def _grayscale(frame: np.ndarray, profiler: 'StageProfiler') -> np.ndarray:
+        """Get a frame in grayscale (luma planes are used as they are)"""
+        if frame.ndim == 2:
+            return frame
+        with profiler.stage('gray'):
+            return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    
+    def get_analysis_scale(self, frame_shape: Tuple[int, ...]) -> float:
+        """Get the downscale factor used to analyze a frame of the given shape"""
+        scale = self.analysis_scale
+        if self.analysis_max_side:
+            scale = min(scale, self.analysis_max_side / max(frame_shape[:2]))
+        return min(scale, 1.0)
+    
+    @staticmethod
+    def _scaled_kernel(size: int, scale: float) -> int:
+        """Scale an odd kernel size, keeping it odd and at least 3"""
+        if scale >= 1.0:
+            return size
+        return max(3, int(round(size * scale)) | 1)
+    
+    def _calculate_combined_density(self, gray: np.ndarray, scale: float = 1.0) -> np.ndarray:
+        """Calculate the weighted edge/variance/gradient density in a single float32 pass.
+        
+        The Gaussian blur is linear, so the three per-method 25x25 post-blurs are
+        replaced by one blur of the weighted sum. Local statistics use box filters
+        (running sums) instead of 21x21 filter2D convolutions, and Sobel runs in
+        float32 directly.
+        """
+        blur_size = self._scaled_kernel(self.blur_kernel_size, scale)
+        window_size = self._scaled_kernel(self.variance_window, scale)
+        density_blur_size = self._scaled_kernel(self.density_blur_size, scale)
+        
+        # Edge response
+        blurred = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+        edges = cv2.Canny(blurred, self.edge_threshold_low, self.edge_threshold_high)
+        
+        # Local variance from box-filtered statistics
+        window = (window_size, window_size)
+        gray_float = gray.astype(np.float32)
+        local_mean = cv2.boxFilter(gray_float, -1, window)
+        deviation = cv2.subtract(gray_float, local_mean, dst=local_mean)
+        squared = cv2.multiply(deviation, deviation, dst=deviation)
+        combined = cv2.boxFilter(squared, -1, window, dst=gray_float)
+        cv2.multiply(combined, self.variance_weight, dst=combined)
+        
+        # Gradient magnitude
+        grad_x = cv2.Sobel(gray, cv2.CV_32F, 1, 0, dst=aligned_empty(gray.shape), ksize=3)
+        grad_y = cv2.Sobel(gray, cv2.CV_32F, 0, 1, dst=aligned_empty(gray.shape), ksize=3)
+        magnitude = cv2.magnitude(grad_x, grad_y, grad_x)
+        cv2.scaleAdd(magnitude, self.gradient_weight, combined, dst=combined)
+        
+        # Edges are 0/255, so the weighted edge term is a masked constant add
+        cv2.add(combined, self.edge_weight * 255.0, dst=combined, mask=edges)
+        
+        # One shared smoothing pass
+        cv2.GaussianBlur(combined, (density_blur_size, density_blur_size), 0, dst=combined)
+        
+        return combined
+    
+    def _calculate_feature_maps(self, gray: np.ndarray, scale: float = 1.0) -> np.ndarray:
+        """Calculate the unweighted, smoothed terms of _calculate_combined_density as a (3, h, w) stack"""
+        blur_size = self._scaled_kernel(self.blur_kernel_size, scale)
+        window_size = self._scaled_kernel(self.variance_window, scale)
+        density_blur = (self._scaled_kernel(self.density_blur_size, scale),) * 2
+        features = np.empty((len(FEATURE_NAMES),) + gray.shape, dtype=np.float32)
+        
+        # Edge response (0/255)
+        blurred = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
+        edges = cv2.Canny(blurred, self.edge_threshold_low, self.edge_threshold_high)
+        cv2.GaussianBlur(edges.astype(np.float32), density_blur, 0, dst=features[0])
+        
+        # Local variance from box-filtered statistics
+        window = (window_size, window_size)
+        gray_float = gray.astype(np.float32)
+        local_mean = cv2.boxFilter(gray_float, -1, window)
+        deviation = cv2.subtract(gray_float, local_mean, dst=local_mean)
+        squared = cv2.multiply(deviation, deviation, dst=deviation)
+        variance = cv2.boxFilter(squared, -1, window, dst=gray_float)
+        cv2.GaussianBlur(variance, density_blur, 0, dst=features[1])
+        
+        # Gradient magnitude
+        grad_x = cv2.Sobel(gray, cv2.CV_32F, 1, 0, dst=aligned_empty(gray.shape), ksize=3)
+        grad_y = cv2.Sobel(gray, cv2.CV_32F, 0, 1, dst=aligned_empty(gray.shape), ksize=3)
+        magnitude = cv2.magnitude(grad_x, grad_y, grad_x)
+        cv2.GaussianBlur(magnitude, density_blur, 0, dst=features[2])
+        
+        return features
+    
+    def _calculate_edge_density(self, gray: np.ndarray, scale: float = 1.0) -> np.ndarray:
         """Calculate edge density using Canny edge detection"""
+        blur_size = self._scaled_kernel(self.blur_kernel_size, scale)
+        density_blur_size = self._scaled_kernel(self.density_blur_size, scale)
+        
         # Apply Gaussian blur
-        blurred = cv2.GaussianBlur(gray, (self.blur_kernel_size, self.blur_kernel_size), 0)
+        blurred = cv2.GaussianBlur(gray, (blur_size, blur_size), 0)
         
         # Detect edges
         edges = cv2.Canny(blurred, self.edge_threshold_low, self.edge_threshold_high)
         
         # Create density map from edges
-        edge_density = cv2.GaussianBlur(edges.astype(np.float32), (25, 25), 0)
+        edge_density = cv2.GaussianBlur(edges.astype(np.float32), (density_blur_size, density_blur_size), 0)
         
         return edge_density
     
-    def _calculate_variance_density(self, gray: np.ndarray) -> np.ndarray:
+    def _calculate_variance_density(self, gray: np.ndarray, scale: float = 1.0) -> np.ndarray:
         """Calculate local variance density"""
+        window_size = self._scaled_kernel(self.variance_window, scale)
+        density_blur_size = self._scaled_kernel(self.density_blur_size, scale)
         gray_float = gray.astype(np.float32)
         
         # Calculate local variance
-        kernel = np.ones((21, 21), np.float32) / 441
+        kernel = np.ones((window_size, window_size), np.float32) / window_size**2
         local_mean = cv2.filter2D(gray_float, -1, kernel)
         local_var = cv2.filter2D((gray_float - local_mean)**2, -1, kernel)
         
         # Smooth the variance map
-        variance_density = cv2.GaussianBlur(local_var, (25, 25), 0)
+        variance_density = cv2.GaussianBlur(local_var, (density_blur_size, density_blur_size), 0)
         
         return variance_density
     
-    def _calculate_gradient_density(self, gray: np.ndarray) -> np.ndarray:
+    def _calculate_gradient_density(self, gray: np.ndarray, scale: float = 1.0) -> np.ndarray:
         """Calculate gradient magnitude density"""
+        density_blur_size = self._scaled_kernel(self.density_blur_size, scale)
+        
         # Calculate gradients
         grad_x = cv2.Sobel(gray, cv2.CV_64F, 1, 0, ksize=3)
         grad_y = cv2.Sobel(gray, cv2.CV_64F, 0, 1, ksize=3)
@@ -99,56 +1172,88 @@ class CrowdDensityAnalyzer:
         gradient_magnitude = np.sqrt(grad_x**2 + grad_y**2)
         
         # Smooth and normalize
-        gradient_density = cv2.GaussianBlur(gradient_magnitude.astype(np.float32), (25, 25), 0)
+        gradient_density = cv2.GaussianBlur(gradient_magnitude.astype(np.float32), (density_blur_size, density_blur_size), 0)
         
         return gradient_density
     
-    def _normalize_density(self, density: np.ndarray) -> np.ndarray:
-        """Normalize density map to [0, 1] range"""
+    def _normalize_density(self, density: np.ndarray, scale: float = 1.0,
+                           normalizer: RunningNormalization = None) -> np.ndarray:
+        """Normalize density map to [0, 1] range (in place; density is a scratch map)"""
         # Remove outliers
-        percentile_95 = np.percentile(density, 95)
-        percentile_5 = np.percentile(density, 5)
-        density = np.clip(density, percentile_5, percentile_95)
+        percentile_5, percentile_95 = self._estimate_percentiles(density, (5, 95))
+        if normalizer is not None:
+            percentile_5, percentile_95 = normalizer.update(percentile_5, percentile_95)
+        np.clip(density, percentile_5, percentile_95, out=density)
         
         # Normalize to [0, 1]
-        if density.max() > 0:
-            density = (density - density.min()) / (density.max() - density.min())
+        if percentile_95 > percentile_5:
+            density -= percentile_5
+            density *= 1.0 / (percentile_95 - percentile_5)
+        else:
+            density[:] = 0
         
         # Apply smoothing
-        density = cv2.GaussianBlur(density, (15, 15), 0)
+        smooth_size = self._scaled_kernel(15, scale)
+        density = cv2.GaussianBlur(density, (smooth_size, smooth_size), 0)
         
         return density
     
-    def _analyze_distribution(self, density_map: np.ndarray, frame_shape: Tuple[int, int, int]) -> Dict:
+    def _estimate_percentiles(self, density: np.ndarray, percentiles: Tuple[float, ...]) -> Tuple[float, ...]:
+        """Estimate percentiles from a histogram of the density map
+        
+        Two linear passes (min/max and cv2.calcHist) instead of a partition
+        per percentile; values are interpolated within a bin, so the error is
+        well under one bin width (1/percentile_bins of the value range).
+        """
+        low, high, _, _ = cv2.minMaxLoc(density)
+        if high <= low:
+            return tuple(float(low) for _ in percentiles)
+        
+        # Widen the top edge slightly so the maximum falls in the last bin
+        bins = self.percentile_bins
+        bin_width = (high - low) * (1 + 1e-6) / bins
+        hist = cv2.calcHist([density.astype(np.float32, copy=False)], [0], None, [bins],
+                            [low, low + bin_width * bins]).ravel()
+        return self._histogram_percentiles(hist, low, bin_width, percentiles)
+    
+    @staticmethod
+    def _histogram_percentiles(hist: np.ndarray, low: float, bin_width: float,
+                               percentiles: Tuple[float, ...]) -> Tuple[float, ...]:
+        """Read percentiles from a value histogram whose first bin starts at low"""
+        bins = len(hist)
+        cumulative = np.cumsum(hist)
+        
+        # Same rank convention as np.percentile's default linear method
+        ranks = np.asarray(percentiles, dtype=np.float64) / 100 * (cumulative[-1] - 1)
+        index = np.minimum(np.searchsorted(cumulative, ranks, side='right'), bins - 1)
+        below = np.where(index > 0, cumulative[index - 1], 0)
+        fraction = (ranks - below) / np.maximum(hist[index], 1)
+        return tuple(float(value) for value in low + (index + fraction) * bin_width)
+    
+    def _analyze_distribution(self, density_map: np.ndarray, frame_shape: Tuple[int, int, int],
+                              profiler: 'StageProfiler' = None) -> Dict:
         """Analyze crowd distribution across different regions"""
-        height, width = frame_shape[:2]
+        profiler = profiler or self.profiler
         
-        # Define road regions (assuming road runs horizontally)
-        regions = {
-            'left_side': density_map[:, :width//3],
-            'center': density_map[:, width//3:2*width//3],
-            'right_side': density_map[:, 2*width//3:],
-            'top_half': density_map[:height//2, :],
-            'bottom_half': density_map[height//2:, :],
-            'road_center': density_map[height//4:3*height//4, width//4:3*width//4]
-        }
+        # Regions are sliced from the density map itself; totals are scaled
+        # back to frame pixels when the map was computed at reduced resolution
+        height, width = density_map.shape[:2]
+        pixel_scale = (frame_shape[0] * frame_shape[1]) / (height * width)
         
-        # Calculate statistics for each region
-        region_stats = {}
-        for name, region in regions.items():
-            region_stats[name] = {
-                'mean_density': np.mean(region),
-                'max_density': np.max(region),
-                'total_density': np.sum(region),
-                'crowd_level': self._classify_crowd_level(np.mean(region))
-            }
+        with profiler.stage('regions'):
+            # One summed-area table serves every rectangular region and zone
+            integral = cv2.integral(density_map, sdepth=cv2.CV_64F)
+            
+            # Calculate statistics for each region
+            region_stats = self.regions.measure(density_map, integral, pixel_scale, self._classify_crowd_level)
         
         # Overall statistics
+        mean_density = np.mean(density_map)
         overall_stats = {
-            'mean_density': np.mean(density_map),
+            'mean_density': mean_density,
             'max_density': np.max(density_map),
-            'total_density': np.sum(density_map),
-            'crowd_level': self._classify_crowd_level(np.mean(density_map))
+            'total_density': np.sum(density_map) * pixel_scale,
+            'crowd_level': self._classify_crowd_level(mean_density)
         }
         
         # Find highest density region
@@ -156,37 +1261,139 @@ class CrowdDensityAnalyzer:
                         key=lambda k: region_stats[k]['mean_density'])
         
         # Estimate crowd count
-        estimated_count = self._estimate_crowd_count(density_map, frame_shape)
+        with profiler.stage('count_estimate'):
+            estimated_count = self._estimate_crowd_count(density_map, frame_shape)
         
-        return {
+        analysis = {
             'regions': region_stats,
             'overall': overall_stats,
             'highest_density_region': max_region,
             'estimated_count': estimated_count
         }
     
+        # Per-camera zones, with the count split by high-density pixels (same threshold as the estimate),
+        # or by the people in them with a perspective map
+        if self.zones:
+            with profiler.stage('zones'):
+                high_threshold = overall_stats['max_density'] * self.count_threshold
+                if self.perspective:
+                    count_map = self.perspective.people_map(density_map, high_threshold, frame_shape)
+                else:
+                    count_map = (density_map > high_threshold).astype(np.uint8)
+                analysis['zones'] = self.zones.measure(density_map, integral, pixel_scale, self._classify_crowd_level,
+                                                       count_map, estimated_count['estimated_count'])
+        
+        with profiler.stage('hotspots'):
+            analysis['hotspots'] = self.find_hotspots(density_map, frame_shape)
+        
+        return analysis
+    
+    def find_hotspots(self, density_map: np.ndarray, frame_shape: Tuple[int, ...]) -> List[Dict]:
+        """Find dense clusters: connected areas above hotspot_threshold, most total density first
+        
+        Components are labeled on the density map area-downsampled to at most
+        hotspot_max_side pixels, so this costs under a millisecond per frame.
+        Centroids are density-weighted; centroid, bbox ([x, y, width, height])
+        and area are in frame pixels.
+        """
+        small = downsample_smooth(density_map, self.hotspot_max_side)
+        mask = (small > self.hotspot_threshold).view(np.uint8)
+        count, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        if count <= 1:
+            return []
+        
+        # Per-component density mass and density-weighted position
+        flat_labels = labels.ravel()
+        weights = small.ravel().astype(np.float64)
+        rows, columns = np.indices(small.shape)
+        mass = np.bincount(flat_labels, weights, count)
+        mass[mass == 0] = 1
+        centroid_x = np.bincount(flat_labels, weights * columns.ravel(), count) / mass
+        centroid_y = np.bincount(flat_labels, weights * rows.ravel(), count) / mass
+        
+        # Small-map pixels to frame pixels
+        scale_x = frame_shape[1] / small.shape[1]
+        scale_y = frame_shape[0] / small.shape[0]
+        min_pixels = self.hotspot_min_area * small.shape[0] * small.shape[1]
+        
+        hotspots = []
+        for label in sorted(range(1, count), key=lambda label: mass[label], reverse=True):
+            x, y, box_width, box_height, pixels = stats[label]
+            if pixels < min_pixels:
+                continue
+            component = small[y:y + box_height, x:x + box_width][labels[y:y + box_height, x:x + box_width] == label]
+            area = pixels * scale_x * scale_y
+            hotspots.append({
+                'centroid': [float((centroid_x[label] + 0.5) * scale_x), float((centroid_y[label] + 0.5) * scale_y)],
+                'bbox': [int(x * scale_x), int(y * scale_y), int(np.ceil(box_width * scale_x)),
+                         int(np.ceil(box_height * scale_y))],
+                'area': int(round(area)),
+                'area_fraction': float(pixels / small.size),
+                'peak_density': float(component.max()),
+                'mean_density': float(component.mean())
+            })
+            if len(hotspots) == self.max_hotspots:
+                break
+        return hotspots
+    
+    def interpolate_analysis(self, start: Dict, end: Dict, t: float) -> Dict:
+        """Linearly interpolate the numeric fields of two frame analyses"""
+        def lerp(a, b):
+            if isinstance(a, dict):
+                # Fields added in frame order (e.g. flow) may be missing from the later analysis
+                return {key: lerp(a[key], b[key]) for key in a if key in b}
+            if isinstance(a, (int, np.integer)) and not isinstance(a, bool):
+                return int(round(a + (b - a) * t))
+            if isinstance(a, (float, np.floating)):
+                return a + (b - a) * t
+            return a if t < 0.5 else b
+        
+        analysis = lerp(start, end)
+        
+        # Re-derive labels from the interpolated densities
+        for stats in list(analysis['regions'].values()) + list(analysis.get('zones', {}).values()) + [analysis['overall']]:
+            stats['crowd_level'] = self._classify_crowd_level(stats['mean_density'])
+        analysis['highest_density_region'] = max(analysis['regions'],
+                                                 key=lambda k: analysis['regions'][k]['mean_density'])
+        return analysis
+    
     def _classify_crowd_level(self, density: float) -> str:
         """Classify crowd density level"""
-        if density < 0.1:
-            return "Very Low"
-        elif density < 0.25:
-            return "Low"
-        elif density < 0.4:
-            return "Medium"
-        elif density < 0.6:
-            return "High"
-        elif density < 0.8:
-            return "Very High"
-        else:
-            return "Extremely High"
+        for level, threshold in zip(CROWD_LEVELS, self.crowd_level_thresholds):
+            if density < threshold:
+                return level
+        return CROWD_LEVELS[-1]
     
     def _estimate_crowd_count(self, density_map: np.ndarray, frame_shape: Tuple[int, int, int]) -> Dict:
         """Estimate crowd count based on density analysis"""
         height, width = frame_shape[:2]
-        total_pixels = height * width
-        mean_density = np.mean(density_map)
-        max_density = np.max(density_map)
+        pixel_scale = (height * width) / density_map.size
+        mean, std = cv2.meanStdDev(density_map)
+        max_density = cv2.minMaxLoc(density_map)[1]
+        
+        # Calculate estimate based on high-density areas
+        # Use only pixels with significant density (> count_threshold of max)
+        high_density_threshold = max_density * self.count_threshold
+        high_density_pixels = cv2.countNonZero((density_map > high_density_threshold).view(np.uint8)) * pixel_scale
         
+        if self.perspective:
+            people = self.perspective.count(density_map, high_density_threshold, frame_shape)
+            return self._count_from_people(people, float(std[0, 0]), high_density_pixels)
+        return self._count_from_statistics(float(mean[0, 0]), float(std[0, 0]), high_density_pixels)
+    
+    def _count_from_people(self, people: float, density_std: float, high_density_pixels: float) -> Dict:
+        """Build the count estimate from a perspective-weighted people sum"""
+        estimate = int(round(people))
+        return {
+            'estimated_count': estimate,
+            'confidence': max(0.3, 1.0 / (1.0 + density_std)),
+            'pixels_per_person': int(round(high_density_pixels / people)) if people > 0 else 0,
+            'base_estimate': estimate,
+            'method': 'perspective'
+        }
+    
+    def _count_from_statistics(self, mean_density: float, density_std: float, high_density_pixels: float) -> Dict:
+        """Estimate crowd count from the map's mean and standard deviation and its high-density area in frame pixels"""
         # Adaptive pixels per person based on density
         if mean_density < 0.1:
             pixels_per_person = 800  # Very sparse crowd
@@ -199,11 +1406,6 @@ class CrowdDensityAnalyzer:
         else:
             pixels_per_person = 120  # Very dense crowd
         
-        # Calculate estimate based on high-density areas
-        # Use only pixels with significant density (> 0.3 of max)
-        high_density_threshold = max_density * 0.3
-        high_density_pixels = np.sum(density_map > high_density_threshold)
-        
         # Estimate based on high-density areas
         base_estimate = int(high_density_pixels / pixels_per_person)
         
@@ -212,7 +1414,7 @@ class CrowdDensityAnalyzer:
         scaled_estimate = int(base_estimate * density_factor)
         
         # Apply confidence factor
-        spatial_consistency = 1.0 / (1.0 + np.std(density_map))
+        spatial_consistency = 1.0 / (1.0 + density_std)
         confidence = max(0.3, spatial_consistency)
         
         final_estimate = int(scaled_estimate * confidence)
@@ -224,27 +1426,193 @@ class CrowdDensityAnalyzer:
             'estimated_count': final_estimate,
             'confidence': confidence,
             'pixels_per_person': pixels_per_person,
-            'base_estimate': base_estimate
+            'base_estimate': base_estimate,
+            'method': 'density_table'
         }
 
 class HeatmapGenerator:
-    def __init__(self):
-        """Initialize heatmap generator"""
+    def __init__(self, reuse_buffers: bool = False):
+        """Initialize heatmap generator
+        
+        With reuse_buffers, generate_heatmap writes into preallocated arrays
+        that are overwritten by the next call, so results must be consumed
+        (written or copied) before generating the next frame.
+        """
         colors = ['darkblue', 'blue', 'cyan', 'yellow', 'orange', 'red', 'darkred']
         self.colormap = LinearSegmentedColormap.from_list('crowd_density', colors, N=256)
     
+        # Precomputed 256-entry BGR lookup table of the same palette, for OpenCV
+        rgb_table = (self.colormap(np.arange(256))[:, :3] * 255).astype(np.uint8)
+        self.color_lut = np.ascontiguousarray(rgb_table[:, ::-1].reshape(256, 1, 3))
+        
+        # Heatmap weight in blended views
+        self.alpha = 0.7
+        
+        self.reuse_buffers = reuse_buffers
+        self._buffers = {}
+    
+    def _buffer(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """Get a preallocated output buffer, or None to let OpenCV allocate"""
+        if not self.reuse_buffers:
+            return None
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
+    
+    def colorize(self, density_map: np.ndarray, size: Tuple[int, int] = None) -> np.ndarray:
+        """Colorize a [0, 1] density map as a BGR image, optionally resized to (width, height)"""
+        # Quantize to palette indices: floor(density * 256), as the matplotlib colormap does
+        # (up to one palette step at exact bin boundaries)
+        indices = cv2.convertScaleAbs(density_map, self._buffer('indices', density_map.shape[:2]), 256, -0.5)
+        
+        # Upsample reduced-resolution maps as 8-bit indices rather than floats
+        if size is not None and (size[1], size[0]) != indices.shape[:2]:
+            indices = cv2.resize(indices, size, self._buffer('resized_indices', (size[1], size[0])),
+                                 interpolation=cv2.INTER_LINEAR)
+        
+        return cv2.applyColorMap(indices, self.color_lut, self._buffer('colored', indices.shape[:2] + (3,)))
+    
+    def colorize_rows(self, density_map: np.ndarray, size: Tuple[int, int], top: int, bottom: int) -> np.ndarray:
+        """Colorize rows top:bottom of the heatmap colorize would make at size (width, height)
+        
+        Only the density rows those output rows interpolate from are read, so
+        large (memory-mapped) maps can be colorized strip by strip.
+        """
+        height, width = density_map.shape[:2]
+        if (size[1], size[0]) == (height, width):
+            return self.colorize(np.asarray(density_map[top:bottom]))
+        
+        # Same half-pixel mapping as cv2.resize, restricted to the rows needed
+        scale_y, scale_x = height / size[1], width / size[0]
+        rows = (np.arange(top, bottom, dtype=np.float32) + 0.5) * scale_y - 0.5
+        first = max(0, int(np.floor(rows[0])))
+        last = min(height, int(np.floor(rows[-1])) + 2)
+        indices = cv2.convertScaleAbs(np.asarray(density_map[first:last]), None, 256, -0.5)
+        
+        columns = (np.arange(size[0], dtype=np.float32) + 0.5) * scale_x - 0.5
+        map_x = np.repeat(columns[np.newaxis, :], bottom - top, axis=0)
+        map_y = np.repeat((rows - first)[:, np.newaxis], size[0], axis=1)
+        indices = cv2.remap(indices, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return cv2.applyColorMap(indices, self.color_lut)
+    
     def generate_heatmap(self, density_map: np.ndarray, original_frame: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """Generate colored heatmap and blended visualization"""
-        # Create colored heatmap
-        colored_heatmap = self.colormap(density_map)
-        colored_heatmap = (colored_heatmap[:, :, :3] * 255).astype(np.uint8)
+        # Create colored heatmap at the output frame size
+        colored_heatmap = self.colorize(density_map, (original_frame.shape[1], original_frame.shape[0]))
         
         # Blend with original frame
-        alpha = 0.7
-        blended = cv2.addWeighted(original_frame, 1 - alpha, colored_heatmap, alpha, 0)
+        alpha = self.alpha
+        blended = cv2.addWeighted(original_frame, 1 - alpha, colored_heatmap, alpha, 0,
+                                  dst=self._buffer('blended', original_frame.shape))
         
         return colored_heatmap, blended
     
+    def render_analysis_image(self, density_map: np.ndarray, analysis: Dict) -> np.ndarray:
+        """Render the analysis figure (heatmap, regional charts, summary) as a BGR image with OpenCV"""
+        canvas = np.full((1200, 1600, 3), 255, dtype=np.uint8)
+        
+        # Main heatmap with colorbar
+        self._draw_title(canvas, 'Crowd Density Heatmap', (400, 40))
+        map_height, map_width = density_map.shape[:2]
+        scale = min(680 / map_width, 500 / map_height)
+        size = (max(1, int(map_width * scale)), max(1, int(map_height * scale)))
+        heatmap = self.colorize(density_map, size)
+        x, y = 20 + (680 - size[0]) // 2, 70 + (500 - size[1]) // 2
+        canvas[y:y + size[1], x:x + size[0]] = heatmap
+        
+        colorbar = cv2.resize(self.color_lut[::-1], (24, 500), interpolation=cv2.INTER_NEAREST)
+        canvas[70:570, 720:744] = colorbar
+        for value in (0.0, 0.25, 0.5, 0.75, 1.0):
+            label_y = int(570 - value * 500)
+            cv2.line(canvas, (744, label_y), (750, label_y), (0, 0, 0), 1)
+            cv2.putText(canvas, f"{value:.2f}", (754, label_y + 5), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 1, cv2.LINE_AA)
+        
+        # Regional analysis
+        regions = ['left_side', 'center', 'right_side', 'top_half', 'bottom_half']
+        self._draw_bar_chart(
+            canvas, (800, 0), 'Regional Density Analysis',
+            [region.replace('_', ' ').title() for region in regions],
+            [analysis['regions'][region]['mean_density'] for region in regions],
+            [(255, 0, 0), (0, 128, 0), (0, 0, 255), (0, 165, 255), (128, 0, 128)]
+        )
+        
+        # Road side analysis
+        road_densities = [analysis['regions'][region]['mean_density'] for region in ['left_side', 'center', 'right_side']]
+        self._draw_bar_chart(
+            canvas, (0, 600), 'Road Side Crowd Distribution',
+            ['Left Side', 'Center', 'Right Side'], road_densities,
+            [(0, 0, 255) if d > 0.3 else (0, 165, 255) if d > 0.15 else (0, 128, 0) for d in road_densities]
+        )
+        
+        # Summary statistics
+        regions_stats = analysis['regions']
+        summary_lines = [
+            "CROWD ANALYSIS SUMMARY",
+            "",
+            f"Overall Crowd Level: {analysis['overall']['crowd_level']}",
+            f"Estimated Count: {analysis['estimated_count']['estimated_count']:,} people",
+            f"Confidence: {analysis['estimated_count']['confidence']:.1%}",
+            "",
+            f"Highest Density Region: {analysis['highest_density_region'].replace('_', ' ').title()}",
+            "",
+            "ROAD ANALYSIS:",
+            f"- Left Side: {regions_stats['left_side']['crowd_level']} ({regions_stats['left_side']['mean_density']:.3f})",
+            f"- Center: {regions_stats['center']['crowd_level']} ({regions_stats['center']['mean_density']:.3f})",
+            f"- Right Side: {regions_stats['right_side']['crowd_level']} ({regions_stats['right_side']['mean_density']:.3f})",
+            "",
+            "DENSITY STATISTICS:",
+            f"- Mean Density: {analysis['overall']['mean_density']:.4f}",
+            f"- Max Density: {analysis['overall']['max_density']:.4f}",
+            f"- Total Density: {analysis['overall']['total_density']:.2f}"
+        ]
+        cv2.rectangle(canvas, (830, 630), (1570, 1170), (211, 211, 211), -1)
+        for i, line in enumerate(summary_lines):
+            cv2.putText(canvas, line, (860, 670 + i * 29), cv2.FONT_HERSHEY_SIMPLEX, 0.62, (0, 0, 0),
+                        2 if i == 0 else 1, cv2.LINE_AA)
+        
+        return canvas
+    
+    def _draw_title(self, canvas: np.ndarray, title: str, center: Tuple[int, int]):
+        """Draw a bold centered panel title"""
+        (text_width, _), _ = cv2.getTextSize(title, cv2.FONT_HERSHEY_SIMPLEX, 0.9, 2)
+        cv2.putText(canvas, title, (center[0] - text_width // 2, center[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.9,
+                    (0, 0, 0), 2, cv2.LINE_AA)
+    
+    def _draw_bar_chart(self, canvas: np.ndarray, origin: Tuple[int, int], title: str, labels: List[str],
+                        values: List[float], colors: List[Tuple[int, int, int]]):
+        """Draw a labeled bar chart into an 800x600 panel at origin"""
+        left, top = origin
+        self._draw_title(canvas, title, (left + 400, top + 40))
+        
+        # Plot area and y axis
+        x0, x1, y0, y1 = left + 110, left + 770, top + 510, top + 80
+        y_max = max(max(values) * 1.15, 0.05)
+        cv2.line(canvas, (x0, y0), (x1, y0), (0, 0, 0), 1)
+        cv2.line(canvas, (x0, y0), (x0, y1), (0, 0, 0), 1)
+        for tick in np.linspace(0, y_max, 5):
+            tick_y = int(y0 - tick / y_max * (y0 - y1))
+            cv2.line(canvas, (x0 - 5, tick_y), (x0, tick_y), (0, 0, 0), 1)
+            cv2.putText(canvas, f"{tick:.2f}", (x0 - 55, tick_y + 5), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 1, cv2.LINE_AA)
+        cv2.putText(canvas, 'Mean Density', (left + 10, top + 70), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 1, cv2.LINE_AA)
+        
+        # Bars with value labels
+        slot = (x1 - x0) / len(values)
+        for i, (label, value, color) in enumerate(zip(labels, values, colors)):
+            bar_left = int(x0 + slot * (i + 0.15))
+            bar_right = int(x0 + slot * (i + 0.85))
+            bar_top = int(y0 - value / y_max * (y0 - y1))
+            cv2.rectangle(canvas, (bar_left, bar_top), (bar_right, y0), color, -1)
+            
+            value_text = f"{value:.3f}"
+            (text_width, _), _ = cv2.getTextSize(value_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+            center = (bar_left + bar_right) // 2
+            cv2.putText(canvas, value_text, (center - text_width // 2, bar_top - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        (0, 0, 0), 1, cv2.LINE_AA)
+            (text_width, _), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+            cv2.putText(canvas, label, (center - text_width // 2, y0 + 25), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        (0, 0, 0), 1, cv2.LINE_AA)
+    
     def create_analysis_heatmap(self, density_map: np.ndarray, analysis: Dict, frame_shape: Tuple[int, int, int]) -> None:
         """Create detailed analysis heatmap with annotations"""
         height, width = frame_shape[:2]
@@ -326,17 +1694,943 @@ DENSITY STATISTICS:
         plt.tight_layout()
         return fig
 
-class VideoProcessor:
-    def __init__(self):
-        """Initialize video processor"""
-        self.analyzer = CrowdDensityAnalyzer()
-        self.heatmap_gen = HeatmapGenerator()
+class HistogramSketch:
+    def __init__(self, low: float, high: float, bins: int):
+        """Initialize a fixed-size histogram sketch for streaming percentiles"""
+        self.low = low
+        self.high = high
+        self.bin_width = (high - low) / bins
+        self.counts = np.zeros(bins, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+    
+    def add(self, value: float):
+        """Add a value to the sketch"""
+        index = int((value - self.low) / self.bin_width)
+        self.counts[min(max(index, 0), len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+    
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile to within half a bin width"""
+        if self.count == 0:
+            return 0.0
+        rank = q * (self.count - 1)
+        index = int(np.searchsorted(np.cumsum(self.counts), rank, side='right'))
+        value = self.low + (index + 0.5) * self.bin_width
+        return min(max(value, self.min), self.max)
+    
+    def summary(self) -> Dict:
+        """Get running aggregates and percentiles"""
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.count else 0.0,
+            'max': self.max if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99)
+        }
+    
+    def merge(self, other: 'HistogramSketch'):
+        """Add the values of another sketch with the same bins"""
+        self.counts += other.counts
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+# Shared no-op stage for disabled profilers
+_NULL_STAGE = nullcontext()
+
+class StageProfiler:
+    def __init__(self, enabled: bool = True, track_allocations: bool = False):
+        """Initialize per-stage wall time (and optionally allocation) profiling
+        
+        Code is instrumented with `with profiler.stage('edge'):`. A disabled
+        profiler hands out one shared no-op context, so instrumentation costs
+        a method call per stage. With track_allocations, tracemalloc records
+        each stage's peak traced allocation (NumPy buffers included, OpenCV
+        internals not); tracing is process-wide and slows analysis, so use it
+        with one worker.
+        """
+        self.enabled = enabled
+        self.track_allocations = enabled and track_allocations
+        self.timings = {}  # Stage name -> HistogramSketch of milliseconds
+        self.allocations = {}  # Stage name -> HistogramSketch of peak KB
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        
+        if self.track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+    
+    def stage(self, name: str):
+        """Get a context manager that profiles one run of a stage"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _ProfiledStage(self, name)
+    
+    def record(self, name: str, seconds: float, allocated_kb: float = None):
+        """Record one run of a stage"""
+        with self._lock:
+            if name not in self.timings:
+                # 0.05 ms bins up to 1 s; 64 KB bins up to 4 GB
+                self.timings[name] = HistogramSketch(0.0, 1000.0, 20000)
+            self.timings[name].add(seconds * 1000)
+            if allocated_kb is not None:
+                if name not in self.allocations:
+                    self.allocations[name] = HistogramSketch(0.0, 4 * 1024 * 1024, 65536)
+                self.allocations[name].add(allocated_kb)
+    
+    def merge(self, other: 'StageProfiler'):
+        """Add the stage histograms of another profiler"""
+        with self._lock:
+            for target, source in ((self.timings, other.timings), (self.allocations, other.allocations)):
+                for name, sketch in source.items():
+                    if name in target:
+                        target[name].merge(sketch)
+                    else:
+                        target[name] = HistogramSketch(sketch.low, sketch.high, len(sketch.counts))
+                        target[name].merge(sketch)
+    
+    def summary(self) -> Dict:
+        """Get per-stage time (ms) and peak allocation (KB) distributions"""
+        with self._lock:
+            stages = {}
+            for name, sketch in self.timings.items():
+                stages[name] = {'time_ms': sketch.summary()}
+                if name in self.allocations:
+                    stages[name]['allocated_kb'] = self.allocations[name].summary()
+            return stages
+
+class _ProfiledStage:
+    __slots__ = ('profiler', 'name', 'start', 'start_memory', 'peak')
+    
+    def __init__(self, profiler: StageProfiler, name: str):
+        self.profiler = profiler
+        self.name = name
+    
+    def __enter__(self):
+        if self.profiler.track_allocations:
+            # Nested stages reset the tracemalloc peak, so each open stage keeps its own
+            stack = self.profiler._local.__dict__.setdefault('stack', [])
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            self.start_memory = self.peak = current
+            stack.append(self)
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        allocated_kb = None
+        if self.profiler.track_allocations:
+            stack = self.profiler._local.stack
+            stack.pop()
+            peak = max(tracemalloc.get_traced_memory()[1], self.peak)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            allocated_kb = (peak - self.start_memory) / 1024
+        self.profiler.record(self.name, elapsed, allocated_kb)
+        return False
+
+class FrameSampler:
+    def __init__(self, stride: int = 1, target_fps: float = None, adaptive_threshold: float = None,
+                 max_stride: int = None, fill: str = 'hold'):
+        """Initialize keyframe sampling for video analysis
+        
+        Only keyframes are analyzed. They are chosen by a fixed stride, by a
+        target analysis fps, or adaptively: a frame becomes a keyframe when the
+        mean absolute difference of a small grayscale thumbnail against the
+        last keyframe exceeds adaptive_threshold (0-1), or max_stride frames
+        have passed. Skipped frames reuse the previous keyframe's density map
+        ('hold') or blend the surrounding keyframes ('interpolate').
+        """
+        if stride < 1:
+            raise ValueError(f"stride must be at least 1, got {stride}")
+        if fill not in ('hold', 'interpolate'):
+            raise ValueError(f"fill must be 'hold' or 'interpolate', got {fill}")
+        self.stride = stride
+        self.target_fps = target_fps
+        self.adaptive_threshold = adaptive_threshold
+        self.max_stride = max_stride
+        self.fill = fill
+        self.start(0)
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether any frames are skipped"""
+        return self.stride > 1 or bool(self.target_fps) or self.adaptive_threshold is not None
+    
+    def start(self, fps: float, first_frame: int = 1):
+        """Reset sampling state for a new video (or a range starting at first_frame)"""
+        self._first_frame = first_frame
+        self.effective_stride = self.stride
+        if self.target_fps and fps > 0:
+            self.effective_stride = max(1, int(round(fps / self.target_fps)))
+        # Adaptive sampling still forces a keyframe every max_stride frames (default: 1 second)
+        self.effective_max_stride = self.max_stride or max(int(round(fps)), self.effective_stride, 1)
+        self._last_keyframe = None
+        self._last_thumbnail = None
+    
+    def describe(self) -> str:
+        """Describe the sampling mode for reports"""
+        if self.adaptive_threshold is not None:
+            mode = f"adaptive (difference > {self.adaptive_threshold}, max stride {self.effective_max_stride})"
+        else:
+            mode = f"every {self.effective_stride} frames"
+        return f"{mode}, {self.fill} skipped frames"
+    
+    def is_keyframe(self, frame_number: int, frame: np.ndarray) -> bool:
+        """Decide whether a frame is analyzed; frames must arrive in order"""
+        if self.adaptive_threshold is None:
+            keyframe = (frame_number - self._first_frame) % self.effective_stride == 0
+        else:
+            # Cheap change score on a strided, area-downscaled thumbnail
+            thumbnail = cv2.resize(frame[::8, ::8], (64, 36), interpolation=cv2.INTER_AREA)
+            if thumbnail.ndim == 3:
+                thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+            keyframe = (
+                self._last_thumbnail is None or
+                frame_number - self._last_keyframe >= self.effective_max_stride or
+                cv2.norm(thumbnail, self._last_thumbnail, cv2.NORM_L1) / (thumbnail.size * 255.0) > self.adaptive_threshold
+            )
+            if keyframe:
+                self._last_thumbnail = thumbnail
+        
+        if keyframe:
+            self._last_keyframe = frame_number
+        return keyframe
+
+class KeyframeFiller:
+    def __init__(self, fill: str, render, analyzer: 'CrowdDensityAnalyzer'):
+        """Initialize in-order filling of skipped frames from analyzed keyframes
+        
+        render(frame_number, frame, density_map, analysis, fill_label) renders a
+        skipped frame. In interpolate mode skipped frames wait for the next
+        keyframe, so at most one keyframe gap of frames is buffered. Frames are
+        rendered lazily as the caller iterates, so render may reuse buffers.
+        """
+        self.fill = fill
+        self.render = render
+        self.analyzer = analyzer
+        self._keyframe = None  # (density_map, analysis) of the last keyframe
+        self._pending = []  # Skipped frames waiting for the next keyframe
+    
+    def push(self, frame_number: int, frame: np.ndarray, result: Tuple = None):
+        """Add the next frame in order and yield the frames ready to emit
+        
+        result is the rendered output for keyframes and None for skipped frames.
+        """
+        if result is None:
+            if self.fill == 'interpolate' or self._keyframe is None:
+                self._pending.append((frame_number, frame))
+                return
+            yield frame_number, self.render(frame_number, frame, *self._keyframe, 'held'), False
+            return
+        
+        density_map, analysis = result[:2]
+        yield from self._flush(density_map, analysis)
+        self._keyframe = (density_map, analysis)
+        yield frame_number, result, True
+    
+    def finish(self):
+        """Fill frames left after the last keyframe by holding it"""
+        if self._keyframe is not None:
+            yield from self._flush(None, None)
+    
+    def _flush(self, density_map: np.ndarray, analysis: Dict):
+        """Render pending frames between the last keyframe and the given one"""
+        pending, self._pending = self._pending, []
+        
+        for position, (frame_number, frame) in enumerate(pending, start=1):
+            if self._keyframe is None:
+                # Frames before the first keyframe take the first keyframe's map
+                fill = (density_map, analysis, 'held')
+            elif density_map is None:
+                fill = (*self._keyframe, 'held')
+            else:
+                t = position / (len(pending) + 1)
+                previous_map, previous_analysis = self._keyframe
+                fill = (
+                    cv2.addWeighted(previous_map, 1 - t, density_map, t, 0),
+                    self.analyzer.interpolate_analysis(previous_analysis, analysis, t),
+                    'interpolated'
+                )
+            yield frame_number, self.render(frame_number, frame, *fill), False
+
+class VideoRange:
+    def __init__(self, start: float = None, end: float = None, start_frame: int = None, end_frame: int = None):
+        """Initialize the part of a video to analyze
+        
+        Bounds are times in seconds (start inclusive, end exclusive) or
+        1-based frame numbers (both inclusive); a missing bound means the
+        start or end of the video. Frame numbers and times in the outputs
+        stay those of the whole video.
+        """
+        if start is not None and start_frame is not None or end is not None and end_frame is not None:
+            raise ValueError("Give each bound as a time or a frame number, not both")
+        if (start is not None and start < 0) or (end is not None and end <= 0):
+            raise ValueError(f"Invalid time range: {start} - {end}")
+        if (start_frame is not None and start_frame < 1) or (end_frame is not None and end_frame < 1):
+            raise ValueError(f"Frame numbers start at 1, got {start_frame} - {end_frame}")
+        self.start = start
+        self.end = end
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+    
+    def resolve(self, fps: float, total_frames: int) -> Tuple[int, int]:
+        """Get the first and last frame numbers (1-based, inclusive) of the range"""
+        if (self.start is not None or self.end is not None) and fps <= 0:
+            raise ValueError("Video frame rate is unknown, so the range must be given in frames")
+        
+        # Frame n is shown at (n - 1) / fps
+        first = 1
+        if self.start_frame is not None:
+            first = self.start_frame
+        elif self.start is not None:
+            first = int(np.ceil(self.start * fps - 1e-6)) + 1
+        
+        last = total_frames if total_frames > 0 else None
+        if self.end_frame is not None:
+            last = self.end_frame
+        elif self.end is not None:
+            last = int(np.ceil(self.end * fps - 1e-6))
+        if last is not None and total_frames > 0:
+            last = min(last, total_frames)
+        
+        if last is not None and first > last:
+            raise ValueError(f"Range {self.describe()} contains no frames of a {total_frames}-frame video")
+        return first, last
+    
+    def describe(self) -> str:
+        """Describe the range as given"""
+        if self.start_frame is not None:
+            start = f"frame {self.start_frame}"
+        else:
+            start = format_timestamp(self.start or 0.0)
+        if self.end_frame is not None:
+            end = f"frame {self.end_frame}"
+        else:
+            end = format_timestamp(self.end) if self.end is not None else "end"
+        return f"{start} - {end}"
+
+class VideoStatistics:
+    def __init__(self, records_path: str = None, fps: float = 0.0):
+        """Initialize running statistics and the per-frame series for a video"""
+        self.frame_count = 0
+        self.analyzed_frames = 0
+        self.analyzed_runs = []  # [first, step, last] runs of analyzed frame numbers
+        self.cumulative_density = None  # Allocated at density map resolution
+        
+        # Counts are integers capped at 50k, so unit-width bins give exact percentiles
+        self.count_sketch = HistogramSketch(-0.5, 50000.5, 50001)
+        self.density_sketch = HistogramSketch(0.0, 1.0, 1000)
+        
+        # Per-frame metrics as numpy columns
+        self.series = FrameSeries(fps)
+        
+        # Per-frame records are also appended to disk as JSON lines
+        self.records_path = records_path
+        self._records_file = open(records_path, 'w') if records_path else None
+    
+    def add(self, frame_number: int, density_map: np.ndarray, analysis: Dict, analyzed: bool = True):
+        """Add one frame; analyzed is False for frames filled from keyframes"""
+        self.frame_count += 1
+        if analyzed:
+            self._add_analyzed(frame_number)
+        
+        if self.cumulative_density is None:
+            self.cumulative_density = np.zeros(density_map.shape, dtype=np.float32)
+        self.cumulative_density += density_map
+        
+        self.count_sketch.add(analysis['estimated_count']['estimated_count'])
+        self.density_sketch.add(float(analysis['overall']['mean_density']))
+        self.series.add(frame_number, analysis, analyzed)
         
-    def process_video(self, video_path: str, output_path: str = None, heatmap_video_path: str = None) -> Dict:
-        """Process video file and generate analysis"""
+        if self._records_file:
+            self._records_file.write(json.dumps(self._frame_record(frame_number, analysis, analyzed)) + "\n")
+    
+    def _add_analyzed(self, frame_number: int):
+        """Extend the run-length list of analyzed frame numbers"""
+        self.analyzed_frames += 1
+        if self.analyzed_runs:
+            run = self.analyzed_runs[-1]
+            step = frame_number - run[2]
+            if run[1] is None or run[1] == step:
+                run[1], run[2] = step, frame_number
+                return
+        self.analyzed_runs.append([frame_number, None, frame_number])
+    
+    def format_analyzed_frames(self) -> str:
+        """Describe the analyzed frame numbers compactly, e.g. '1-141 every 5'"""
+        parts = []
+        for first, step, last in self.analyzed_runs:
+            if step is None:
+                parts.append(str(first))
+            elif step == 1:
+                parts.append(f"{first}-{last}")
+            else:
+                parts.append(f"{first}-{last} every {step}")
+        return ", ".join(parts)
+    
+    def _frame_record(self, frame_number: int, analysis: Dict, analyzed: bool) -> Dict:
+        """Build a compact JSON-serializable record for one frame"""
+        record = {
+            'frame': frame_number,
+            'time': round((frame_number - 1) / self.series.fps, 3) if self.series.fps else None,
+            'analyzed': analyzed,
+            'estimated_count': int(analysis['estimated_count']['estimated_count']),
+            'confidence': float(analysis['estimated_count']['confidence']),
+            'mean_density': float(analysis['overall']['mean_density']),
+            'max_density': float(analysis['overall']['max_density']),
+            'crowd_level': analysis['overall']['crowd_level'],
+            'highest_density_region': analysis['highest_density_region'],
+            'region_mean_density': {
+                name: float(stats['mean_density']) for name, stats in analysis['regions'].items()
+            }
+        }
+        if 'zones' in analysis:
+            record['zone_mean_density'] = {
+                name: float(stats['mean_density']) for name, stats in analysis['zones'].items()
+            }
+            record['zone_estimated_count'] = {
+                name: int(stats['estimated_count']) for name, stats in analysis['zones'].items()
+            }
+        if analyzed and analysis.get('hotspots'):
+            # Tracked on analyzed frames only
+            record['hotspots'] = analysis['hotspots']
+        if analyzed and analysis.get('flow'):
+            record['flow'] = analysis['flow']
+        return record
+    
+    def close(self):
+        """Flush and close the per-frame records file"""
+        if self._records_file:
+            self._records_file.close()
+            self._records_file = None
+    
+    def summary(self) -> Dict:
+        """Get video-wide aggregates"""
+        return {
+            'estimated_count': self.count_sketch.summary(),
+            'mean_density': self.density_sketch.summary()
+        }
+
+class FrameSeries:
+    # Scalar per-frame columns and their dtypes
+    SCALAR_COLUMNS = {
+        'frame': np.int32,
+        'analyzed': np.bool_,
+        'estimated_count': np.int32,
+        'confidence': np.float32,
+        'mean_density': np.float32,
+        'max_density': np.float32,
+        'crowd_level': np.uint8,  # Index into CROWD_LEVELS
+        'highest_density_region': np.uint8  # Index into region_names
+    }
+    
+    def __init__(self, fps: float = 0.0, capacity: int = 1024):
+        """Initialize columnar per-frame metrics for a video
+        
+        Each metric is a numpy column and per-region and per-zone values are
+        2-D columns (frames x regions), grown by doubling, so an hour of 30 fps
+        video takes a few MB and saving is one array write per column.
+        """
+        self.fps = fps
+        self.length = 0
+        self.region_names = []
+        self.zone_names = []
+        self._capacity = capacity
+        self._columns = None
+    
+    def _allocate(self, analysis: Dict):
+        """Create the columns, taking region and zone names from the first frame"""
+        self.region_names = list(analysis['regions'])
+        self.zone_names = list(analysis.get('zones', {}))
+        self._columns = {name: np.zeros(self._capacity, dtype=dtype) for name, dtype in self.SCALAR_COLUMNS.items()}
+        self._columns['region_mean_density'] = np.zeros((self._capacity, len(self.region_names)), dtype=np.float32)
+        self._columns['zone_mean_density'] = np.zeros((self._capacity, len(self.zone_names)), dtype=np.float32)
+        self._columns['zone_estimated_count'] = np.zeros((self._capacity, len(self.zone_names)), dtype=np.int32)
+    
+    def add(self, frame_number: int, analysis: Dict, analyzed: bool = True):
+        """Append one frame's metrics"""
+        if self._columns is None:
+            self._allocate(analysis)
+        if self.length == self._capacity:
+            self._capacity *= 2
+            for name, column in self._columns.items():
+                grown = np.zeros((self._capacity,) + column.shape[1:], dtype=column.dtype)
+                grown[:self.length] = column[:self.length]
+                self._columns[name] = grown
+        
+        i = self.length
+        columns = self._columns
+        columns['frame'][i] = frame_number
+        columns['analyzed'][i] = analyzed
+        columns['estimated_count'][i] = analysis['estimated_count']['estimated_count']
+        columns['confidence'][i] = analysis['estimated_count']['confidence']
+        columns['mean_density'][i] = analysis['overall']['mean_density']
+        columns['max_density'][i] = analysis['overall']['max_density']
+        columns['crowd_level'][i] = CROWD_LEVELS.index(analysis['overall']['crowd_level'])
+        columns['highest_density_region'][i] = self.region_names.index(analysis['highest_density_region'])
+        for j, name in enumerate(self.region_names):
+            columns['region_mean_density'][i, j] = analysis['regions'][name]['mean_density']
+        for j, name in enumerate(self.zone_names):
+            columns['zone_mean_density'][i, j] = analysis['zones'][name]['mean_density']
+            columns['zone_estimated_count'][i, j] = analysis['zones'][name]['estimated_count']
+        self.length += 1
+    
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Get the filled part of every column"""
+        if self._columns is None:
+            return {}
+        return {name: column[:self.length] for name, column in self._columns.items()}
+    
+    def downsample(self, max_points: int = 300) -> Dict:
+        """Get a JSON-ready time series of at most max_points buckets for charts
+        
+        Each point averages a bucket of consecutive frames ('estimated_count_max'
+        and 'max_density' keep the bucket maxima).
+        """
+        columns = self.columns()
+        if not columns:
+            return {'points': 0, 'frames_per_point': 0}
+        
+        starts = np.unique(np.linspace(0, self.length, min(max_points, self.length) + 1).astype(np.int64)[:-1])
+        sizes = np.diff(np.append(starts, self.length))
+        
+        def mean(column):
+            sums = np.add.reduceat(column.astype(np.float64), starts, axis=0)
+            return np.round(sums / sizes.reshape((-1,) + (1,) * (column.ndim - 1)), 4)
+        
+        frames = columns['frame'][starts]
+        series = {
+            'points': len(starts),
+            'frames_per_point': float(self.length / len(starts)),
+            'frame': frames.tolist(),
+            'time': np.round((frames - 1) / self.fps, 3).tolist() if self.fps else None,
+            'estimated_count': mean(columns['estimated_count']).tolist(),
+            'estimated_count_max': np.maximum.reduceat(columns['estimated_count'], starts).tolist(),
+            'confidence': mean(columns['confidence']).tolist(),
+            'mean_density': mean(columns['mean_density']).tolist(),
+            'max_density': np.round(np.maximum.reduceat(columns['max_density'], starts).astype(np.float64), 4).tolist(),
+            'regions': dict(zip(self.region_names, mean(columns['region_mean_density']).T.tolist()))
+        }
+        if self.zone_names:
+            zone_density = mean(columns['zone_mean_density']).T.tolist()
+            zone_count = mean(columns['zone_estimated_count']).T.tolist()
+            series['zones'] = {name: {'mean_density': zone_density[j], 'estimated_count': zone_count[j]}
+                               for j, name in enumerate(self.zone_names)}
+        return series
+    
+    def save(self, path: str):
+        """Save as NPZ, Parquet or Arrow IPC, chosen by the file extension"""
+        series_format = Path(path).suffix.lstrip('.')
+        if series_format == 'npz':
+            np.savez_compressed(path, fps=self.fps, region_names=np.array(self.region_names, dtype=str),
+                                zone_names=np.array(self.zone_names, dtype=str),
+                                crowd_levels=np.array(CROWD_LEVELS, dtype=str), **self.columns())
+        elif series_format in ('parquet', 'arrow'):
+            table = self.to_arrow()
+            if series_format == 'parquet':
+                pq.write_table(table, path, compression='zstd')
+            else:
+                with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+        else:
+            raise ValueError(f"Unknown series format: {series_format}")
+    
+    def to_arrow(self) -> 'pa.Table':
+        """Get a flat Arrow table: one column per metric, region and zone, categories dictionary-encoded"""
+        if pa is None:
+            raise ImportError("pyarrow is required for Parquet and Arrow series export")
+        columns = self.columns() or {name: np.zeros(0, dtype=dtype) for name, dtype in self.SCALAR_COLUMNS.items()}
+        
+        arrays = {name: pa.array(columns[name])
+                  for name in ('frame', 'analyzed', 'estimated_count', 'confidence', 'mean_density', 'max_density')}
+        arrays['crowd_level'] = pa.DictionaryArray.from_arrays(
+            pa.array(columns['crowd_level'].astype(np.int16)), pa.array(list(CROWD_LEVELS)))
+        arrays['highest_density_region'] = pa.DictionaryArray.from_arrays(
+            pa.array(columns['highest_density_region'].astype(np.int16)), pa.array(self.region_names, type=pa.string()))
+        for j, name in enumerate(self.region_names):
+            arrays[f"region_{name}_mean_density"] = pa.array(columns['region_mean_density'][:, j])
+        for j, name in enumerate(self.zone_names):
+            arrays[f"zone_{name}_mean_density"] = pa.array(columns['zone_mean_density'][:, j])
+            arrays[f"zone_{name}_estimated_count"] = pa.array(columns['zone_estimated_count'][:, j])
+        
+        metadata = {'fps': str(self.fps), 'region_names': json.dumps(self.region_names),
+                    'zone_names': json.dumps(self.zone_names)}
+        return pa.table(arrays, metadata=metadata)
+    
+    @classmethod
+    def load(cls, path: str) -> 'FrameSeries':
+        """Load a series saved by save"""
+        series_format = Path(path).suffix.lstrip('.')
+        series = cls()
+        if series_format == 'npz':
+            with np.load(path) as data:
+                series.fps = float(data['fps'])
+                series.region_names = data['region_names'].tolist()
+                series.zone_names = data['zone_names'].tolist()
+                columns = {name: data[name] for name in data.files
+                           if name not in ('fps', 'region_names', 'zone_names', 'crowd_levels')}
+        elif series_format in ('parquet', 'arrow'):
+            if pa is None:
+                raise ImportError("pyarrow is required to load Parquet and Arrow series")
+            if series_format == 'parquet':
+                table = pq.read_table(path)
+            else:
+                with pa.OSFile(path, 'rb') as source:
+                    table = pa.ipc.open_file(source).read_all()
+            columns = series._from_arrow(table)
+        else:
+            raise ValueError(f"Unknown series format: {series_format}")
+        
+        series._columns = columns
+        series.length = series._capacity = len(columns['frame'])
+        return series
+    
+    def _from_arrow(self, table: 'pa.Table') -> Dict[str, np.ndarray]:
+        """Rebuild columns (and names) from a table written by to_arrow"""
+        metadata = {key.decode(): value.decode() for key, value in (table.schema.metadata or {}).items()}
+        self.fps = float(metadata.get('fps', 0))
+        self.region_names = json.loads(metadata.get('region_names', '[]'))
+        self.zone_names = json.loads(metadata.get('zone_names', '[]'))
+        
+        def codes(name, categories):
+            # Dictionaries may come back reordered, so codes are mapped through the category names
+            array = table.column(name).combine_chunks()
+            if not pa.types.is_dictionary(array.type):
+                array = array.dictionary_encode()
+            lookup = np.array([categories.index(value) for value in array.dictionary.to_pylist()], dtype=np.uint8)
+            return lookup[array.indices.to_numpy(zero_copy_only=False)]
+        
+        def stack(template, names, dtype):
+            values = np.zeros((len(table), len(names)), dtype=dtype)
+            for j, name in enumerate(names):
+                values[:, j] = table.column(template.format(name)).to_numpy()
+            return values
+        
+        columns = {name: table.column(name).to_numpy().astype(dtype)
+                   for name, dtype in self.SCALAR_COLUMNS.items()
+                   if name not in ('crowd_level', 'highest_density_region')}
+        columns['crowd_level'] = codes('crowd_level', list(CROWD_LEVELS))
+        columns['highest_density_region'] = codes('highest_density_region', self.region_names)
+        columns['region_mean_density'] = stack("region_{}_mean_density", self.region_names, np.float32)
+        columns['zone_mean_density'] = stack("zone_{}_mean_density", self.zone_names, np.float32)
+        columns['zone_estimated_count'] = stack("zone_{}_estimated_count", self.zone_names, np.int32)
+        return columns
+
+class FeatureStore:
+    def __init__(self, path: str, max_side: int = 320):
+        """Initialize a writer of per-frame feature maps for re-analysis
+        
+        Each analyzed frame's extract_features stack is appended to path as
+        float16, downscaled (INTER_AREA) so its longest side is at most
+        max_side; the maps are already smoothed, so little is lost. The frame
+        numbers, shapes and feature parameters go to the .json file next to
+        it when the store is closed. Frames may be added from several threads
+        and in any order. The file is only opened with the first frame, so a
+        video that fails to open leaves nothing behind.
+        """
+        self.path = path
+        self.max_side = max_side
+        self.frames = []
+        self.map_shape = None
+        self._file = None
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def metadata_path(path: str) -> str:
+        return str(Path(path).with_suffix('.json'))
+    
+    def add(self, frame_number: int, features: np.ndarray):
+        """Append one frame's (3, height, width) feature maps"""
+        height, width = features.shape[1:]
+        scale = min(1.0, self.max_side / max(height, width)) if self.max_side else 1.0
+        if scale < 1.0:
+            size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+            features = np.stack([cv2.resize(feature, size, interpolation=cv2.INTER_AREA) for feature in features])
+        data = features.astype(np.float16).tobytes()
+        
+        with self._lock:
+            if self.map_shape is None:
+                self.map_shape = features.shape[1:]
+            elif features.shape[1:] != self.map_shape:
+                raise ValueError(f"Feature maps changed shape from {self.map_shape} to {features.shape[1:]}")
+            if self._file is None:
+                self._file = open(self.path, 'wb')
+            self._file.write(data)
+            self.frames.append(frame_number)
+    
+    def close(self, frame_shape: Tuple[int, ...], fps: float, params: Dict):
+        """Finish the store, recording the frame shape and the analyzer parameters the maps depend on"""
+        if self._file is None:
+            # No frames were analyzed
+            self._file = open(self.path, 'wb')
+        self._file.close()
+        metadata = {
+            'features': list(FEATURE_NAMES),
+            'dtype': 'float16',
+            'frame_shape': list(frame_shape),
+            'map_shape': list(self.map_shape) if self.map_shape else None,
+            'fps': fps,
+            'params': params,
+            'frames': self.frames
+        }
+        with open(self.metadata_path(self.path), 'w') as f:
+            json.dump(metadata, f)
+    
+    @staticmethod
+    def load(path: str) -> Tuple[np.ndarray, Dict]:
+        """Memory-map a store as (frames, 3, height, width) float16 rows plus its metadata
+        
+        Rows are in the order frames were added; metadata['frames'] gives the
+        frame number of each row.
+        """
+        with open(FeatureStore.metadata_path(path)) as f:
+            metadata = json.load(f)
+        if not metadata['frames']:
+            raise ValueError(f"Feature store has no frames: {path}")
+        shape = (len(metadata['frames']), len(metadata['features'])) + tuple(metadata['map_shape'])
+        return np.memmap(path, dtype=np.float16, mode='r', shape=shape), metadata
+
+class FrameWriterThread:
+    def __init__(self, writer: cv2.VideoWriter, queue_depth: int):
+        """Initialize a background encoder feeding a video writer from a bounded queue"""
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=queue_depth)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='crowd-encoder', daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        """Write queued frames until the end sentinel arrives"""
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            if self.error is None:
+                try:
+                    self.writer.write(frame)
+                except Exception as e:
+                    # Keep draining so the producer never blocks on a dead encoder
+                    self.error = e
+    
+    def write(self, frame: np.ndarray):
+        """Queue a frame for encoding"""
+        if self.error is not None:
+            raise self.error
+        self.queue.put(frame)
+    
+    def release(self):
+        """Flush queued frames and release the underlying writer"""
+        self.queue.put(None)
+        self.thread.join()
+        self.writer.release()
+        if self.error is not None:
+            raise self.error
+
+class PyAVCapture:
+    # Pixel formats whose first plane is the 8-bit luma (Y) plane
+    LUMA_FORMATS = ('yuv420p', 'yuvj420p', 'yuv422p', 'yuvj422p', 'yuv444p', 'yuvj444p', 'nv12', 'nv21', 'gray')
+    
+    # Video-range luma (16-235) to full-range grayscale, as cvtColor(BGR2GRAY) gives for decoded BGR
+    VIDEO_RANGE_LUT = np.clip(np.round((np.arange(256) - 16) * 255 / 219), 0, 255).astype(np.uint8)
+    
+    # AVCOL_RANGE_JPEG: luma already spans 0-255
+    FULL_RANGE = 2
+    
+    def __init__(self, video_path: str, luma: bool = False, threads: int = 0):
+        """Open a video with PyAV behind the part of the cv2.VideoCapture interface VideoProcessor uses
+        
+        Frames are decoded on FFmpeg's frame and slice threads (threads=0:
+        one per core). With luma, read returns each frame's luma plane as a
+        (height, width) uint8 array instead of BGR: a view of the decoded plane
+        for full-range video, or one lookup mapping video range to 0-255. This
+        skips the YUV to BGR and BGR to grayscale conversions of each frame.
+        """
+        if av is None:
+            raise ImportError("PyAV is required for the pyav decoder")
+        self.luma = luma
+        self._container = None
+        try:
+            self._container = av.open(video_path)
+            self._stream = self._container.streams.video[0]
+        except (av.error.FFmpegError, IndexError) as e:
+            logger.error(f"PyAV could not open {video_path}: {e}")
+            if self._container:
+                self._container.close()
+            self._container = None
+            return
+        
+        self._stream.thread_type = 'AUTO'
+        self._stream.thread_count = threads
+        self._rate = self._stream.average_rate or self._stream.guessed_rate
+        self._start = self._stream.start_time or 0
+        self._frame_count = self._stream.frames
+        if not self._frame_count and self._stream.duration and self._rate:
+            self._frame_count = int(round(self._stream.duration * self._stream.time_base * self._rate))
+        self._frames = self._container.decode(self._stream)
+        self._pending = None  # Frame decoded while seeking, returned by the next read
+        self._position = 0  # 0-based index of the next frame
+    
+    def isOpened(self) -> bool:
+        return self._container is not None
+    
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self._rate) if self._rate else 0.0
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self._frame_count)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._stream.codec_context.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._stream.codec_context.height)
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._position)
+        return 0.0
+    
+    def set(self, prop: int, value: float) -> bool:
+        """Seek to a 0-based frame index (the only settable property)
+        
+        Seeks to the nearest keyframe before the target by timestamp and
+        decodes forward to it; the first frame at or after the target is kept
+        for the next read.
+        """
+        if prop != cv2.CAP_PROP_POS_FRAMES or not self._rate:
+            return False
+        target = int(value)
+        self._container.seek(self._start + int(target / self._rate / self._stream.time_base), stream=self._stream)
+        self._frames = self._container.decode(self._stream)
+        self._pending = None
+        self._position = target
+        for frame in self._frames:
+            position = int(round((frame.pts - self._start) * self._stream.time_base * self._rate))
+            if position >= target:
+                self._pending, self._position = frame, position
+                break
+        return True
+    
+    def grab(self) -> bool:
+        return self._next_frame() is not None
+    
+    def read(self) -> Tuple[bool, np.ndarray]:
+        """Decode the next frame as BGR, or as its luma plane (None at the end)"""
+        frame = self._next_frame()
+        if frame is None:
+            return False, None
+        if not self.luma:
+            return True, frame.to_ndarray(format='bgr24')
+        if frame.format.name not in self.LUMA_FORMATS:
+            return True, frame.to_ndarray(format='gray')
+        
+        plane = frame.planes[0]
+        luma = np.frombuffer(plane, np.uint8, count=plane.line_size * plane.height)
+        luma = luma.reshape(plane.height, plane.line_size)[:, :plane.width]
+        if frame.color_range == self.FULL_RANGE or frame.format.name.startswith('yuvj'):
+            return True, luma
+        return True, cv2.LUT(luma, self.VIDEO_RANGE_LUT)
+    
+    def release(self):
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+    
+    def _next_frame(self):
+        """Get the next decoded av.VideoFrame (None at the end)"""
+        if self._pending is not None:
+            frame, self._pending = self._pending, None
+        else:
+            frame = next(self._frames, None)
+        if frame is not None:
+            self._position += 1
+        return frame
+
+class VideoProcessor:
+    def __init__(self, analyzer: CrowdDensityAnalyzer = None, workers: int = 1, queue_depth: int = None,
+                 sampler: FrameSampler = None, running_normalization: float = None, profiler: StageProfiler = None,
+                 decoder: str = 'opencv', flow_max_side: int = None):
+        """Initialize video processor
+        
+        With workers > 1, frames are decoded on a background thread, analyzed
+        by a pool of worker threads (OpenCV and NumPy release the GIL), put
+        back in order by a bounded reorder buffer and encoded on per-writer
+        threads. Output is frame-identical to the serial loop. queue_depth
+        bounds each queue (default: 2 * workers).
+        
+        An enabled sampler restricts analysis to keyframes; skipped frames are
+        filled from keyframe density maps and still written to the videos.
+        
+        running_normalization (the decay of a RunningNormalization, e.g. 0.05)
+        normalizes all frames of a video against one smoothed percentile
+        range. It depends on frame order, so frames are then analyzed
+        serially; encoding still runs on background threads.
+        
+        An enabled profiler records per-stage histograms for each video
+        (returned as video_stats['profile']) and accumulates them across videos.
+        
+        decoder is 'opencv' or 'pyav' (threaded decoding, see PyAVCapture).
+        Without a blended output video, the pyav decoder hands frames to the
+        analyzer as luma planes and BGR frames are never reconstructed.
+        
+        With flow_max_side, analyzed frames also get crowd flow (see
+        FlowEstimator) in analysis['flow'], from their analysis grayscale at
+        most that many pixels on a side (a fixed resolution, so results do not
+        depend on timing).
+        """
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        if decoder not in VIDEO_DECODERS:
+            raise ValueError(f"decoder must be one of {VIDEO_DECODERS}, got {decoder}")
+        if decoder == 'pyav' and av is None:
+            raise ImportError("PyAV is required for the pyav decoder")
+        self.analyzer = analyzer or CrowdDensityAnalyzer()
+        self.workers = workers
+        self.queue_depth = queue_depth or 2 * workers
+        self.sampler = sampler
+        self.running_normalization = running_normalization
+        self.profiler = profiler or StageProfiler(enabled=False)
+        self.decoder = decoder
+        self.flow_max_side = flow_max_side
+        
+    def process_video(self, video_path: str, output_path: str = None, heatmap_video_path: str = None,
+                      streaming: bool = False, records_path: str = None, progress=None,
+                      series_path: str = None, video_range: VideoRange = None,
+                      feature_store: FeatureStore = None) -> Dict:
+        """Process video file and generate analysis
+        
+        In streaming mode memory stays close to constant: per-frame analyses
+        are only written to records_path (JSON lines), kept as compact numpy
+        columns (video_stats['series'], saved to series_path) and summarized
+        by running statistics, and heatmap frames go only to the video writer.
+        
+        progress(frames_done, total_frames) is called after each frame is
+        written; an exception raised by it stops processing and propagates.
+        
+        With a video_range, decoding starts at the nearest keyframe before the
+        range and stops at its end; only frames in the range are analyzed and
+        written. Frame numbers and timestamps stay those of the whole video.
+        
+        With a feature_store, each analyzed frame's feature maps are added to
+        it (and the store closed) for later re-analysis.
+        """
         logger.info(f"Processing video: {video_path}")
         
-        cap = cv2.VideoCapture(video_path)
+        # Only the blended video needs BGR frames; analysis and heatmaps work from luma
+        if self.decoder == 'pyav':
+            cap = PyAVCapture(video_path, luma=not output_path)
+        else:
+            cap = cv2.VideoCapture(video_path)
         if not cap.isOpened():
             raise ValueError(f"Could not open video: {video_path}")
         
@@ -348,6 +2642,18 @@ class VideoProcessor:
         
         logger.info(f"Video properties: {width}x{height}, {fps} FPS, {total_frames} frames")
         
+        # Frames to process: first_frame to last_frame (None = until the video ends)
+        frame_rate = cap.get(cv2.CAP_PROP_FPS)
+        first_frame, last_frame = 1, None
+        if video_range:
+            try:
+                first_frame, last_frame = video_range.resolve(frame_rate, total_frames)
+            except ValueError:
+                cap.release()
+                raise
+            logger.info(f"Analyzing {video_range.describe()}: frames {first_frame}-{last_frame or 'end'}")
+        range_frames = last_frame - first_frame + 1 if last_frame else max(total_frames - first_frame + 1, 0)
+        
         # Initialize video writers
         writer = None
         heatmap_writer = None
@@ -360,166 +2666,1537 @@ class VideoProcessor:
             fourcc = cv2.VideoWriter_fourcc(*'mp4v')
             heatmap_writer = cv2.VideoWriter(heatmap_video_path, fourcc, fps, (width, height))
         
+        # Encode on background threads when pipelining
+        if self.workers > 1:
+            if writer:
+                writer = FrameWriterThread(writer, self.queue_depth)
+            if heatmap_writer:
+                heatmap_writer = FrameWriterThread(heatmap_writer, self.queue_depth)
+        
+        # Per-video profile, merged into the long-running profiler at the end
+        profiler = self.profiler
+        if profiler.enabled:
+            profiler = StageProfiler(track_allocations=self.profiler.track_allocations)
+        
+        # Keyframe sampling
+        sampler = self.sampler if self.sampler and self.sampler.enabled else None
+        filler = None
+        if sampler:
+            sampler.start(fps, first_frame)
+            logger.info(f"Frame sampling: {sampler.describe()}")
+            # Filled frames get their own generator so they never overwrite a keyframe's buffers
+            fill_heatmap_gen = HeatmapGenerator(reuse_buffers=self.workers == 1)
+            filler = KeyframeFiller(
+                sampler.fill,
+                lambda frame_number, frame, density_map, analysis, fill_label: self._annotate_frame(
+                    fill_heatmap_gen, frame, frame_number, total_frames, density_map, analysis,
+                    not streaming, fill_label, profiler),
+                self.analyzer
+            )
+        
+        # Start decoding at the range
+        if first_frame > 1:
+            with profiler.stage('seek'):
+                self._seek(cap, first_frame)
+        
         # Process frames
-        frame_count = 0
-        all_analyses = []
-        cumulative_density = np.zeros((height, width), dtype=np.float32)
-        heatmap_frames = []  # Store individual heatmap frames
+        stats = VideoStatistics(records_path, cap.get(cv2.CAP_PROP_FPS))
+        hotspot_tracker = HotspotTracker()
+        flow = FlowEstimator(self.flow_max_side) if self.flow_max_side else None
+        all_analyses = None if streaming else []
+        heatmap_frames = None if streaming else []  # Store individual heatmap frames
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            frame_count += 1
-            if frame_count % 30 == 0:  # Log every 30 frames
-                logger.info(f"Processing frame {frame_count}/{total_frames}")
-            
-            # Analyze frame
-            density_map, analysis = self.analyzer.analyze_frame(frame)
-            all_analyses.append(analysis)
-            
-            # Accumulate density for final heatmap
-            cumulative_density += density_map
+        def emit(frame_number: int, result: Tuple, analyzed: bool = True):
+            """Consume one rendered frame, in frame order"""
+            density_map, analysis, colored_heatmap, blended_frame, heatmap_copy = result
+            if frame_number % 30 == 0:  # Log every 30 frames
+                logger.info(f"Processing frame {frame_number}/{total_frames}")
             
-            # Generate heatmap for this frame
-            colored_heatmap, blended_frame = self.heatmap_gen.generate_heatmap(density_map, frame)
+            # Frames arrive here in order, so hotspots are tracked and flow estimated here rather than by the workers
+            if analyzed:
+                timestamp = (frame_number - 1) / frame_rate if frame_rate > 0 else frame_number
+                with profiler.stage('hotspot_tracking'):
+                    hotspot_tracker.update(analysis.get('hotspots', []), timestamp, (height, width))
+                if flow:
+                    with profiler.stage('flow'):
+                        frame_flow = flow.update(frame_number, density_map, timestamp, (height, width),
+                                                 self.analyzer.regions, self.analyzer.zones)
+                    if frame_flow:
+                        analysis['flow'] = frame_flow
             
-            # Store heatmap frame for video creation
-            heatmap_frames.append(colored_heatmap.copy())
-            
-            # Add frame info to blended frame
-            info_text = f"Frame: {frame_count}/{total_frames} | Count: {analysis['estimated_count']['estimated_count']} | Level: {analysis['overall']['crowd_level']}"
-            cv2.putText(blended_frame, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            
-            # Add frame info to heatmap frame
-            heatmap_info = f"Frame: {frame_count}/{total_frames} | Density: {analysis['overall']['mean_density']:.3f} | Level: {analysis['overall']['crowd_level']}"
-            cv2.putText(colored_heatmap, heatmap_info, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            with profiler.stage('statistics'):
+                stats.add(frame_number, density_map, analysis, analyzed)
+            if all_analyses is not None:
+                all_analyses.append(analysis)
+                heatmap_frames.append(heatmap_copy)
             
             # Write frames if output specified
-            if writer:
-                writer.write(blended_frame)
+            with profiler.stage('write'):
+                if writer:
+                    writer.write(blended_frame)
+                
+                if heatmap_writer:
+                    heatmap_writer.write(colored_heatmap)
             
+            if progress:
+                progress(frame_number - first_frame + 1, range_frames)
+        
+        # Running normalization is sequential state, so it rules out the analysis pool
+        normalizer = None
+        if self.running_normalization:
+            normalizer = RunningNormalization(self.running_normalization)
+            if self.workers > 1:
+                logger.warning("Running normalization needs frames in order; analyzing frames serially")
+        
+        try:
+            if self.workers > 1 and normalizer is None:
+                frame_count = self._run_pipeline(cap, total_frames, not streaming, sampler, filler, emit, profiler,
+                                                 first_frame, last_frame, feature_store, flow)
+            else:
+                frame_count = self._run_serial(cap, total_frames, not streaming, sampler, filler, emit, normalizer,
+                                               profiler, first_frame, last_frame, feature_store, flow)
+        finally:
+            cap.release()
+            stats.close()
+            if feature_store:
+                feature_store.close((height, width, 3), frame_rate, self.analyzer.feature_params())
+            if writer:
+                writer.release()
             if heatmap_writer:
-                heatmap_writer.write(colored_heatmap)
+                heatmap_writer.release()
         
-        cap.release()
-        if writer:
-            writer.release()
-        if heatmap_writer:
-            heatmap_writer.release()
+        if frame_count == 0:
+            raise ValueError(f"No frames could be read from video: {video_path}")
         
         # Generate final cumulative analysis
-        final_density = cumulative_density / frame_count
+        final_density = stats.cumulative_density / frame_count
         final_analysis = self.analyzer._analyze_distribution(final_density, (height, width, 3))
         
         # Calculate video-wide statistics
-        total_people = sum(analysis['estimated_count']['estimated_count'] for analysis in all_analyses)
+        summary = stats.summary()
+        total_people = int(summary['estimated_count']['sum'])
         avg_people_per_frame = total_people / frame_count
-        max_people = max(analysis['estimated_count']['estimated_count'] for analysis in all_analyses)
+        max_people = int(summary['estimated_count']['max'])
         
+        last_frame = first_frame + frame_count - 1
         video_stats = {
             'total_frames': frame_count,
+            'frame_shape': (height, width, 3),
+            'video_frames': total_frames,
+            'fps': frame_rate,
+            'range': video_range.describe() if video_range else None,
+            'first_frame': first_frame,
+            'last_frame': last_frame,
+            'start_time': (first_frame - 1) / frame_rate if frame_rate > 0 else None,
+            'end_time': last_frame / frame_rate if frame_rate > 0 else None,
             'total_people_detected': total_people,
             'average_people_per_frame': avg_people_per_frame,
             'max_people_in_frame': max_people,
+            'analyzed_frames': stats.analyzed_frames,
+            'analyzed_frame_ranges': stats.format_analyzed_frames(),
+            'sampling': sampler.describe() if sampler else None,
+            'statistics': summary,
+            'hotspot_tracks': hotspot_tracker.summary(),
+            'flow': flow.summary() if flow else None,
             'final_density_map': final_density,
             'final_analysis': final_analysis,
-            'frame_analyses': all_analyses,
-            'heatmap_frames': heatmap_frames
+            'series': stats.series
         }
         
+        if records_path:
+            video_stats['frame_records_path'] = records_path
+        if series_path:
+            stats.series.save(series_path)
+            video_stats['series_path'] = series_path
+        if feature_store:
+            video_stats['features_path'] = feature_store.path
+        if profiler.enabled:
+            video_stats['profile'] = profiler.summary()
+            self.profiler.merge(profiler)
+        if not streaming:
+            video_stats['frame_analyses'] = all_analyses
+            video_stats['heatmap_frames'] = heatmap_frames
+        
         return video_stats
+    
+    def _seek(self, cap, frame_number: int):
+        """Position cap so the next read returns frame_number (1-based)
+        
+        OpenCV's FFmpeg backend seeks to the nearest keyframe before the
+        target and decodes forward from there. Where a backend cannot seek,
+        or lands early, the remaining frames are skipped with grab(), which
+        does not convert them to BGR.
+        """
+        target = frame_number - 1
+        cap.set(cv2.CAP_PROP_POS_FRAMES, target)
+        position = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+        if position > target:
+            # Overshot: start again from the beginning
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            position = 0
+        if position < target:
+            logger.info(f"Seek landed at frame {position + 1}; skipping {target - position} frames")
+        while position < target and cap.grab():
+            position += 1
+    
+    def _render_frame(self, heatmap_gen: 'HeatmapGenerator', frame: np.ndarray, frame_number: int,
+                      total_frames: int, keep_heatmap: bool, normalizer: RunningNormalization = None,
+                      profiler: StageProfiler = None, feature_store: FeatureStore = None,
+                      flow: FlowEstimator = None) -> Tuple:
+        """Analyze, colorize and annotate a single frame"""
+        profiler = profiler or self.profiler
+        
+        # Analyze frame (through its stored feature maps when keeping them)
+        with profiler.stage('analyze'):
+            gray = self.analyzer.prepare_gray(frame, profiler)
+            if flow:
+                # Flow runs later, in frame order, on the same grayscale
+                with profiler.stage('flow_downscale'):
+                    flow.add_frame(frame_number, gray)
+            if feature_store:
+                features = self.analyzer.extract_features(frame, profiler, gray)
+                with profiler.stage('store_features'):
+                    feature_store.add(frame_number, features)
+                density_map, analysis = self.analyzer.analyze_features(features, frame.shape, normalizer, profiler)
+            else:
+                density_map, analysis = self.analyzer.analyze_frame(frame, normalizer, profiler, gray)
+        
+        return self._annotate_frame(heatmap_gen, frame, frame_number, total_frames, density_map, analysis, keep_heatmap,
+                                    profiler=profiler)
+    
+    def _annotate_frame(self, heatmap_gen: 'HeatmapGenerator', frame: np.ndarray, frame_number: int, total_frames: int,
+                        density_map: np.ndarray, analysis: Dict, keep_heatmap: bool, fill_label: str = None,
+                        profiler: StageProfiler = None) -> Tuple:
+        """Colorize and annotate a frame from its density map"""
+        profiler = profiler or self.profiler
+        
+        # Generate heatmap for this frame (luma frames are decoded only when there is no blended video)
+        with profiler.stage('heatmap'):
+            if frame.ndim == 2:
+                colored_heatmap = heatmap_gen.colorize(density_map, (frame.shape[1], frame.shape[0]))
+                blended_frame = None
+            else:
+                colored_heatmap, blended_frame = heatmap_gen.generate_heatmap(density_map, frame)
+        
+        # Keep an unannotated copy when heatmap frames are returned
+        heatmap_copy = colored_heatmap.copy() if keep_heatmap else None
+        
+        # Frame info for the blended and heatmap frames
+        info_text = f"Frame: {frame_number}/{total_frames} | Count: {analysis['estimated_count']['estimated_count']} | Level: {analysis['overall']['crowd_level']}"
+        heatmap_info = f"Frame: {frame_number}/{total_frames} | Density: {analysis['overall']['mean_density']:.3f} | Level: {analysis['overall']['crowd_level']}"
+        
+        # Mark frames filled from keyframes rather than analyzed
+        if fill_label:
+            info_text += f" | {fill_label.title()}"
+            heatmap_info += f" | {fill_label.title()}"
+        
+        if blended_frame is not None:
+            cv2.putText(blended_frame, info_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(colored_heatmap, heatmap_info, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        
+        return density_map, analysis, colored_heatmap, blended_frame, heatmap_copy
+    
+    def _emit_in_order(self, filler: KeyframeFiller, emit, frame_number: int, frame: np.ndarray, result: Tuple):
+        """Emit the next frame in order, filling skipped frames from keyframes"""
+        if filler is None:
+            emit(frame_number, result)
+            return
+        for ready in filler.push(frame_number, frame, result):
+            emit(*ready)
+    
+    def _run_serial(self, cap, total_frames: int, keep_heatmaps: bool,
+                    sampler: FrameSampler, filler: KeyframeFiller, emit,
+                    normalizer: RunningNormalization = None, profiler: StageProfiler = None,
+                    first_frame: int = 1, last_frame: int = None, feature_store: FeatureStore = None,
+                    flow: FlowEstimator = None) -> int:
+        """Decode, analyze and emit frames one at a time (first_frame to last_frame, or the end)"""
+        profiler = profiler or self.profiler
+        # Each frame is written before the next is rendered, so buffers can be reused
+        # unless writer threads still hold them; one generator per run keeps videos independent
+        heatmap_gen = HeatmapGenerator(reuse_buffers=self.workers == 1)
+        frame_number = first_frame - 1
+        while last_frame is None or frame_number < last_frame:
+            with profiler.stage('decode'):
+                ret, frame = cap.read()
+            if not ret:
+                break
+            
+            frame_number += 1
+            result = None
+            if sampler is None or sampler.is_keyframe(frame_number, frame):
+                result = self._render_frame(heatmap_gen, frame, frame_number, total_frames, keep_heatmaps,
+                                            normalizer, profiler, feature_store, flow)
+            self._emit_in_order(filler, emit, frame_number, frame, result)
+            
+        if filler:
+            for ready in filler.finish():
+                emit(*ready)
+            
+        return frame_number - first_frame + 1
+            
+    def _run_pipeline(self, cap, total_frames: int, keep_heatmaps: bool,
+                      sampler: FrameSampler, filler: KeyframeFiller, emit, profiler: StageProfiler = None,
+                      first_frame: int = 1, last_frame: int = None, feature_store: FeatureStore = None,
+                      flow: FlowEstimator = None) -> int:
+        """Decode on a thread, analyze on a worker pool and emit frames in order (first_frame to last_frame)"""
+        profiler = profiler or self.profiler
+        frame_queue = queue.Queue(maxsize=self.queue_depth)
+        result_queue = queue.Queue()
+        # Bounds frames between decode and emit, and with it the reorder buffer
+        in_flight = threading.Semaphore(self.queue_depth + self.workers)
+        stop = threading.Event()
+            
+        def put(q: queue.Queue, item) -> bool:
+            """Put an item unless the pipeline is stopping"""
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+            
+        def decode():
+            frame_number = first_frame - 1
+            try:
+                while not stop.is_set() and (last_frame is None or frame_number < last_frame):
+                    with profiler.stage('decode'):
+                        ret, frame = cap.read()
+                    if not ret:
+                        break
+                    frame_number += 1
+                    keyframe = sampler is None or sampler.is_keyframe(frame_number, frame)
+                    while not in_flight.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if not put(frame_queue, (frame_number, frame, keyframe)):
+                        return
+                result_queue.put(('end', frame_number, None))
+            except Exception as e:
+                result_queue.put(('error', frame_number, e))
+            finally:
+                for _ in range(self.workers):
+                    put(frame_queue, None)
+            
+        def analyze():
+            heatmap_gen = HeatmapGenerator()
+            while not stop.is_set():
+                try:
+                    item = frame_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is None:
+                    break
+                frame_number, frame, keyframe = item
+                try:
+                    if keyframe:
+                        result = self._render_frame(heatmap_gen, frame, frame_number, total_frames, keep_heatmaps,
+                                                    profiler=profiler, feature_store=feature_store, flow=flow)
+                        result_queue.put(('frame', frame_number, (None, result)))
+                    else:
+                        # Skipped frames pass through to be filled in order
+                        result_queue.put(('frame', frame_number, (frame, None)))
+                except Exception as e:
+                    result_queue.put(('error', frame_number, e))
+                    break
+            
+        threads = [threading.Thread(target=decode, name='crowd-decoder', daemon=True)]
+        threads += [threading.Thread(target=analyze, name=f'crowd-analyzer-{i}', daemon=True)
+                    for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+            
+        # Reorder buffer: emit frames strictly in decode order
+        pending = {}
+        next_frame = first_frame
+        end_frame = None
+        try:
+            while end_frame is None or next_frame <= end_frame:
+                kind, frame_number, payload = result_queue.get()
+                if kind == 'error':
+                    raise payload
+                if kind == 'end':
+                    end_frame = frame_number
+                    continue
+        
+                pending[frame_number] = payload
+                while next_frame in pending:
+                    frame, result = pending.pop(next_frame)
+                    self._emit_in_order(filler, emit, next_frame, frame, result)
+                    # Frames held by the filler are bounded by the keyframe gap
+                    in_flight.release()
+                    next_frame += 1
+        
+            if filler:
+                for ready in filler.finish():
+                    emit(*ready)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        
+        return end_frame - first_frame + 1
+        
+class TiledImageProcessor:
+    def __init__(self, analyzer: CrowdDensityAnalyzer, tile_size: int = 2048, workers: int = 1,
+                 preview_max_side: int = 4096, profiler: StageProfiler = None):
+        """Initialize tiled analysis of images too large to analyze in one piece (e.g. orthomosaics)
+        
+        The image is decoded once as grayscale and written, at the analysis
+        resolution, to a memory-mapped raster; from then on everything works
+        on tile_size tiles read back from disk by a pool of worker threads.
+        Each tile is read with a halo wider than the kernels' support and only
+        its core is kept, so tiles join without seams. Percentiles for the
+        normalization come from one histogram of the whole image (a second
+        pass), so results match analyze_frame up to Canny edges that cross
+        tile borders.
+        """
+        if tile_size < 64:
+            raise ValueError(f"tile_size must be at least 64, got {tile_size}")
+        self.analyzer = analyzer
+        self.tile_size = tile_size
+        self.workers = workers
+        self.preview_max_side = preview_max_side
+        self.profiler = profiler or StageProfiler(enabled=False)
+    
+    def _tiles(self, shape: Tuple[int, int]) -> List[Tuple[int, int, int, int]]:
+        """Get the (top, bottom, left, right) core of every tile"""
+        height, width = shape
+        return [(top, min(top + self.tile_size, height), left, min(left + self.tile_size, width))
+                for top in range(0, height, self.tile_size) for left in range(0, width, self.tile_size)]
+    
+    @staticmethod
+    def _read_tile(raster: np.ndarray, core: Tuple[int, int, int, int], halo: int) -> Tuple[np.ndarray, Tuple]:
+        """Copy a tile core plus halo out of a raster; returns it and the core's slices within it"""
+        top, bottom, left, right = core
+        height, width = raster.shape[:2]
+        y0, y1 = max(0, top - halo), min(height, bottom + halo)
+        x0, x1 = max(0, left - halo), min(width, right + halo)
+        return np.array(raster[y0:y1, x0:x1]), (slice(top - y0, bottom - y0), slice(left - x0, right - x0))
+    
+    def _map(self, function, items: List):
+        """Run function over items on the worker threads, in order"""
+        if self.workers <= 1:
+            return [function(item) for item in items]
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='crowd-tile') as executor:
+            return list(executor.map(function, items))
+    
+    def process(self, image_path: str, density_path: str) -> Tuple[np.ndarray, Dict, np.ndarray, np.ndarray]:
+        """Analyze an image tile by tile
+        
+        The density map is written to density_path (.npy) and returned
+        memory-mapped, with the analysis and preview-sized (preview_max_side)
+        density map and image for the heatmap outputs.
+        """
+        analyzer = self.analyzer
+        profiler = self.profiler
+        work_dir = tempfile.mkdtemp(prefix='.tiles-', dir=os.path.dirname(os.path.abspath(density_path)))
+        try:
+            # The one full-size step: grayscale decode (1 byte per pixel), downscaled in strips to the raster
+            with profiler.stage('decode'):
+                gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+            if gray is None:
+                raise ValueError(f"Could not read image: {image_path}")
+            frame_shape = gray.shape + (3,)
+            scale = analyzer.get_analysis_scale(frame_shape)
+            shape = (max(1, int(round(gray.shape[0] * scale))), max(1, int(round(gray.shape[1] * scale))))
+            logger.info(f"Tiled analysis of {gray.shape[1]}x{gray.shape[0]} image at {shape[1]}x{shape[0]} "
+                        f"in {len(self._tiles(shape))} tiles of {self.tile_size}")
+            
+            raster = np.lib.format.open_memmap(os.path.join(work_dir, 'gray.npy'), mode='w+', dtype=np.uint8,
+                                               shape=shape)
+            with profiler.stage('downscale'):
+                strip = self.tile_size
+                for top in range(0, shape[0], strip):
+                    bottom = min(top + strip, shape[0])
+                    if scale < 1.0:
+                        source = gray[int(top / scale):min(gray.shape[0], int(round(bottom / scale)))]
+                        raster[top:bottom] = cv2.resize(source, (shape[1], bottom - top), interpolation=cv2.INTER_AREA)
+                    else:
+                        raster[top:bottom] = gray[top:bottom]
+            del gray
+            raster.flush()
+            
+            tiles = self._tiles(shape)
+            
+            # Pass 1: weighted density per tile (halo covers the pre-blur, variance window and smoothing blur)
+            halo = sum(analyzer._scaled_kernel(size, scale) for size in (
+                analyzer.blur_kernel_size, analyzer.variance_window, analyzer.density_blur_size)) + 2
+            combined = np.lib.format.open_memmap(os.path.join(work_dir, 'combined.npy'), mode='w+',
+                                                 dtype=np.float32, shape=shape)
+            
+            def density_tile(core):
+                with profiler.stage('tile_density'):
+                    tile, inner = self._read_tile(raster, core, halo)
+                    density = analyzer._calculate_combined_density(tile, scale)[inner]
+                    combined[core[0]:core[1], core[2]:core[3]] = density
+                    low, high, _, _ = cv2.minMaxLoc(density)
+                    return low, high
+            
+            ranges = self._map(density_tile, tiles)
+            low = min(low for low, _ in ranges)
+            high = max(high for _, high in ranges)
+            
+            # Pass 2: global percentiles from one histogram over all tiles
+            with profiler.stage('tile_histogram'):
+                if high > low:
+                    bins = analyzer.percentile_bins
+                    bin_width = (high - low) * (1 + 1e-6) / bins
+                    hist = np.zeros(bins, dtype=np.float64)
+                    for top in range(0, shape[0], self.tile_size):
+                        hist += cv2.calcHist([np.array(combined[top:top + self.tile_size])], [0], None, [bins],
+                                             [low, low + bin_width * bins]).ravel()
+                    percentile_5, percentile_95 = analyzer._histogram_percentiles(hist, low, bin_width, (5, 95))
+                else:
+                    percentile_5 = percentile_95 = low
+            
+            # Pass 3: normalize and smooth each tile into the output density map
+            smooth_size = analyzer._scaled_kernel(15, scale)
+            density_map = np.lib.format.open_memmap(density_path, mode='w+', dtype=np.float32, shape=shape)
+            
+            def normalize_tile(core):
+                with profiler.stage('tile_normalize'):
+                    tile, inner = self._read_tile(combined, core, smooth_size)
+                    np.clip(tile, percentile_5, percentile_95, out=tile)
+                    if percentile_95 > percentile_5:
+                        tile -= percentile_5
+                        tile *= 1.0 / (percentile_95 - percentile_5)
+                    else:
+                        tile[:] = 0
+                    density = cv2.GaussianBlur(tile, (smooth_size, smooth_size), 0)[inner]
+                    density_map[core[0]:core[1], core[2]:core[3]] = density
+                    return float(density.max())
+            
+            max_density = max(self._map(normalize_tile, tiles))
+            density_map.flush()
+            
+            # Pass 4: statistics tile by tile
+            with profiler.stage('tile_statistics'):
+                analysis = self._measure(density_map, tiles, frame_shape, max_density)
+            
+            # Preview-sized density map and image for the heatmap outputs
+            with profiler.stage('preview'):
+                preview_density, preview_frame = self._preview(image_path, density_map, frame_shape)
+            
+            # Hotspots need far less resolution than the preview has
+            with profiler.stage('hotspots'):
+                analysis['hotspots'] = analyzer.find_hotspots(preview_density, frame_shape)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+        return density_map, analysis, preview_density, preview_frame
+    
+    def _measure(self, density_map: np.ndarray, tiles: List, frame_shape: Tuple, max_density: float) -> Dict:
+        """Build the analyze_frame analysis from per-tile sums"""
+        analyzer = self.analyzer
+        height, width = density_map.shape
+        pixel_scale = (frame_shape[0] * frame_shape[1]) / (height * width)
+        high_threshold = max_density * analyzer.count_threshold
+        
+        regions = TiledZoneStatistics(analyzer.regions, density_map.shape)
+        zones = TiledZoneStatistics(analyzer.zones, density_map.shape) if analyzer.zones else None
+        row_weights = analyzer.perspective.row_weights(density_map.shape, frame_shape) if analyzer.perspective else None
+        total, total_squares, high_pixels, people = 0.0, 0.0, 0, 0.0
+        for top, bottom, left, right in tiles:
+            tile = np.array(density_map[top:bottom, left:right])
+            total += cv2.sumElems(tile)[0]
+            total_squares += float(cv2.norm(tile, cv2.NORM_L2SQR))
+            high_pixels += cv2.countNonZero((tile > high_threshold).view(np.uint8))
+            if row_weights is not None:
+                counted = cv2.threshold(tile, high_threshold, 0, cv2.THRESH_TOZERO)[1]
+                people += TiledZoneStatistics._people(counted, row_weights[top:bottom])
+            regions.add(tile, top, left, high_threshold)
+            if zones:
+                zones.add(tile, top, left, high_threshold, row_weights)
+        
+        pixels = height * width
+        mean_density = total / pixels
+        density_std = np.sqrt(max(0.0, total_squares / pixels - mean_density ** 2))
+        if row_weights is not None:
+            estimated_count = analyzer._count_from_people(people, density_std, high_pixels * pixel_scale)
+        else:
+            estimated_count = analyzer._count_from_statistics(mean_density, density_std, high_pixels * pixel_scale)
+        
+        region_stats = regions.results(pixel_scale, analyzer._classify_crowd_level)
+        analysis = {
+            'regions': region_stats,
+            'overall': {
+                'mean_density': mean_density,
+                'max_density': max_density,
+                'total_density': total * pixel_scale,
+                'crowd_level': analyzer._classify_crowd_level(mean_density)
+            },
+            'highest_density_region': max(region_stats, key=lambda k: region_stats[k]['mean_density']),
+            'estimated_count': estimated_count
+        }
+        if zones:
+            analysis['zones'] = zones.results(pixel_scale, analyzer._classify_crowd_level,
+                                              estimated_count['estimated_count'],
+                                              people if row_weights is not None else high_pixels)
+        return analysis
+        
+    def _preview(self, image_path: str, density_map: np.ndarray, frame_shape: Tuple) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the density map and image at most preview_max_side pixels on a side, reading both in strips"""
+        height, width = density_map.shape
+        factor = max(1, int(np.ceil(max(height, width) / self.preview_max_side)))
+        preview_shape = (max(1, height // factor), max(1, width // factor))
+        preview_density = np.empty(preview_shape, dtype=np.float32)
+        rows = max(1, self.tile_size // factor)
+        for top in range(0, preview_shape[0], rows):
+            bottom = min(top + rows, preview_shape[0])
+            strip = density_map[top * factor:bottom * factor, :preview_shape[1] * factor]
+            preview_density[top:bottom] = cv2.resize(np.array(strip), (preview_shape[1], bottom - top),
+                                                     interpolation=cv2.INTER_AREA)
+        
+        # JPEG and other decoders can decode at 1/2, 1/4 or 1/8 size directly
+        frame_scale = min(1.0, self.preview_max_side / max(frame_shape[:2]))
+        size = (max(1, int(frame_shape[1] * frame_scale)), max(1, int(frame_shape[0] * frame_scale)))
+        reduce = max([r for r in (1, 2, 4, 8) if r <= 1 / frame_scale])
+        flag = {1: cv2.IMREAD_COLOR, 2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4,
+                8: cv2.IMREAD_REDUCED_COLOR_8}[reduce]
+        frame = cv2.imread(image_path, flag)
+        if frame.shape[1] != size[0] or frame.shape[0] != size[1]:
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return preview_density, frame
+
+class LumaChromaImage:
+    def __init__(self, image_path: str):
+        """Initialize a full-size color image assembled in row bands from luma and half-size chroma
+        
+        Holds the full-size grayscale (1 byte per pixel, as tiled analysis
+        decodes) and the chroma of a half-size color decode (half a byte per
+        pixel), instead of the 3 bytes per pixel of a full color decode. Row
+        slices, image[top:bottom], are converted back to BGR on demand. Camera
+        JPEGs store chroma at half size (4:2:0) anyway, so little is lost.
+        """
+        # Chroma first, so the half-size color decode is gone before the full-size luma is decoded
+        reduced = cv2.imread(image_path, cv2.IMREAD_REDUCED_COLOR_2)
+        if reduced is None:
+            raise ValueError(f"Could not read image: {image_path}")
+        self.chroma = np.ascontiguousarray(cv2.cvtColor(reduced, cv2.COLOR_BGR2YCrCb)[:, :, 1:])
+        del reduced
+        self.luma = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if self.luma is None:
+            raise ValueError(f"Could not read image: {image_path}")
+        height, width = self.luma.shape
+        self.shape = (height, width, 3)
+        
+        # Chroma row and column of every full-size row and column (nearest, as 4:2:0 decoders replicate)
+        self._chroma_rows = np.minimum(np.arange(height) * self.chroma.shape[0] // height, self.chroma.shape[0] - 1)
+        self._chroma_columns = np.minimum(np.arange(width) * self.chroma.shape[1] // width, self.chroma.shape[1] - 1)
+    
+    def __getitem__(self, rows: slice) -> np.ndarray:
+        """Get a band of full-size rows in BGR"""
+        luma = self.luma[rows]
+        chroma = self.chroma[self._chroma_rows[rows]][:, self._chroma_columns]
+        return cv2.cvtColor(cv2.merge([luma, chroma[:, :, 0], chroma[:, :, 1]]), cv2.COLOR_YCrCb2BGR)
+
+class TilePyramid:
+    def __init__(self, heatmap_gen: HeatmapGenerator, tile_size: int = 256, workers: int = 1, jpeg_quality: int = 85):
+        """Initialize tile pyramid building for zoomable heatmap and blended views
+        
+        Each layer is saved as an MBTiles (SQLite) file of XYZ tiles: the
+        highest zoom is the full-size image, each zoom below halves it, and at
+        zoom 0 it fits one tile. As in Deep Zoom, tiles on the right and bottom
+        edges are cropped to the image rather than padded.
+        """
+        if tile_size < 64:
+            raise ValueError(f"tile_size must be at least 64, got {tile_size}")
+        self.heatmap_gen = heatmap_gen
+        self.tile_size = tile_size
+        self.workers = workers
+        self.jpeg_quality = jpeg_quality
+    
+    @staticmethod
+    def max_zoom(shape: Tuple[int, ...], tile_size: int) -> int:
+        """Get the number of halvings until an image of shape fits one tile"""
+        zoom, side = 0, max(shape[:2])
+        while side > tile_size:
+            side = (side + 1) // 2
+            zoom += 1
+        return zoom
+    
+    @staticmethod
+    def path(output_dir: str, base_name: str, layer: str) -> str:
+        return os.path.join(output_dir, f"{base_name}_{layer}_tiles.mbtiles")
+    
+    def build(self, density_map: np.ndarray, frame: np.ndarray, output_dir: str, base_name: str) -> Dict:
+        """Build the heatmap and blended pyramids of a frame from its density map (at any resolution)
+        
+        Zooms are built from full size down, a row of tiles at a time; each
+        row is downscaled into the next zoom's memory-mapped raster, so beyond
+        the frame itself only a few rows of tiles are held in memory. The
+        frame is only sliced in row bands, so it can be a LumaChromaImage.
+        Returns the pyramid metadata.
+        """
+        height, width = frame.shape[:2]
+        tile_size = self.tile_size
+        metadata = {'width': width, 'height': height, 'tile_size': tile_size,
+                    'max_zoom': self.max_zoom(frame.shape, tile_size)}
+        paths = {layer: self.path(output_dir, base_name, layer) for layer in PYRAMID_LAYERS}
+        connections = {}
+        work_dir = tempfile.mkdtemp(prefix='.pyramid-', dir=output_dir)
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='crowd-pyramid') \
+            if self.workers > 1 else None
+        try:
+            # Written under temporary names so readers never see a partial pyramid
+            for layer, tile_format in PYRAMID_LAYERS.items():
+                connections[layer] = self._create(f"{paths[layer]}.tmp", dict(
+                    metadata, name=f"{base_name} {layer}", format=tile_format))
+            
+            level = None  # Heatmap and blended rasters of the zoom being written, below full size
+            shape = (height, width)
+            for zoom in range(metadata['max_zoom'], -1, -1):
+                next_shape = ((shape[0] + 1) // 2, (shape[1] + 1) // 2)
+                next_level = None
+                if zoom > 0:
+                    next_level = tuple(np.lib.format.open_memmap(
+                        os.path.join(work_dir, f"{zoom - 1}_{layer}.npy"), mode='w+', dtype=np.uint8,
+                        shape=next_shape + (3,)) for layer in PYRAMID_LAYERS)
+                
+                for top in range(0, shape[0], tile_size):
+                    bottom = min(top + tile_size, shape[0])
+                    if level is None:
+                        heatmap = self.heatmap_gen.colorize_rows(density_map, (width, height), top, bottom)
+                        alpha = self.heatmap_gen.alpha
+                        strips = (heatmap, cv2.addWeighted(frame[top:bottom], 1 - alpha, heatmap, alpha, 0))
+                    else:
+                        strips = tuple(np.array(raster[top:bottom]) for raster in level)
+                    
+                    for (layer, tile_format), strip in zip(PYRAMID_LAYERS.items(), strips):
+                        self._write_row(connections[layer], executor, zoom, top // tile_size, strip, tile_format)
+                    
+                    if next_level:
+                        rows = (bottom - top + 1) // 2
+                        for raster, strip in zip(next_level, strips):
+                            raster[top // 2:top // 2 + rows] = cv2.resize(strip, (next_shape[1], rows),
+                                                                          interpolation=cv2.INTER_AREA)
+                level, shape = next_level, next_shape
+            
+            for layer, connection in connections.items():
+                connection.commit()
+                connection.close()
+                os.replace(f"{paths[layer]}.tmp", paths[layer])
+        finally:
+            if executor:
+                executor.shutdown()
+            for layer, connection in connections.items():
+                connection.close()
+                if os.path.exists(f"{paths[layer]}.tmp"):
+                    os.remove(f"{paths[layer]}.tmp")
+            shutil.rmtree(work_dir, ignore_errors=True)
+        
+        logger.info(f"Built {metadata['max_zoom'] + 1}-zoom tile pyramids of {width}x{height}")
+        return metadata
+    
+    @staticmethod
+    def _create(path: str, metadata: Dict) -> sqlite3.Connection:
+        """Create an empty MBTiles file with its metadata"""
+        if os.path.exists(path):
+            os.remove(path)
+        connection = sqlite3.connect(path)
+        connection.executescript("""
+            PRAGMA journal_mode = OFF;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE metadata (name TEXT, value TEXT);
+            CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+            CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row);
+        """)
+        connection.executemany('INSERT INTO metadata VALUES (?, ?)', [
+            ('name', metadata['name']), ('format', metadata['format']), ('minzoom', '0'),
+            ('maxzoom', str(metadata['max_zoom'])), ('width', str(metadata['width'])),
+            ('height', str(metadata['height'])), ('tile_size', str(metadata['tile_size']))])
+        return connection
+    
+    def _write_row(self, connection: sqlite3.Connection, executor: ThreadPoolExecutor, zoom: int, row: int,
+                   strip: np.ndarray, tile_format: str):
+        """Encode a row of tiles and insert them"""
+        params = [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality] if tile_format == 'jpg' else []
+        
+        def encode(left):
+            _, data = cv2.imencode(f".{tile_format}", strip[:, left:left + self.tile_size], params)
+            return data.tobytes()
+        
+        lefts = range(0, strip.shape[1], self.tile_size)
+        tiles = executor.map(encode, lefts) if executor else map(encode, lefts)
+        # MBTiles counts rows from the bottom (TMS)
+        connection.executemany('INSERT INTO tiles VALUES (?, ?, ?, ?)',
+                               [(zoom, column, (1 << zoom) - 1 - row, data) for column, data in enumerate(tiles)])
+    
+    @staticmethod
+    def read_metadata(path: str) -> Dict:
+        """Get the size, tile size and zoom range of a pyramid file"""
+        connection = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+        try:
+            values = dict(connection.execute('SELECT name, value FROM metadata'))
+        finally:
+            connection.close()
+        return {'width': int(values['width']), 'height': int(values['height']),
+                'tile_size': int(values['tile_size']), 'max_zoom': int(values['maxzoom'])}
+    
+    @staticmethod
+    def read_tile(path: str, zoom: int, column: int, row: int) -> bytes:
+        """Get an encoded XYZ tile from a pyramid file (None outside the pyramid)"""
+        if not 0 <= zoom <= 30 or not 0 <= row < (1 << zoom):
+            return None
+        connection = sqlite3.connect(f"{Path(path).absolute().as_uri()}?mode=ro", uri=True)
+        try:
+            tile = connection.execute(
+                'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+                (zoom, column, (1 << zoom) - 1 - row)).fetchone()
+        finally:
+            connection.close()
+        return tile[0] if tile else None
+
+class LatestFrameGrabber:
+    def __init__(self, source, reconnect_delay: float = 2.0):
+        """Initialize a capture thread that keeps only the newest frame of a source
+        
+        source is a camera index or an RTSP/HTTP URL (a video file plays back
+        at its own frame rate). The thread reads frames as fast as the source
+        delivers them, so the capture buffer never fills with stale frames; a
+        frame that is not taken before the next one arrives is dropped.
+        Network sources are reopened after reconnect_delay when they fail.
+        """
+        self.source = source
+        self.reconnect_delay = reconnect_delay
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.reconnects = 0
+        self.fps = 0.0  # Measured source frame rate (exponentially weighted)
+        self.ended = False
+        
+        self._frame = None
+        self._sequence = 0
+        self._taken = 0
+        self._captured_at = 0.0
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._cap = None
+        self._thread = None
+    
+    def _open(self) -> cv2.VideoCapture:
+        cap = cv2.VideoCapture(self.source)
+        # Backends that support it keep a one-frame buffer
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+    
+    def start(self):
+        """Open the source and start capturing; raises ValueError if it cannot be opened"""
+        self._cap = self._open()
+        if not self._cap.isOpened():
+            raise ValueError(f"Could not open stream: {self.source}")
+        self._thread = threading.Thread(target=self._run, name='crowd-grabber', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        """Capture loop"""
+        cap = self._cap
+        interval = 1.0 / cap.get(cv2.CAP_PROP_FPS) if self.is_file and cap.get(cv2.CAP_PROP_FPS) > 0 else 0.0
+        next_time = time.monotonic()
+        last_capture = None
+        try:
+            while not self._stop.is_set():
+                ok, frame = cap.read()
+                if not ok:
+                    if self.is_file:
+                        break
+                    logger.warning(f"Stream read failed, reconnecting in {self.reconnect_delay:.0f} s: {self.source}")
+                    cap.release()
+                    if self._stop.wait(self.reconnect_delay):
+                        break
+                    cap = self._cap = self._open()
+                    self.reconnects += 1
+                    continue
+                
+                # Files play back in real time, like a live source
+                if interval:
+                    next_time += interval
+                    delay = next_time - time.monotonic()
+                    if delay > 0 and self._stop.wait(delay):
+                        break
+                
+                now = time.monotonic()
+                if last_capture is not None and now > last_capture:
+                    self.fps = 0.9 * self.fps + 0.1 / (now - last_capture) if self.fps else 1.0 / (now - last_capture)
+                last_capture = now
+                
+                with self._condition:
+                    if self._sequence > self._taken:
+                        self.frames_dropped += 1
+                    self._frame = frame
+                    self._sequence += 1
+                    self._captured_at = time.time()
+                    self.frames_read += 1
+                    self._condition.notify_all()
+        finally:
+            cap.release()
+            with self._condition:
+                self.ended = True
+                self._condition.notify_all()
+    
+    def read(self, timeout: float = 5.0) -> Tuple:
+        """Wait for a frame newer than the last one read
+        
+        Returns (sequence, frame, captured_at) with captured_at in epoch
+        seconds, or None on timeout or once the source has ended.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._sequence > self._taken or self.ended, timeout)
+            if self._sequence <= self._taken:
+                return None
+            self._taken = self._sequence
+            return self._sequence, self._frame, self._captured_at
+    
+    def stop(self):
+        """Stop capturing and release the source"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+class LiveAnalysis:
+    def __init__(self, analyzer: CrowdDensityAnalyzer, frame_budget: float = 0.5, window: float = 10.0,
+                 output_max_side: int = 960, min_scale: float = 0.05, flow: FlowEstimator = None):
+        """Initialize live analysis of the newest frames of a stream
+        
+        Each frame's analysis, heatmap and JPEG encoding should fit in
+        frame_budget seconds: the analysis scale drops when a frame runs over
+        and recovers toward the configured scale when frames finish well
+        inside it. With the newest-frame policy, capture-to-heatmap latency is
+        then bounded by one source frame interval plus the budget, whatever the
+        input frame rate. Rolling statistics cover the last window seconds.
+        The analyzer is copied, so scale changes never affect other users.
+        With a flow estimator, updates also carry crowd flow between frames.
+        """
+        if frame_budget <= 0:
+            raise ValueError(f"frame_budget must be positive, got {frame_budget}")
+        self.analyzer = copy.copy(analyzer)
+        self.analyzer.profiler = StageProfiler(enabled=False)  # Not shared across threads
+        self.heatmap_gen = HeatmapGenerator(reuse_buffers=True)
+        self.frame_budget = frame_budget
+        self.window = window
+        self.output_max_side = output_max_side
+        self.min_scale = min_scale
+        self.frames_analyzed = 0
+        self._recent = deque()  # (time, estimated count, mean density) within the window
+        self._max_scale = None
+        self.hotspot_tracker = HotspotTracker()
+        self.flow = flow
+    
+    def _adapt_scale(self, elapsed: float):
+        """Adjust the analysis scale so frames fit the time budget (cost grows with scale squared)"""
+        scale = self.analyzer.analysis_scale
+        if elapsed > self.frame_budget:
+            scale *= max(0.5, 0.9 * (self.frame_budget / elapsed) ** 0.5)
+        elif elapsed < 0.5 * self.frame_budget:
+            scale *= 1.1
+        self.analyzer.analysis_scale = float(min(max(scale, self.min_scale), self._max_scale))
+    
+    def process(self, frame: np.ndarray, captured_at: float) -> Tuple[Dict, bytes]:
+        """Analyze one frame; returns the update and the blended heatmap as JPEG bytes"""
+        start = time.perf_counter()
+        if self._max_scale is None:
+            # Fold analysis_max_side into the scale so the budget controls a single knob
+            self._max_scale = self.analyzer.get_analysis_scale(frame.shape)
+            self.analyzer.analysis_scale = self._max_scale
+            self.analyzer.analysis_max_side = None
+        scale = self.analyzer.analysis_scale
+        
+        gray = self.analyzer.prepare_gray(frame)
+        density_map, analysis = self.analyzer.analyze_frame(frame, gray=gray)
+        hotspots = self.hotspot_tracker.update(analysis['hotspots'], captured_at, frame.shape)
+        flow = None
+        if self.flow:
+            self.flow.add_frame(self.frames_analyzed, gray)
+            flow = self.flow.update(self.frames_analyzed, density_map, captured_at, frame.shape,
+                                    self.analyzer.regions, self.analyzer.zones)
+        
+        # Heatmap output at display size
+        output_scale = min(1.0, self.output_max_side / max(frame.shape[:2]))
+        if output_scale < 1.0:
+            frame = cv2.resize(frame, None, fx=output_scale, fy=output_scale, interpolation=cv2.INTER_AREA)
+        _, blended_frame = self.heatmap_gen.generate_heatmap(density_map, frame)
+        jpeg = cv2.imencode('.jpg', blended_frame, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+        
+        elapsed = time.perf_counter() - start
+        self._adapt_scale(elapsed)
+        self.frames_analyzed += 1
+        
+        # Rolling statistics
+        now = time.time()
+        count = int(analysis['estimated_count']['estimated_count'])
+        self._recent.append((now, count, float(analysis['overall']['mean_density'])))
+        while self._recent[0][0] < now - self.window:
+            self._recent.popleft()
+        counts = [entry[1] for entry in self._recent]
+        span = now - self._recent[0][0]
+        
+        update = {
+            'captured_at': captured_at,
+            'latency_ms': (now - captured_at) * 1000,
+            'processing_ms': elapsed * 1000,
+            'analysis_scale': scale,
+            'estimated_count': count,
+            'confidence': float(analysis['estimated_count']['confidence']),
+            'crowd_level': analysis['overall']['crowd_level'],
+            'mean_density': float(analysis['overall']['mean_density']),
+            'max_density': float(analysis['overall']['max_density']),
+            'highest_density_region': analysis['highest_density_region'],
+            'regions': {name: float(stats['mean_density']) for name, stats in analysis['regions'].items()},
+            'hotspots': hotspots,
+            'flow': flow,
+            'rolling': {
+                'window_seconds': self.window,
+                'frames': len(counts),
+                'count_mean': float(np.mean(counts)),
+                'count_max': max(counts),
+                'mean_density': float(np.mean([entry[2] for entry in self._recent])),
+                'analyzed_fps': (len(counts) - 1) / span if span > 0 else None
+            }
+        }
+        if 'zones' in analysis:
+            update['zones'] = {
+                name: {'mean_density': float(stats['mean_density']), 'estimated_count': int(stats['estimated_count']),
+                       'crowd_level': stats['crowd_level']}
+                for name, stats in analysis['zones'].items()
+            }
+        return update, jpeg
 
 class CrowdAnalyzer:
-    def __init__(self):
-        """Initialize the main crowd analyzer"""
-        self.analyzer = CrowdDensityAnalyzer()
+    def __init__(self, analysis_scale: float = 1.0, analysis_max_side: int = None,
+                 workers: int = 1, queue_depth: int = None, sampler: FrameSampler = None, zones: ZoneLayout = None,
+                 running_normalization: float = None, profiler: StageProfiler = None, cache: ResultCache = None,
+                 series_format: str = 'npz', store_features: bool = False, feature_max_side: int = 320,
+                 tile_size: int = 2048, tiled_min_pixels: int = None, pyramid_min_pixels: int = None,
+                 pyramid_tile_size: int = 256, perspective: PerspectiveMap = None, decoder: str = 'opencv',
+                 output_videos: Tuple[str, ...] = OUTPUT_VIDEOS, flow_max_side: int = None):
+        """Initialize the main crowd analyzer
+        
+        An enabled profiler accumulates per-stage histograms over every image
+        and video processed; video reports also get the per-video profile.
+        
+        With a cache, inputs already analyzed with the same settings have their
+        outputs restored from it instead of being analyzed again.
+        
+        Per-frame video metrics are saved as <name>_frames.<series_format>
+        ('npz', or 'parquet' / 'arrow' with pyarrow installed).
+        
+        With store_features, videos also keep their analyzed frames' feature
+        maps in <name>_features.f16 (at most feature_max_side pixels on the
+        longest side), so reanalyze can try other weights and thresholds
+        without decoding the video again.
+        
+        Images of at least tiled_min_pixels pixels (None: only when asked
+        for) are analyzed in tile_size tiles by a TiledImageProcessor with
+        `workers` threads. Images of at least pyramid_min_pixels pixels also
+        get zoomable heatmap and blended tile pyramids (see TilePyramid).
+        
+        With a camera's perspective, counts are calibrated to its head sizes.
+        
+        Videos are decoded by decoder ('opencv' or 'pyav') and rendered as the
+        output_videos given (see OUTPUT_VIDEOS); without the blended video,
+        pyav decoding skips BGR conversion altogether.
+        
+        With flow_max_side, videos and live streams also report crowd flow
+        (see FlowEstimator) at most that many pixels on a side.
+        """
+        unknown = set(output_videos) - set(OUTPUT_VIDEOS)
+        if unknown:
+            raise ValueError(f"output_videos must be in {OUTPUT_VIDEOS}, got {sorted(unknown)}")
+        self.output_videos = tuple(output_videos)
+        if series_format not in SERIES_FORMATS:
+            raise ValueError(f"series_format must be one of {SERIES_FORMATS}, got {series_format}")
+        if series_format != 'npz' and pa is None:
+            raise ImportError(f"pyarrow is required for the {series_format} series format")
+        self.series_format = series_format
+        self.profiler = profiler or StageProfiler(enabled=False)
+        self.analyzer = CrowdDensityAnalyzer(analysis_scale=analysis_scale, analysis_max_side=analysis_max_side,
+                                             zones=zones, profiler=self.profiler, perspective=perspective)
         self.heatmap_gen = HeatmapGenerator()
-        self.video_processor = VideoProcessor()
+        self.video_processor = VideoProcessor(self.analyzer, workers=workers, queue_depth=queue_depth,
+                                              sampler=sampler, running_normalization=running_normalization,
+                                              profiler=self.profiler, decoder=decoder, flow_max_side=flow_max_side)
+        self.cache = cache
+        self.store_features = store_features
+        self.feature_max_side = feature_max_side
+        self.tiled_processor = TiledImageProcessor(self.analyzer, tile_size=tile_size, workers=workers,
+                                                   profiler=self.profiler)
+        self.tiled_min_pixels = tiled_min_pixels
+        self.tile_pyramid = TilePyramid(self.heatmap_gen, tile_size=pyramid_tile_size, workers=workers)
+        self.pyramid_min_pixels = pyramid_min_pixels
+        self._figure_locks = KeyedLocks()
         
-    def process_image(self, image_path: str, output_dir: str = "./crowd_analysis_output") -> Dict:
-        """Process a single image"""
-        logger.info(f"Processing image: {image_path}")
+    def process_image(self, image_path: str, output_dir: str = "./crowd_analysis_output", figure: str = None,
+                      tiled: bool = None, pyramid: bool = None) -> Dict:
+        """Process a single image
         
-        # Read image
-        frame = cv2.imread(image_path)
-        if frame is None:
-            raise ValueError(f"Could not read image: {image_path}")
+        The analysis figure is only rendered here when figure is 'fast' or
+        'matplotlib'; otherwise get_analysis_figure renders it on first request.
         
-        logger.info(f"Image loaded: {frame.shape}")
+        tiled forces tiled analysis on or off (default: by tiled_min_pixels).
+        Tiled results have a memory-mapped density_map, and the heatmap and
+        blended outputs are previews of at most 4096 pixels on a side.
         
-        # Analyze image
-        density_map, analysis = self.analyzer.analyze_frame(frame)
+        pyramid forces the heatmap and blended tile pyramids on or off
+        (default: by pyramid_min_pixels); results carry their metadata.
+        """
+        logger.info(f"Processing image: {image_path}")
+        base_name = Path(image_path).stem
+        pixels = image_pixels(image_path) if self.tiled_min_pixels or self.pyramid_min_pixels else None
+        if tiled is None:
+            tiled = pixels is not None and self.tiled_min_pixels is not None and pixels >= self.tiled_min_pixels
+        if pyramid is None:
+            pyramid = pixels is not None and self.pyramid_min_pixels is not None and pixels >= self.pyramid_min_pixels
         
-        # Generate heatmaps
-        colored_heatmap, blended_frame = self.heatmap_gen.generate_heatmap(density_map, frame)
+        # Repeat inputs are restored from the result cache
+        cache_key = None
+        if self.cache:
+            params = self.cache_params(video=False)
+            params['tiled'] = self.tiled_processor.tile_size if tiled else None
+            params['pyramid'] = self.tile_pyramid.tile_size if pyramid else None
+            cache_key = self.cache.key(image_path, params)
+            entry = self.cache.restore(cache_key, output_dir, base_name)
+            if entry:
+                if figure:
+                    self.get_analysis_figure(output_dir, base_name, renderer=figure)
+                return self._load_cached_image(output_dir, base_name, entry['metadata'])
+            self.cache.detach(output_dir, base_name, IMAGE_OUTPUTS)
         
-        # Save results
         os.makedirs(output_dir, exist_ok=True)
-        base_name = Path(image_path).stem
+        density_path = os.path.join(output_dir, f"{base_name}_density.npy")
+        
+        if tiled:
+            # Large image: tiles from disk, density map written in place
+            density_map, analysis, preview_density, frame = self.tiled_processor.process(image_path, density_path)
+        else:
+            # Read image
+            frame = cv2.imread(image_path)
+            if frame is None:
+                raise ValueError(f"Could not read image: {image_path}")
+            
+            logger.info(f"Image loaded: {frame.shape}")
+            
+            # Analyze image
+            density_map, analysis = self.analyzer.analyze_frame(frame)
+            preview_density = density_map
+        
+        # Generate heatmaps
+        with self.profiler.stage('heatmap'):
+            colored_heatmap, blended_frame = self.heatmap_gen.generate_heatmap(preview_density, frame)
         
         # Save files
         cv2.imwrite(os.path.join(output_dir, f"{base_name}_heatmap.png"), colored_heatmap)
         cv2.imwrite(os.path.join(output_dir, f"{base_name}_blended.jpg"), blended_frame)
-        np.save(os.path.join(output_dir, f"{base_name}_density.npy"), density_map)
+        if not tiled:
+            np.save(density_path, density_map)
+        
+        # Zoomable tiles of the full-size heatmap and blended views
+        pyramid_metadata = None
+        if pyramid:
+            with self.profiler.stage('pyramid'):
+                if tiled:
+                    # Only a preview was decoded in color; full-size rows come from luma and half-size chroma
+                    frame = LumaChromaImage(image_path)
+                pyramid_metadata = self.tile_pyramid.build(density_map, frame, output_dir, base_name)
+        self._save_analysis_json(analysis, os.path.join(output_dir, f"{base_name}_analysis.json"))
         
         # Create detailed analysis heatmap
-        fig = self.heatmap_gen.create_analysis_heatmap(density_map, analysis, frame.shape)
-        fig.savefig(os.path.join(output_dir, f"{base_name}_analysis.png"), 
-                   dpi=300, bbox_inches='tight', facecolor='white')
-        plt.close(fig)
+        if figure:
+            self.get_analysis_figure(output_dir, base_name, renderer=figure)
         
         # Save analysis report
         self._save_analysis_report(analysis, os.path.join(output_dir, f"{base_name}_report.txt"))
         
+        if cache_key:
+            self.cache.store(cache_key, output_dir, base_name, IMAGE_OUTPUTS,
+                             {'tiled': tiled, 'pyramid': pyramid_metadata})
+        
         results = {
             'density_map': density_map,
             'analysis': analysis,
             'colored_heatmap': colored_heatmap,
-            'blended_frame': blended_frame
+            'blended_frame': blended_frame,
+            'tiled': tiled,
+            'pyramid': pyramid_metadata
         }
         
         return results
     
-    def process_video(self, video_path: str, output_dir: str = "./crowd_analysis_output") -> Dict:
-        """Process a video file"""
+    def process_video(self, video_path: str, output_dir: str = "./crowd_analysis_output", streaming: bool = True,
+                      figure: str = None, progress=None, video_range: VideoRange = None) -> Dict:
+        """Process a video file
+        
+        Streaming mode (the default) keeps memory constant and writes per-frame
+        records to <name>_frames.jsonl instead of returning them. The final
+        analysis figure is rendered lazily unless figure is given, as for images.
+        progress and video_range are passed to VideoProcessor.process_video.
+        
+        Cached results are only used in streaming mode, since per-frame
+        analyses and heatmaps are not kept in the cache.
+        """
         logger.info(f"Processing video: {video_path}")
         
         # Create output directory
         os.makedirs(output_dir, exist_ok=True)
         base_name = Path(video_path).stem
         
+        # Repeat inputs are restored from the result cache
+        cache_key = None
+        if self.cache and streaming:
+            params = self.cache_params(video=True)
+            params['range'] = vars(video_range) if video_range else None
+            cache_key = self.cache.key(video_path, params)
+            entry = self.cache.restore(cache_key, output_dir, base_name)
+            if entry:
+                video_stats = self._load_cached_video(output_dir, base_name, entry['metadata'])
+                if progress:
+                    progress(video_stats['total_frames'], video_stats['total_frames'])
+                if figure:
+                    self.get_analysis_figure(output_dir, f"{base_name}_final", renderer=figure)
+                return video_stats
+            self.cache.detach(output_dir, base_name, VIDEO_OUTPUTS)
+        
+        feature_store = None
+        if self.store_features:
+            feature_store = FeatureStore(os.path.join(output_dir, f"{base_name}_features.f16"), self.feature_max_side)
+        
         # Process video with heatmap video generation
         video_stats = self.video_processor.process_video(
             video_path, 
-            os.path.join(output_dir, f"{base_name}_blended_output.mp4"),
-            os.path.join(output_dir, f"{base_name}_heatmap_video.mp4")
+            os.path.join(output_dir, f"{base_name}_blended_output.mp4") if 'blended' in self.output_videos else None,
+            os.path.join(output_dir, f"{base_name}_heatmap_video.mp4") if 'heatmap' in self.output_videos else None,
+            streaming=streaming,
+            records_path=os.path.join(output_dir, f"{base_name}_frames.jsonl"),
+            progress=progress,
+            series_path=os.path.join(output_dir, f"{base_name}_frames.{self.series_format}"),
+            video_range=video_range,
+            feature_store=feature_store
         )
         
         # Save final cumulative heatmap
         final_density = video_stats['final_density_map']
         final_analysis = video_stats['final_analysis']
         
-        # Generate final heatmap
+        # Generate final heatmap at the video resolution
         colored_heatmap, _ = self.heatmap_gen.generate_heatmap(final_density, 
-                                                              np.zeros((final_density.shape[0], final_density.shape[1], 3), dtype=np.uint8))
+                                                              np.zeros(video_stats['frame_shape'], dtype=np.uint8))
         
         cv2.imwrite(os.path.join(output_dir, f"{base_name}_final_heatmap.png"), colored_heatmap)
         np.save(os.path.join(output_dir, f"{base_name}_final_density.npy"), final_density)
+        self._save_analysis_json(final_analysis, os.path.join(output_dir, f"{base_name}_final_analysis.json"))
         
         # Create detailed analysis
-        fig = self.heatmap_gen.create_analysis_heatmap(final_density, final_analysis, 
-                                                      (final_density.shape[0], final_density.shape[1], 3))
-        fig.savefig(os.path.join(output_dir, f"{base_name}_final_analysis.png"), 
-                   dpi=300, bbox_inches='tight', facecolor='white')
-        plt.close(fig)
+        if figure:
+            self.get_analysis_figure(output_dir, f"{base_name}_final", renderer=figure)
         
         # Save video analysis report
         self._save_video_report(video_stats, os.path.join(output_dir, f"{base_name}_video_report.txt"))
         
+        if cache_key:
+            # Everything but the arrays (saved as artifacts) and the profile of this run
+            cached_stats = {key: value for key, value in video_stats.items()
+                            if key not in ('final_density_map', 'final_analysis', 'frame_records_path', 'profile',
+                                           'series', 'series_path', 'features_path')}
+            self.cache.store(cache_key, output_dir, base_name, VIDEO_OUTPUTS,
+                             convert_numpy_types(cached_stats))
+        
+        return video_stats
+    
+    def process_stream(self, source, on_update, stop: threading.Event = None, frame_budget: float = 0.5,
+                       window: float = 10.0, output_max_side: int = 960, flow_budget: float = 0.1) -> Dict:
+        """Analyze a live source (camera index or RTSP/HTTP URL), always taking the newest frame
+        
+        on_update(update, jpeg) is called after every analyzed frame with the
+        LiveAnalysis update (plus sequence and capture counters) and the
+        blended heatmap as JPEG bytes; it should return quickly. Runs until stop
+        is set or a file source ends, and returns the final capture counters.
+        
+        Crowd flow (with flow_max_side) adapts its resolution to take at most
+        flow_budget of the time between analyzed frames.
+        """
+        flow_max_side = self.video_processor.flow_max_side
+        live = LiveAnalysis(self.analyzer, frame_budget=frame_budget, window=window, output_max_side=output_max_side,
+                            flow=FlowEstimator(flow_max_side, flow_budget) if flow_max_side else None)
+        grabber = LatestFrameGrabber(source)
+        grabber.start()
+        stop = stop or threading.Event()
+        logger.info(f"Streaming analysis of {source} (budget {frame_budget * 1000:.0f} ms per frame)")
+        
+        try:
+            while not stop.is_set():
+                item = grabber.read(timeout=1.0)
+                if item is None:
+                    if grabber.ended:
+                        break
+                    continue
+                sequence, frame, captured_at = item
+                update, jpeg = live.process(frame, captured_at)
+                update.update({
+                    'sequence': sequence,
+                    'source_fps': grabber.fps,
+                    'frames_read': grabber.frames_read,
+                    'frames_dropped': grabber.frames_dropped,
+                    'reconnects': grabber.reconnects
+                })
+                on_update(update, jpeg)
+        finally:
+            grabber.stop()
+        
+        return {
+            'frames_read': grabber.frames_read,
+            'frames_analyzed': live.frames_analyzed,
+            'frames_dropped': grabber.frames_dropped,
+            'reconnects': grabber.reconnects
+        }
+    
+    def reanalyze(self, features_path: str, output_dir: str = None, progress=None) -> Dict:
+        """Analyze a video again from its stored feature maps with the current weights and thresholds
+        
+        Only the combination, normalization and distribution run, on the
+        reduced maps, so a tuning pass takes a small fraction of the original
+        analysis. Frames filled by keyframe sampling are not re-analyzed.
+        With output_dir, the per-frame series and a JSON summary are saved as
+        <name>_reanalysis_frames.<series_format> and <name>_reanalysis.json.
+        """
+        features, metadata = FeatureStore.load(features_path)
+        if metadata['params'] != self.analyzer.feature_params():
+            logger.warning(f"Feature maps were extracted with {metadata['params']}; "
+                           f"only weights and thresholds of this analyzer apply")
+        frame_shape = tuple(metadata['frame_shape'])
+        frames = metadata['frames']
+        logger.info(f"Re-analyzing {len(frames)} frames from {features_path} ({features.shape[3]}x{features.shape[2]} maps)")
+        
+        normalizer = None
+        if self.video_processor.running_normalization:
+            normalizer = RunningNormalization(self.video_processor.running_normalization)
+        
+        stats = VideoStatistics(fps=metadata['fps'])
+        for done, row in enumerate(np.argsort(frames, kind='stable'), 1):
+            density_map, analysis = self.analyzer.analyze_features(features[row], frame_shape, normalizer)
+            stats.add(frames[row], density_map, analysis)
+            if progress:
+                progress(done, len(frames))
+        
+        final_density = stats.cumulative_density / stats.frame_count
+        summary = stats.summary()
+        results = {
+            'features_path': features_path,
+            'frames': stats.frame_count,
+            'analyzed_frame_ranges': stats.format_analyzed_frames(),
+            'weights': {name: getattr(self.analyzer, f"{name}_weight") for name in FEATURE_NAMES},
+            'crowd_level_thresholds': list(self.analyzer.crowd_level_thresholds),
+            'count_threshold': self.analyzer.count_threshold,
+            'total_people_detected': int(summary['estimated_count']['sum']),
+            'average_people_per_frame': summary['estimated_count']['sum'] / stats.frame_count,
+            'max_people_in_frame': int(summary['estimated_count']['max']),
+            'statistics': summary,
+            'final_analysis': self.analyzer._analyze_distribution(final_density, frame_shape),
+            'series': stats.series
+        }
+        
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+            base_name = Path(features_path).stem
+            if base_name.endswith('_features'):
+                base_name = base_name[:-len('_features')]
+            results['series_path'] = os.path.join(output_dir, f"{base_name}_reanalysis_frames.{self.series_format}")
+            stats.series.save(results['series_path'])
+            with open(os.path.join(output_dir, f"{base_name}_reanalysis.json"), 'w') as f:
+                json.dump({key: value for key, value in results.items() if key != 'series'}, f, indent=2,
+                          default=convert_numpy_types)
+        
+        return results
+    
+    def cache_params(self, video: bool) -> Dict:
+        """Get the settings that change analysis outputs, as part of result cache keys"""
+        analyzer = self.analyzer
+        params = {
+            'density': {name: getattr(analyzer, name) for name in (
+                'blur_kernel_size', 'edge_threshold_low', 'edge_threshold_high', 'variance_window',
+                'density_blur_size', 'edge_weight', 'variance_weight', 'gradient_weight', 'fused',
+                'analysis_scale', 'analysis_max_side', 'percentile_bins', 'crowd_level_thresholds',
+                'count_threshold', 'hotspot_threshold', 'hotspot_max_side', 'hotspot_min_area', 'max_hotspots')},
+            'zones': [{name: value.tolist() if isinstance(value, np.ndarray) else value
+                       for name, value in zone.items()} for zone in analyzer.zones.zones] if analyzer.zones else None,
+            'perspective': analyzer.perspective.to_profile() if analyzer.perspective else None
+        }
+        
+        if video:
+            sampler = self.video_processor.sampler
+            params['sampler'] = {name: getattr(sampler, name) for name in (
+                'stride', 'target_fps', 'adaptive_threshold', 'max_stride', 'fill')} if sampler and sampler.enabled else None
+            params['running_normalization'] = self.video_processor.running_normalization
+            params['series_format'] = self.series_format
+            params['features'] = self.feature_max_side if self.store_features else None
+            params['decoder'] = self.video_processor.decoder
+            params['output_videos'] = list(self.output_videos)
+            params['flow'] = self.video_processor.flow_max_side
+        return params
+    
+    def _load_cached_image(self, output_dir: str, base_name: str, metadata: Dict) -> Dict:
+        """Load process_image results from restored outputs"""
+        with open(os.path.join(output_dir, f"{base_name}_analysis.json")) as f:
+            analysis = json.load(f)
+        
+        return {
+            'density_map': np.load(os.path.join(output_dir, f"{base_name}_density.npy"), mmap_mode='r'),
+            'analysis': analysis,
+            'colored_heatmap': cv2.imread(os.path.join(output_dir, f"{base_name}_heatmap.png")),
+            'blended_frame': cv2.imread(os.path.join(output_dir, f"{base_name}_blended.jpg")),
+            'tiled': metadata.get('tiled', False),
+            'pyramid': metadata.get('pyramid'),
+            'cached': True
+        }
+    
+    def _load_cached_video(self, output_dir: str, base_name: str, cached_stats: Dict) -> Dict:
+        """Load process_video results from restored outputs"""
+        with open(os.path.join(output_dir, f"{base_name}_final_analysis.json")) as f:
+            final_analysis = json.load(f)
+        
+        series_path = os.path.join(output_dir, f"{base_name}_frames.{self.series_format}")
+        video_stats = dict(cached_stats)
+        video_stats.update({
+            'frame_shape': tuple(cached_stats['frame_shape']),
+            'final_density_map': np.load(os.path.join(output_dir, f"{base_name}_final_density.npy")),
+            'final_analysis': final_analysis,
+            'frame_records_path': os.path.join(output_dir, f"{base_name}_frames.jsonl"),
+            'series': FrameSeries.load(series_path),
+            'series_path': series_path,
+            'cached': True
+        })
+        features_path = os.path.join(output_dir, f"{base_name}_features.f16")
+        if os.path.exists(features_path):
+            video_stats['features_path'] = features_path
+        
+        # The report names the records file, so it is written again for the new name
+        report_path = os.path.join(output_dir, f"{base_name}_video_report.txt")
+        os.remove(report_path)
+        self._save_video_report(video_stats, report_path)
         return video_stats
     
+    def get_analysis_figure(self, output_dir: str, prefix: str, renderer: str = 'fast') -> str:
+        """Get the path of the analysis figure for an analysis, rendering it on first request
+        
+        prefix is the artifact prefix: <name> for images, <name>_final for
+        videos. The figure is rendered from the saved <prefix>_density.npy and
+        <prefix>_analysis.json and cached as <prefix>_analysis.png.
+        """
+        if renderer not in FIGURE_RENDERERS:
+            raise ValueError(f"Unknown figure renderer: {renderer}")
+        
+        figure_path = os.path.join(output_dir, f"{prefix}_analysis.png")
+        
+        # One render per figure, even with concurrent requests
+        with self._figure_locks.hold(figure_path):
+            if os.path.exists(figure_path):
+                return figure_path
+            
+            analysis_path = os.path.join(output_dir, f"{prefix}_analysis.json")
+            density_path = os.path.join(output_dir, f"{prefix}_density.npy")
+            if not os.path.exists(analysis_path) or not os.path.exists(density_path):
+                raise FileNotFoundError(f"No saved analysis for {prefix} in {output_dir}")
+            
+            with open(analysis_path) as f:
+                analysis = json.load(f)
+            density_map = np.load(density_path, mmap_mode='r')
+            
+            # Render to a temporary name so readers never see a partial file
+            temp_path = os.path.join(output_dir, f".{prefix}_analysis.tmp.png")
+            if renderer == 'fast':
+                cv2.imwrite(temp_path, self.heatmap_gen.render_analysis_image(density_map, analysis))
+            else:
+                fig = self.heatmap_gen.create_analysis_heatmap(density_map, analysis, density_map.shape + (3,))
+                fig.savefig(temp_path, dpi=300, bbox_inches='tight', facecolor='white')
+                plt.close(fig)
+            os.replace(temp_path, figure_path)
+        
+        return figure_path
+    
+    def measure_scale_drift(self, input_path: str, scales: Tuple[float, ...] = (0.5, 0.25), sample_frames: int = 10) -> Dict:
+        """Measure accuracy drift of reduced-resolution analysis against full resolution"""
+        frames = self._load_sample_frames(input_path, sample_frames)
+        
+        reference = CrowdDensityAnalyzer(fused=self.analyzer.fused)
+        start = time.perf_counter()
+        reference_results = [reference.analyze_frame(frame) for frame in frames]
+        reference_time = time.perf_counter() - start
+        
+        drift = {
+            'frames_compared': len(frames),
+            'frame_shape': frames[0].shape,
+            'reference_time_per_frame': reference_time / len(frames),
+            'scales': {}
+        }
+        
+        for scale in scales:
+            analyzer = CrowdDensityAnalyzer(fused=self.analyzer.fused, analysis_scale=scale)
+            density_errors, max_errors, count_errors, region_errors = [], [], [], []
+            level_matches = 0
+            elapsed = 0.0
+            
+            for frame, (reference_map, reference_analysis) in zip(frames, reference_results):
+                start = time.perf_counter()
+                density_map, analysis = analyzer.analyze_frame(frame)
+                elapsed += time.perf_counter() - start
+                
+                # Compare at full resolution, as the heatmap writers would see it
+                upsampled = cv2.resize(density_map, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_LINEAR)
+                error = np.abs(upsampled - reference_map)
+                density_errors.append(float(np.mean(error)))
+                max_errors.append(float(np.max(error)))
+                
+                reference_count = reference_analysis['estimated_count']['estimated_count']
+                count = analysis['estimated_count']['estimated_count']
+                count_errors.append(abs(count - reference_count) / max(reference_count, 1))
+                
+                region_errors.append(max(
+                    abs(analysis['regions'][name]['mean_density'] - stats['mean_density'])
+                    for name, stats in reference_analysis['regions'].items()
+                ))
+                level_matches += analysis['overall']['crowd_level'] == reference_analysis['overall']['crowd_level']
+            
+            drift['scales'][scale] = {
+                'density_mean_abs_error': float(np.mean(density_errors)),
+                'density_max_abs_error': float(np.max(max_errors)),
+                'count_mean_relative_error': float(np.mean(count_errors)),
+                'count_max_relative_error': float(np.max(count_errors)),
+                'region_mean_density_max_abs_error': float(np.max(region_errors)),
+                'crowd_level_agreement': level_matches / len(frames),
+                'time_per_frame': elapsed / len(frames),
+                'speedup': reference_time / elapsed if elapsed > 0 else float('inf')
+            }
+        
+        return drift
+    
+    def _load_sample_frames(self, input_path: str, sample_frames: int) -> List[np.ndarray]:
+        """Load an image, or frames sampled evenly across a video"""
+        frame = cv2.imread(input_path)
+        if frame is not None:
+            return [frame]
+        
+        cap = cv2.VideoCapture(input_path)
+        if not cap.isOpened():
+            raise ValueError(f"Could not read image or video: {input_path}")
+        
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        frames = []
+        for index in np.linspace(0, max(total_frames - 1, 0), sample_frames).astype(int):
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(index))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        cap.release()
+        
+        if not frames:
+            raise ValueError(f"Could not read frames from video: {input_path}")
+        return frames
+    
+    def _save_analysis_json(self, analysis: Dict, json_path: str):
+        """Save analysis results as JSON for later rendering"""
+        with open(json_path, 'w') as f:
+            json.dump(analysis, f, default=convert_numpy_types)
+    
     def _save_analysis_report(self, analysis: Dict, report_path: str):
         """Save analysis report to file"""
         with open(report_path, 'w') as f:
@@ -529,7 +4206,10 @@ class CrowdAnalyzer:
             f.write(f"CROWD COUNT ESTIMATION:\n")
             f.write(f"Estimated count: {analysis['estimated_count']['estimated_count']:,} people\n")
             f.write(f"Confidence: {analysis['estimated_count']['confidence']:.1%}\n")
-            f.write(f"Pixels per person: {analysis['estimated_count']['pixels_per_person']}\n\n")
+            f.write(f"Pixels per person: {analysis['estimated_count']['pixels_per_person']}\n")
+            if analysis['estimated_count'].get('method') == 'perspective':
+                f.write(f"Calibrated to the camera's perspective\n")
+            f.write("\n")
             
             f.write(f"OVERALL ANALYSIS:\n")
             f.write(f"Crowd level: {analysis['overall']['crowd_level']}\n")
@@ -545,6 +4225,22 @@ class CrowdAnalyzer:
                 f.write(f"  Mean density: {stats['mean_density']:.4f}\n")
                 f.write(f"  Max density: {stats['max_density']:.4f}\n\n")
     
+            if analysis.get('zones'):
+                f.write(f"ZONE ANALYSIS:\n")
+                for name, stats in analysis['zones'].items():
+                    f.write(f"{name}:\n")
+                    f.write(f"  Crowd level: {stats['crowd_level']}\n")
+                    f.write(f"  Estimated count: {stats['estimated_count']:,} people\n")
+                    f.write(f"  Mean density: {stats['mean_density']:.4f}\n")
+                    f.write(f"  Max density: {stats['max_density']:.4f}\n\n")
+            
+            if analysis.get('hotspots'):
+                f.write(f"HOTSPOTS:\n")
+                for hotspot in analysis['hotspots']:
+                    x, y = hotspot['centroid']
+                    f.write(f"At ({x:.0f}, {y:.0f}): {hotspot['area']:,} px ({hotspot['area_fraction']:.1%} of the image), "
+                            f"peak density {hotspot['peak_density']:.3f}\n")
+    
     def _save_video_report(self, video_stats: Dict, report_path: str):
         """Save video analysis report to file"""
         with open(report_path, 'w') as f:
@@ -557,6 +4253,74 @@ class CrowdAnalyzer:
             f.write(f"Average people per frame: {video_stats['average_people_per_frame']:.1f}\n")
             f.write(f"Maximum people in single frame: {video_stats['max_people_in_frame']:,}\n\n")
             
+            if video_stats.get('start_time') is not None:
+                f.write(f"TIME SPAN:\n")
+                if video_stats.get('range'):
+                    f.write(f"Requested range: {video_stats['range']}\n")
+                f.write(f"Analyzed: {format_timestamp(video_stats['start_time'])} - "
+                        f"{format_timestamp(video_stats['end_time'])} (frames {video_stats['first_frame']:,}-"
+                        f"{video_stats['last_frame']:,} of {video_stats['video_frames']:,} at {video_stats['fps']:.2f} fps)\n")
+                series = video_stats.get('series')
+                if series is not None and series.length:
+                    columns = series.columns()
+                    peak = int(np.argmax(columns['estimated_count']))
+                    peak_frame = int(columns['frame'][peak])
+                    f.write(f"Peak count: {int(columns['estimated_count'][peak]):,} people at "
+                            f"{format_timestamp((peak_frame - 1) / video_stats['fps'])} (frame {peak_frame:,})\n")
+                f.write("\n")
+            
+            if video_stats.get('sampling'):
+                f.write(f"FRAME SAMPLING:\n")
+                f.write(f"Mode: {video_stats['sampling']}\n")
+                f.write(f"Frames analyzed: {video_stats['analyzed_frames']:,} of {video_stats['total_frames']:,}\n")
+                f.write(f"Analyzed frame numbers: {video_stats['analyzed_frame_ranges']}\n")
+                f.write(f"Other frames use held or interpolated density maps and statistics\n\n")
+            
+            count_stats = video_stats['statistics']['estimated_count']
+            density_stats = video_stats['statistics']['mean_density']
+            f.write(f"PER-FRAME DISTRIBUTION:\n")
+            f.write(f"People per frame (p50/p90/p95/p99): {count_stats['p50']:.0f} / {count_stats['p90']:.0f} / "
+                    f"{count_stats['p95']:.0f} / {count_stats['p99']:.0f}\n")
+            f.write(f"Mean density (p50/p90/p95/p99): {density_stats['p50']:.3f} / {density_stats['p90']:.3f} / "
+                    f"{density_stats['p95']:.3f} / {density_stats['p99']:.3f}\n")
+            if video_stats.get('frame_records_path'):
+                f.write(f"Per-frame records: {os.path.basename(video_stats['frame_records_path'])}\n")
+            if video_stats.get('series_path'):
+                f.write(f"Per-frame series: {os.path.basename(video_stats['series_path'])}\n")
+            if video_stats.get('features_path'):
+                f.write(f"Feature maps: {os.path.basename(video_stats['features_path'])}\n")
+            f.write("\n")
+            
+            if video_stats.get('hotspot_tracks'):
+                f.write(f"HOTSPOT TRACKS (largest first):\n")
+                for track in video_stats['hotspot_tracks'][:10]:
+                    f.write(f"#{track['id']}: {format_timestamp(track['first_seen'])} - "
+                            f"{format_timestamp(track['last_seen'])} ({track['frames']:,} frames), "
+                            f"area {track['start_area']:,} -> {track['end_area']:,} px "
+                            f"({track['growth_rate']:+.1%}/s), drift {track['drift_speed']:.1f} px/s\n")
+                f.write("\n")
+            
+            if video_stats.get('flow'):
+                flow_stats = video_stats['flow']
+                f.write(f"CROWD FLOW:\n")
+                f.write(f"Flow fields: {flow_stats['frames']:,} ({flow_stats['mean_time_ms']:.2f} ms each, "
+                        f"resolution {flow_stats['max_side']} px)\n\n")
+            
+            if video_stats.get('profile'):
+                f.write(f"STAGE PROFILE (per frame):\n")
+                f.write(f"{'Stage':<16}{'Runs':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'Max ms':>10}{'Total s':>10}\n")
+                for stage, stage_stats in video_stats['profile'].items():
+                    times = stage_stats['time_ms']
+                    f.write(f"{stage:<16}{times['count']:>8,}{times['p50']:>10.2f}{times['p90']:>10.2f}"
+                            f"{times['p99']:>10.2f}{times['max']:>10.2f}{times['sum'] / 1000:>10.2f}\n")
+                allocated = {stage: stage_stats['allocated_kb'] for stage, stage_stats in video_stats['profile'].items()
+                             if 'allocated_kb' in stage_stats}
+                if allocated:
+                    f.write(f"\nPeak traced allocation per run (KB, p50 / max):\n")
+                    for stage, kb in allocated.items():
+                        f.write(f"{stage:<16}{kb['p50']:>10,.0f} / {kb['max']:,.0f}\n")
+                f.write("\n")
+            
             final_analysis = video_stats['final_analysis']
             f.write(f"FINAL CUMULATIVE ANALYSIS:\n")
             f.write(f"Overall crowd level: {final_analysis['overall']['crowd_level']}\n")
@@ -568,57 +4332,581 @@ class CrowdAnalyzer:
                 stats = final_analysis['regions'][region]
                 f.write(f"{region.replace('_', ' ').title()}: {stats['crowd_level']} ({stats['mean_density']:.4f})\n")
 
+            if final_analysis.get('zones'):
+                f.write(f"\nZONE DISTRIBUTION:\n")
+                for name, stats in final_analysis['zones'].items():
+                    f.write(f"{name}: {stats['crowd_level']} ({stats['mean_density']:.4f})\n")
+    
+    def _save_scale_drift_report(self, drift: Dict, report_path: str):
+        """Save reduced-resolution accuracy drift report to file"""
+        with open(report_path, 'w') as f:
+            f.write("ANALYSIS SCALE DRIFT REPORT\n")
+            f.write("=" * 60 + "\n\n")
+            
+            f.write(f"Frames compared: {drift['frames_compared']}\n")
+            f.write(f"Frame size: {drift['frame_shape'][1]}x{drift['frame_shape'][0]}\n")
+            f.write(f"Full resolution time per frame: {drift['reference_time_per_frame'] * 1000:.1f} ms\n\n")
+            
+            for scale, stats in drift['scales'].items():
+                f.write(f"SCALE {scale}:\n")
+                f.write(f"  Time per frame: {stats['time_per_frame'] * 1000:.1f} ms ({stats['speedup']:.1f}x faster)\n")
+                f.write(f"  Density mean abs error: {stats['density_mean_abs_error']:.4f}\n")
+                f.write(f"  Density max abs error: {stats['density_max_abs_error']:.4f}\n")
+                f.write(f"  Count relative error: {stats['count_mean_relative_error']:.1%} mean, {stats['count_max_relative_error']:.1%} max\n")
+                f.write(f"  Region mean density error (max over regions and frames): "
+                        f"{stats['region_mean_density_max_abs_error']:.4f}\n")
+                f.write(f"  Crowd level agreement: {stats['crowd_level_agreement']:.0%}\n\n")
+
+# Analyzer of each batch worker process, built once by _init_batch_worker
+_batch_analyzer = None
+
+def _init_batch_worker(analyzer_options: Dict, density_settings: Dict, single_threaded: bool):
+    """Batch worker initializer: build the process's analyzer and warm it up"""
+    global _batch_analyzer
+    if single_threaded:
+        # Parallelism comes from the processes; OpenCV threads would only contend
+        cv2.setNumThreads(1)
+    _batch_analyzer = CrowdAnalyzer(**analyzer_options)
+    for name, value in density_settings.items():
+        setattr(_batch_analyzer.analyzer, name, value)
+    
+    # First calls load OpenCV kernels and allocate buffers; pay for that before the first image
+    warmup = np.random.default_rng(0).integers(0, 256, (256, 256, 3), dtype=np.uint8)
+    _batch_analyzer.analyzer.analyze_frame(warmup)
+
+def _process_batch_image(image_path: str, artifacts_dir: str, figure: str, tiled: bool, pyramid: bool) -> Dict:
+    """Batch worker task: analyze one image and get its summary record"""
+    start = time.perf_counter()
+    try:
+        if artifacts_dir:
+            results = _batch_analyzer.process_image(image_path, artifacts_dir, figure=figure, tiled=tiled,
+                                                    pyramid=pyramid)
+            analysis = results['analysis']
+            height, width = results['density_map'].shape[:2]
+        else:
+            frame = cv2.imread(image_path)
+            if frame is None:
+                raise ValueError(f"Could not read image: {image_path}")
+            height, width = frame.shape[:2]
+            _, analysis = _batch_analyzer.analyzer.analyze_frame(frame)
+    except Exception as e:
+        return {'status': 'failed', 'error': str(e), 'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)}
+    
+    record = {
+        'status': 'ok',
+        'width': width,
+        'height': height,
+        'estimated_count': analysis['estimated_count']['estimated_count'],
+        'confidence': analysis['estimated_count']['confidence'],
+        'crowd_level': analysis['overall']['crowd_level'],
+        'mean_density': analysis['overall']['mean_density'],
+        'max_density': analysis['overall']['max_density'],
+        'highest_density_region': analysis['highest_density_region'],
+        'hotspots': len(analysis.get('hotspots', [])),
+        'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)
+    }
+    if analysis.get('zones'):
+        record['zones'] = {name: {'estimated_count': stats['estimated_count'], 'mean_density': stats['mean_density']}
+                           for name, stats in analysis['zones'].items()}
+    return convert_numpy_types(record)
+
+class BatchProcessor:
+    # Consolidated summary formats (<output>/batch_summary.<format>); Parquet needs pyarrow
+    SUMMARY_FORMATS = ('jsonl', 'parquet')
+    
+    def __init__(self, output_dir: str, analyzer_options: Dict = None, density_settings: Dict = None,
+                 processes: int = None, summary_format: str = 'jsonl', artifacts: bool = False, figure: str = None,
+                 tiled: bool = None, pyramid: bool = None):
+        """Initialize a batch run over many images in a pool of worker processes
+        
+        Each worker builds one CrowdAnalyzer(**analyzer_options) (with
+        density_settings applied to its CrowdDensityAnalyzer) and warms it up
+        once, so the per-image cost is just the analysis. Every image gets a
+        line in <output_dir>/batch_summary.jsonl as soon as it is done; images
+        already summarized there (same path, size and modification time) are
+        skipped, so an interrupted batch resumes where it stopped. With
+        summary_format 'parquet', the summary is also consolidated into
+        batch_summary.parquet at the end of each run.
+        
+        With artifacts, each image also gets the full process_image outputs
+        in a directory named after the image file, mirroring the input tree (figure, tiled and
+        pyramid as for process_image).
+        """
+        if summary_format not in self.SUMMARY_FORMATS:
+            raise ValueError(f"summary_format must be one of {self.SUMMARY_FORMATS}, got {summary_format}")
+        if summary_format == 'parquet' and pa is None:
+            raise ImportError("pyarrow is required for the parquet batch summary")
+        if processes is not None and processes < 1:
+            raise ValueError(f"processes must be at least 1, got {processes}")
+        self.output_dir = output_dir
+        self.analyzer_options = analyzer_options or {}
+        self.density_settings = density_settings or {}
+        self.processes = processes or os.cpu_count() or 1
+        self.summary_format = summary_format
+        self.artifacts = artifacts
+        self.figure = figure
+        self.tiled = tiled
+        self.pyramid = pyramid
+        self.summary_path = os.path.join(output_dir, 'batch_summary.jsonl')
+    
+    @staticmethod
+    def find_images(pattern: str) -> List[str]:
+        """Get the images in a directory (recursively) or matching a glob pattern, sorted"""
+        if os.path.isdir(pattern):
+            paths = [str(path) for path in Path(pattern).rglob('*')]
+        else:
+            paths = glob.glob(pattern, recursive=True)
+        return sorted(path for path in paths if Path(path).suffix.lower() in IMAGE_EXTENSIONS and os.path.isfile(path))
+    
+    def load_summary(self) -> Dict[str, Dict]:
+        """Get the latest summary record of every image in batch_summary.jsonl, by absolute path"""
+        records = {}
+        if os.path.exists(self.summary_path):
+            with open(self.summary_path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Line cut off by an interrupted run
+                        continue
+                    records[record['path']] = record
+        return records
+    
+    def run(self, image_paths: List[str], progress=None) -> Dict:
+        """Analyze every image not already summarized
+        
+        progress(done, total, record) is called as each image finishes, in
+        completion order. Failed images are recorded with their error and
+        tried again on the next run. When a worker process dies (out of
+        memory, a crashing decoder), the images it may have been working on
+        are retried one at a time, the one that kills its worker again is
+        recorded as failed, and the rest of the batch continues on a new pool.
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        summarized = self.load_summary()
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in image_paths]) if image_paths else ''
+        
+        pending = []
+        for image_path in image_paths:
+            path = os.path.abspath(image_path)
+            stat = os.stat(path)
+            record = {'file': os.path.relpath(path, root), 'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime}
+            previous = summarized.get(path)
+            if previous and previous['status'] == 'ok' and previous['size'] == stat.st_size \
+                    and previous['mtime'] == stat.st_mtime:
+                continue
+            pending.append(record)
+        
+        start = time.time()
+        counts = {'ok': 0, 'failed': 0}
+        with open(self.summary_path, 'a+') as summary:
+            if summary.tell():
+                # Start on a new line after a record cut off by an interrupted run
+                summary.seek(summary.tell() - 1)
+                if summary.read(1) != "\n":
+                    summary.write("\n")
+            
+            def finish(record, result):
+                record.update(result)
+                summary.write(json.dumps(record) + "\n")
+                summary.flush()
+                counts[record['status']] += 1
+                if progress:
+                    progress(counts['ok'] + counts['failed'], len(pending), record)
+            
+            def task(record):
+                artifacts_dir = None
+                if self.artifacts:
+                    # Named with the extension, so a.jpg and a.png next to each other keep separate outputs
+                    artifacts_dir = os.path.join(self.output_dir, record['file'])
+                return (record['path'], artifacts_dir, self.figure, self.tiled, self.pyramid)
+            
+            if self.processes == 1 or len(pending) <= 1:
+                # Serial run in this process
+                _init_batch_worker(self.analyzer_options, self.density_settings, False)
+                for record in pending:
+                    finish(record, _process_batch_image(*task(record)))
+            else:
+                remaining = deque(pending)
+                while remaining:
+                    suspects = self._run_pool(remaining, min(self.processes, len(remaining)), finish, task)
+                    for record in suspects:
+                        # Alone in its own pool, a dying worker can only be this image's doing
+                        if self._run_pool(deque([record]), 1, finish, task):
+                            finish(record, {'status': 'failed',
+                                            'error': 'Worker process died (out of memory or crashed)'})
+        
+        parquet_path = None
+        if self.summary_format == 'parquet':
+            parquet_path = os.path.join(self.output_dir, 'batch_summary.parquet')
+            self.save_parquet(parquet_path)
+        
+        return {
+            'images': len(image_paths),
+            'skipped': len(image_paths) - len(pending),
+            'processed': counts['ok'],
+            'failed': counts['failed'],
+            'elapsed_seconds': time.time() - start,
+            'summary_path': self.summary_path,
+            'parquet_path': parquet_path
+        }
+    
+    def _run_pool(self, records: deque, processes: int, finish, task) -> List[Dict]:
+        """Run queued images through a new pool of processes, passing each result to finish
+        
+        Images are taken from records as workers free up (two per process in
+        flight). If a worker process dies, the pool is abandoned and the
+        images that were in flight are returned; the rest stay in records.
+        """
+        futures = {}
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_batch_worker,
+                                 initargs=(self.analyzer_options, self.density_settings, True)) as pool:
+            try:
+                while records or futures:
+                    while records and len(futures) < 2 * processes:
+                        record = records.popleft()
+                        futures[pool.submit(_process_batch_image, *task(record))] = record
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    broken = []
+                    for future in done:
+                        record = futures.pop(future)
+                        try:
+                            result = future.result()
+                        except BrokenExecutor:
+                            broken.append(record)
+                            continue
+                        finish(record, result)
+                    if broken:
+                        return broken + list(futures.values())
+            except BaseException:
+                # Interrupted: finished images are already summarized, drop the rest
+                for future in futures:
+                    future.cancel()
+                raise
+        return []
+    
+    def save_parquet(self, path: str):
+        """Consolidate the latest record of every image into a flat Parquet table, zones as columns"""
+        if pa is None:
+            raise ImportError("pyarrow is required for the parquet batch summary")
+        rows = []
+        for record in sorted(self.load_summary().values(), key=lambda record: record['file']):
+            row = {key: value for key, value in record.items() if key != 'zones'}
+            for name, stats in record.get('zones', {}).items():
+                row[f"zone_{name}_mean_density"] = stats['mean_density']
+                row[f"zone_{name}_estimated_count"] = stats['estimated_count']
+            rows.append(row)
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        pq.write_table(pa.table({column: [row.get(column) for row in rows] for column in columns}), path,
+                       compression='zstd')
+
 def main():
     """Main function"""
     parser = argparse.ArgumentParser(description='Crowd Analyzer for Drone Footage')
-    parser.add_argument('input', help='Input video or image file path')
+    parser.add_argument('input', help='Input video or image file path (with --live: camera index or stream URL; '
+                                      'a directory or glob pattern of images runs a batch)')
     parser.add_argument('-o', '--output', help='Output directory', default='./crowd_analysis_output')
     parser.add_argument('--blended-video', help='Output blended video path (for video input)')
     parser.add_argument('--heatmap-video', help='Output heatmap video path (for video input)')
+    parser.add_argument('--analysis-scale', type=float, default=1.0,
+                        help='Downscale factor for analysis, e.g. 0.25 (density map is upsampled for output)')
+    parser.add_argument('--analysis-max-side', type=int,
+                        help='Downscale so the longest analyzed side is at most this many pixels')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Analysis worker threads for video (1 = serial loop)')
+    parser.add_argument('--queue-depth', type=int,
+                        help='Frames buffered per pipeline queue (default: 2 x workers)')
+    parser.add_argument('--frame-stride', type=int, default=1,
+                        help='Analyze every Nth video frame; others reuse keyframe density maps')
+    parser.add_argument('--target-fps', type=float,
+                        help='Analyze video frames at this rate instead of a fixed stride')
+    parser.add_argument('--adaptive-threshold', type=float,
+                        help='Analyze a frame when its thumbnail differs from the last keyframe by more than this (0-1)')
+    parser.add_argument('--max-stride', type=int,
+                        help='Longest gap between analyzed frames in adaptive mode (default: 1 second)')
+    parser.add_argument('--fill', choices=['hold', 'interpolate'], default='hold',
+                        help='How skipped frames get density maps')
+    parser.add_argument('--start', type=parse_timestamp,
+                        help='Analyze video from this time (seconds, MM:SS or HH:MM:SS[.fff])')
+    parser.add_argument('--end', type=parse_timestamp, help='Analyze video up to this time')
+    parser.add_argument('--start-frame', type=int, help='Analyze video from this frame number (1-based)')
+    parser.add_argument('--end-frame', type=int, help='Analyze video up to and including this frame number')
+    parser.add_argument('--figure', choices=FIGURE_RENDERERS + ('none',), default='fast',
+                        help='Analysis figure renderer (none = skip the figure)')
+    parser.add_argument('--running-normalization', type=float, nargs='?', const=0.05, metavar='DECAY',
+                        help='Normalize video frames against a running percentile range (default decay: 0.05) '
+                             'so densities are comparable across frames')
+    parser.add_argument('--profile', action='store_true',
+                        help='Record per-stage timing histograms (printed, and added to the video report)')
+    parser.add_argument('--profile-allocations', action='store_true',
+                        help='With --profile, also record peak traced allocations per stage (slower)')
+    parser.add_argument('--zones', help='Camera profile JSON with named rect/polygon zones to report on '
+                                        '(and its perspective, if calibrated)')
+    parser.add_argument('--calibrate-perspective', action='store_true',
+                        help='Treat input as a camera profile JSON: fit its perspective to the annotated heads and '
+                             'save it in the profile')
+    parser.add_argument('--decoder', choices=VIDEO_DECODERS, default='opencv',
+                        help='Video decoder; pyav decodes on FFmpeg threads (requires PyAV)')
+    parser.add_argument('--videos', choices=OUTPUT_VIDEOS + ('none',), nargs='+', default=list(OUTPUT_VIDEOS),
+                        help='Output videos to render (none = analysis only; with --decoder pyav, '
+                             'no blended video means frames are analyzed straight from their luma plane)')
+    parser.add_argument('--flow', type=int, nargs='?', const=160, metavar='MAX_SIDE',
+                        help='Also estimate crowd flow between analyzed video/live frames on a downscaled grayscale '
+                             '(default: at most 160 pixels on a side)')
+    parser.add_argument('--series-format', choices=SERIES_FORMATS, default='npz',
+                        help='Format of the per-frame metrics file <name>_frames.<format> (parquet/arrow need pyarrow)')
+    parser.add_argument('--cache-dir', help='Reuse outputs for inputs already analyzed with the same settings')
+    parser.add_argument('--cache-max-mb', type=int, default=2048,
+                        help='Size limit of --cache-dir; least recently used results are evicted')
+    parser.add_argument('--tiled', action='store_true',
+                        help='Analyze an image in tiles read from disk (for very large stills and orthomosaics)')
+    parser.add_argument('--tile-size', type=int, default=2048, help='Tile size for --tiled, in analyzed pixels')
+    parser.add_argument('--pyramid', action='store_true',
+                        help='Also save zoomable tile pyramids of the full-size heatmap and blended image '
+                             '(<name>_heatmap_tiles.mbtiles, <name>_blended_tiles.mbtiles)')
+    parser.add_argument('--weights', type=float, nargs=3, metavar=('EDGE', 'VARIANCE', 'GRADIENT'),
+                        help='Weights combining the edge, variance and gradient density maps (default: 0.4 0.35 0.25)')
+    parser.add_argument('--level-thresholds', type=float, nargs=5, metavar='T',
+                        help='Mean densities where the Low ... Extremely High crowd levels start '
+                             '(default: 0.1 0.25 0.4 0.6 0.8)')
+    parser.add_argument('--count-threshold', type=float,
+                        help='Fraction of the max density above which pixels count toward the estimate (default: 0.3)')
+    parser.add_argument('--store-features', action='store_true',
+                        help='Keep per-frame feature maps (<name>_features.f16) for --reanalyze')
+    parser.add_argument('--feature-max-side', type=int, default=320,
+                        help='Longest side of stored feature maps')
+    parser.add_argument('--reanalyze', action='store_true',
+                        help='Treat input as a <name>_features.f16 store and analyze it again with the given '
+                             '--weights / thresholds, without decoding the video')
+    parser.add_argument('--live', action='store_true',
+                        help='Analyze a live source, always taking the newest frame (stale frames are dropped)')
+    parser.add_argument('--frame-budget', type=float, default=0.5,
+                        help='With --live, seconds per frame; the analysis scale adapts to stay inside it')
+    parser.add_argument('--duration', type=float, help='With --live, stop after this many seconds')
+    parser.add_argument('--processes', type=int,
+                        help='Worker processes for a batch of images (default: one per CPU)')
+    parser.add_argument('--summary-format', choices=BatchProcessor.SUMMARY_FORMATS, default='jsonl',
+                        help='Batch summary format; parquet (needs pyarrow) also keeps batch_summary.jsonl for resuming')
+    parser.add_argument('--artifacts', action='store_true',
+                        help='In a batch, also save every image\'s heatmaps, density map and report')
+    parser.add_argument('--drift-report', action='store_true',
+                        help='Report accuracy drift of reduced-resolution analysis against full resolution')
+    parser.add_argument('--drift-scales', type=float, nargs='+', default=[0.5, 0.25],
+                        help='Scales compared by --drift-report')
     
     args = parser.parse_args()
     
-    if not os.path.exists(args.input):
+    if args.weights and min(args.weights) < 0:
+        parser.error("--weights must not be negative")
+    if args.level_thresholds and list(args.level_thresholds) != sorted(args.level_thresholds):
+        parser.error("--level-thresholds must be in increasing order")
+    
+    # A directory, or a glob pattern that is not itself an existing file, runs a batch
+    batch = not args.live and (os.path.isdir(args.input) or
+                               (not os.path.exists(args.input) and any(char in args.input for char in '*?[')))
+    if not args.live and not batch and not os.path.exists(args.input):
         logger.error(f"Input file not found: {args.input}")
         return
     
-    analyzer = CrowdAnalyzer()
+    if args.calibrate_perspective:
+        # Fit once and keep the fit with the profile's annotations
+        with open(args.input) as f:
+            profile = json.load(f)
+        annotations = profile.get('perspective', {})
+        perspective = PerspectiveMap.calibrate(annotations.get('heads', []), annotations.get('image_size', (1, 1)),
+                                               annotations.get('person_heads', 3.0))
+        profile['perspective'] = dict(annotations, **perspective.to_profile())
+        with open(args.input, 'w') as f:
+            json.dump(profile, f, indent=2)
+        
+        top, bottom = perspective.head_size
+        print(f"Head size: {top:.2%} of the frame height at the top, {bottom:.2%} at the bottom")
+        print(f"Perspective saved to: {args.input}")
+        return
+    
+    sampler = FrameSampler(stride=args.frame_stride, target_fps=args.target_fps,
+                           adaptive_threshold=args.adaptive_threshold, max_stride=args.max_stride, fill=args.fill)
+    figure = None if args.figure == 'none' else args.figure
+    zones = ZoneLayout.from_file(args.zones) if args.zones else None
+    perspective = PerspectiveMap.from_file(args.zones) if args.zones else None
+    analyzer_options = dict(analysis_scale=args.analysis_scale, analysis_max_side=args.analysis_max_side,
+                            workers=args.workers, queue_depth=args.queue_depth, sampler=sampler, zones=zones,
+                            running_normalization=args.running_normalization,
+                            series_format=args.series_format, store_features=args.store_features,
+                            feature_max_side=args.feature_max_side, tile_size=args.tile_size, perspective=perspective,
+                            decoder=args.decoder, flow_max_side=args.flow,
+                            output_videos=[video for video in args.videos if video != 'none'])
+    density_settings = {}
+    if args.weights:
+        density_settings.update(zip(('edge_weight', 'variance_weight', 'gradient_weight'), args.weights))
+    if args.level_thresholds:
+        density_settings['crowd_level_thresholds'] = tuple(args.level_thresholds)
+    if args.count_threshold is not None:
+        density_settings['count_threshold'] = args.count_threshold
+    
+    if batch:
+        # Many stills: one warmed analyzer per worker process, resumable summary
+        image_paths = BatchProcessor.find_images(args.input)
+        if not image_paths:
+            logger.error(f"No images found: {args.input}")
+            return
+        batch_processor = BatchProcessor(args.output, analyzer_options, density_settings, processes=args.processes,
+                                         summary_format=args.summary_format, artifacts=args.artifacts, figure=figure,
+                                         tiled=args.tiled or None, pyramid=args.pyramid or None)
+        
+        def show(done, total, record):
+            if record['status'] == 'ok':
+                print(f"[{done}/{total}] {record['file']}: ~{record['estimated_count']:,} people "
+                      f"({record['crowd_level']}), {record['elapsed_ms']:.0f} ms")
+            else:
+                print(f"[{done}/{total}] {record['file']}: failed: {record['error']}")
+        
+        try:
+            results = batch_processor.run(image_paths, progress=show)
+        except KeyboardInterrupt:
+            print(f"\nInterrupted; run again to resume from {batch_processor.summary_path}")
+            return
+        
+        print(f"\n{'='*60}")
+        print(f"BATCH ANALYSIS COMPLETE")
+        print(f"{'='*60}")
+        print(f"Images: {results['images']:,} ({results['skipped']:,} already summarized)")
+        print(f"Processed: {results['processed']:,} in {results['elapsed_seconds']:.1f}s, failed: {results['failed']:,}")
+        print(f"Summary: {results['parquet_path'] or results['summary_path']}")
+        return
+    
+    analyzer = CrowdAnalyzer(**analyzer_options,
+                             profiler=StageProfiler(enabled=args.profile, track_allocations=args.profile_allocations),
+                             cache=ResultCache(args.cache_dir, args.cache_max_mb * 1024 * 1024) if args.cache_dir else None)
+    for name, value in density_settings.items():
+        setattr(analyzer.analyzer, name, value)
     
     try:
         input_path = Path(args.input)
         
-        if input_path.suffix.lower() in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
+        if args.drift_report:
+            # Compare reduced-resolution analysis against full resolution
+            drift = analyzer.measure_scale_drift(args.input, args.drift_scales)
+            os.makedirs(args.output, exist_ok=True)
+            report_path = os.path.join(args.output, f"{input_path.stem}_scale_drift_report.txt")
+            analyzer._save_scale_drift_report(drift, report_path)
+            
+            print(f"\n{'='*60}")
+            print(f"SCALE DRIFT REPORT")
+            print(f"{'='*60}")
+            with open(report_path) as f:
+                print(f.read())
+            return
+        
+        if args.reanalyze:
+            # Tuning pass over stored feature maps
+            results = analyzer.reanalyze(args.input, args.output)
+            
+            print(f"\n{'='*60}")
+            print(f"RE-ANALYSIS COMPLETE")
+            print(f"{'='*60}")
+            print(f"Frames: {results['frames']:,} ({results['analyzed_frame_ranges']})")
+            print(f"Weights (edge/variance/gradient): " + " / ".join(f"{w:g}" for w in results['weights'].values()))
+            print(f"Total people detected: {results['total_people_detected']:,}")
+            print(f"Average per frame: {results['average_people_per_frame']:.1f}")
+            print(f"Max in single frame: {results['max_people_in_frame']:,}")
+            print(f"Final crowd level: {results['final_analysis']['overall']['crowd_level']}")
+            print(f"\nResults saved to: {args.output}")
+            return
+        
+        if args.live:
+            # Live source: print rolling statistics, keep the latest heatmap
+            source = int(args.input) if args.input.isdigit() else args.input
+            os.makedirs(args.output, exist_ok=True)
+            heatmap_path = os.path.join(args.output, 'live_blended.jpg')
+            stop = threading.Event()
+            timer = None
+            if args.duration:
+                timer = threading.Timer(args.duration, stop.set)
+                timer.daemon = True
+                timer.start()
+            
+            def show(update, jpeg):
+                with open(heatmap_path, 'wb') as f:
+                    f.write(jpeg)
+                print(f"#{update['sequence']}: ~{update['estimated_count']:,} people ({update['crowd_level']}), "
+                      f"{update['rolling']['window_seconds']:.0f}s mean {update['rolling']['count_mean']:,.0f}, "
+                      f"latency {update['latency_ms']:.0f} ms, scale {update['analysis_scale']:.2f}, "
+                      f"dropped {update['frames_dropped']:,}")
+            
+            try:
+                counters = analyzer.process_stream(source, show, stop=stop, frame_budget=args.frame_budget)
+            except KeyboardInterrupt:
+                return
+            finally:
+                stop.set()
+                if timer:
+                    timer.cancel()
+            print(f"\nFrames read: {counters['frames_read']:,}, analyzed: {counters['frames_analyzed']:,}, "
+                  f"dropped: {counters['frames_dropped']:,}")
+            print(f"Latest heatmap: {heatmap_path}")
+            return
+        
+        if input_path.suffix.lower() in IMAGE_EXTENSIONS:
             # Process image
-            results = analyzer.process_image(args.input, args.output)
+            results = analyzer.process_image(args.input, args.output, figure=figure, tiled=args.tiled or None,
+                                             pyramid=args.pyramid or None)
             
             print(f"\n{'='*60}")
             print(f"IMAGE ANALYSIS COMPLETE")
             print(f"{'='*60}")
+            if results.get('cached'):
+                print(f"Results restored from cache")
+            if results.get('tiled'):
+                print(f"Analyzed in tiles; heatmap and blended images are previews")
+            if results.get('pyramid'):
+                print(f"Tile pyramids: {results['pyramid']['max_zoom'] + 1} zoom levels of "
+                      f"{results['pyramid']['tile_size']}px tiles")
             print(f"Estimated crowd count: {results['analysis']['estimated_count']['estimated_count']:,}")
             print(f"Crowd level: {results['analysis']['overall']['crowd_level']}")
             print(f"Highest density region: {results['analysis']['highest_density_region']}")
             print(f"Confidence: {results['analysis']['estimated_count']['confidence']:.1%}")
+            for name, stats in results['analysis'].get('zones', {}).items():
+                print(f"Zone {name}: {stats['crowd_level']}, ~{stats['estimated_count']:,} people")
             
         elif input_path.suffix.lower() in ['.mp4', '.avi', '.mov', '.mkv', '.wmv']:
             # Process video
-            results = analyzer.process_video(args.input, args.output)
+            video_range = None
+            if any(bound is not None for bound in (args.start, args.end, args.start_frame, args.end_frame)):
+                video_range = VideoRange(args.start, args.end, args.start_frame, args.end_frame)
+            results = analyzer.process_video(args.input, args.output, figure=figure, video_range=video_range)
             
             print(f"\n{'='*60}")
             print(f"VIDEO ANALYSIS COMPLETE")
             print(f"{'='*60}")
+            if results.get('cached'):
+                print(f"Results restored from cache")
             print(f"Total frames: {results['total_frames']:,}")
+            if results['range']:
+                print(f"Time span: {format_timestamp(results['start_time'])} - {format_timestamp(results['end_time'])} "
+                      f"(frames {results['first_frame']:,}-{results['last_frame']:,})")
+            if results['sampling']:
+                print(f"Frames analyzed: {results['analyzed_frames']:,} ({results['sampling']})")
             print(f"Total people detected: {results['total_people_detected']:,}")
             print(f"Average per frame: {results['average_people_per_frame']:.1f}")
             print(f"Max in single frame: {results['max_people_in_frame']:,}")
             print(f"Final crowd level: {results['final_analysis']['overall']['crowd_level']}")
             print(f"\nGenerated videos:")
-            print(f"  - Blended video: {input_path.stem}_blended_output.mp4")
-            print(f"  - Heatmap video: {input_path.stem}_heatmap_video.mp4")
+            if 'blended' in analyzer.output_videos:
+                print(f"  - Blended video: {input_path.stem}_blended_output.mp4")
+            if 'heatmap' in analyzer.output_videos:
+                print(f"  - Heatmap video: {input_path.stem}_heatmap_video.mp4")
+            print(f"  - Per-frame series: {os.path.basename(results['series_path'])}")
             
         else:
             logger.error(f"Unsupported file format: {input_path.suffix}")
             return
         
+        if args.profile:
+            print(f"\nStage profile (p50 / p90 ms):")
+            for stage, stage_stats in analyzer.profiler.summary().items():
+                print(f"  {stage:<16} {stage_stats['time_ms']['p50']:8.2f} / {stage_stats['time_ms']['p90']:.2f}")
+        
         print(f"\nResults saved to: {args.output}")
         
     except Exception as e:
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Background analysis jobs for the Trinetra web application
+Bounded queue and worker pool with progress, results and cancellation
+"""
+
+import queue
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+class JobCancelled(Exception):
+    """Raised from a job's progress callback once cancellation is requested"""
+
+class JobQueueFull(Exception):
+    """Raised when the job queue is at its queued-job limit"""
+
+class Job:
+    def __init__(self, filename: str, file_path: str, output_dir: str, file_type: str, camera: str = None,
+                 video_range=None):
+        """Initialize a queued analysis job for an uploaded file (optionally a VideoRange of a video)"""
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.file_path = file_path
+        self.output_dir = output_dir
+        self.file_type = file_type
+        self.camera = camera
+        self.video_range = video_range
+        
+        self.status = 'queued'  # queued, running, completed, failed or cancelled
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.frames_done = 0
+        self.total_frames = 0
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ('completed', 'failed', 'cancelled')
+    
+    def update_progress(self, frames_done: int, total_frames: int):
+        """Progress callback for the analyzer; raises JobCancelled to stop processing"""
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+        self.frames_done = frames_done
+        # Container frame counts can be missing or low, so never report fewer than done
+        self.total_frames = max(total_frames, frames_done)
+    
+    def to_dict(self) -> Dict:
+        """Get the job status with frames done, fps and ETA"""
+        elapsed = None
+        fps = None
+        eta = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            if self.frames_done and elapsed > 0:
+                fps = self.frames_done / elapsed
+                if self.status == 'running' and self.total_frames:
+                    eta = (self.total_frames - self.frames_done) / fps
+        
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'type': self.file_type,
+            'filename': self.filename,
+            'camera': self.camera,
+            'range': self.video_range.describe() if self.video_range else None,
+            'progress': {
+                'frames_done': self.frames_done,
+                'total_frames': self.total_frames,
+                'percent': 100.0 * self.frames_done / self.total_frames if self.total_frames else None,
+                'fps': fps,
+                'eta_seconds': eta,
+                'elapsed_seconds': elapsed
+            },
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'cancel_requested': self._cancel.is_set(),
+            'error': self.error
+        }
+
+class JobManager:
+    def __init__(self, run_job, workers: int = 2, max_queued: int = 32, retention: float = 3600, discard_job=None):
+        """Initialize the job queue and start its worker threads
+        
+        run_job(job) does the analysis and returns the job result; it should
+        pass job.update_progress as the progress callback. discard_job(job)
+        cleans up after jobs cancelled before they started. At most
+        max_queued jobs wait for a worker; finished jobs are forgotten after
+        retention seconds.
+        """
+        if workers < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        self.run_job = run_job
+        self.discard_job = discard_job
+        self.workers = workers
+        self.max_queued = max_queued
+        self.retention = retention
+        
+        self._jobs = OrderedDict()  # Job ID -> Job, in submission order
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, name=f'crowd-job-{i}', daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+    
+    def submit(self, job: Job) -> Job:
+        """Queue a job, raising JobQueueFull at the queued-job limit"""
+        with self._lock:
+            self._prune()
+            if self._queued_count() >= self.max_queued:
+                raise JobQueueFull(f"Job queue is full ({self.max_queued} jobs waiting)")
+            self._jobs[job.id] = job
+        self._queue.put(job)
+        logger.info(f"Queued job {job.id} for {job.filename}")
+        return job
+    
+    def get(self, job_id: str) -> Job:
+        """Get a job by ID (None if unknown or expired)"""
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def cancel(self, job_id: str) -> Job:
+        """Request cancellation; queued jobs are dropped, running jobs stop at the next frame"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return job
+            job._cancel.set()
+            if job.status == 'queued':
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+        return job
+    
+    def queue_position(self, job: Job) -> int:
+        """Get the number of queued jobs ahead of a queued job (None once it has started)"""
+        with self._lock:
+            if job.status != 'queued':
+                return None
+            position = 0
+            for other in self._jobs.values():
+                if other is job:
+                    return position
+                if other.status == 'queued':
+                    position += 1
+        return None
+    
+    def stats(self) -> Dict:
+        """Get job counts by status"""
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {'workers': self.workers, 'max_queued': self.max_queued, 'jobs': counts}
+    
+    def _queued_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == 'queued')
+    
+    def _prune(self):
+        """Forget finished jobs older than the retention period (lock held)"""
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+    
+    def _work(self):
+        """Worker loop: run queued jobs one at a time"""
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                cancelled = job.status != 'queued'
+                if not cancelled:
+                    job.status = 'running'
+                    job.started_at = time.time()
+            
+            if cancelled:
+                # Cancelled while waiting
+                if self.discard_job:
+                    self.discard_job(job)
+                continue
+            
+            try:
+                result = self.run_job(job)
+                status, error = 'completed', None
+            except JobCancelled:
+                result, status, error = None, 'cancelled', None
+                logger.info(f"Job {job.id} cancelled after {job.frames_done} frames")
+            except Exception as e:
+                result, status, error = None, 'failed', str(e)
+                logger.exception(f"Job {job.id} failed")
+            
+            with self._lock:
+                job.result = result
+                job.error = error
+                job.status = status
+                job.finished_at = time.time()
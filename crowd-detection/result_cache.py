@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Content-addressed result cache for crowd analysis
+Keeps analysis outputs keyed by input file hash plus analyzer parameters,
+with size-bounded least-recently-used eviction on disk
+"""
+
+import os
+import shutil
+import hashlib
+import json
+import threading
+import time
+import uuid
+import logging
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Bump when analysis output changes for the same parameters, to invalidate old entries
+CACHE_VERSION = 2
+
+def _link_or_copy(source: str, destination: str):
+    """Hard-link a file, copying when links are not possible (e.g. across filesystems)"""
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+class ResultCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3):
+        """Initialize an on-disk result cache of at most max_bytes
+        
+        Each entry is a directory named by its key holding the output files
+        (with the original name prefix stripped) and entry.json. Entries are
+        hard-linked in and out where possible, so hits cost milliseconds and
+        cached outputs do not double disk use while they are still in place.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    @staticmethod
+    def file_hash(path: str) -> str:
+        """Get the SHA-256 hex digest of a file's contents"""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def key(self, path: str, params: Dict) -> str:
+        """Get the cache key for an input file and the parameters that affect its analysis"""
+        params_json = json.dumps({'version': CACHE_VERSION, 'params': params}, sort_keys=True, default=str)
+        digest = hashlib.sha256(self.file_hash(path).encode())
+        digest.update(params_json.encode())
+        return digest.hexdigest()
+    
+    def restore(self, key: str, output_dir: str, base_name: str) -> Dict:
+        """Restore a cached entry's files as <base_name>_<suffix> in output_dir
+        
+        Returns the entry metadata, or None on a miss.
+        """
+        entry_dir = os.path.join(self.cache_dir, key)
+        entry_path = os.path.join(entry_dir, 'entry.json')
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+            
+            os.makedirs(output_dir, exist_ok=True)
+            for suffix in entry['files']:
+                destination = os.path.join(output_dir, f"{base_name}_{suffix}")
+                if os.path.exists(destination):
+                    os.remove(destination)
+                _link_or_copy(os.path.join(entry_dir, suffix), destination)
+            
+            # The entry file's mtime is the last use for LRU eviction
+            os.utime(entry_path)
+        except (OSError, ValueError, KeyError):
+            # Missing, evicted while restoring or corrupt
+            return None
+        
+        logger.info(f"Result cache hit: {key[:12]}")
+        return entry
+    
+    def store(self, key: str, output_dir: str, base_name: str, suffixes: List[str], metadata: Dict = None):
+        """Add the <base_name>_<suffix> files in output_dir to the cache, then evict down to max_bytes
+        
+        Suffixes without a file (e.g. a figure not rendered yet) are skipped.
+        metadata must be JSON-serializable; restore returns it with the entry.
+        """
+        files = [suffix for suffix in suffixes
+                 if os.path.exists(os.path.join(output_dir, f"{base_name}_{suffix}"))]
+        
+        entry_dir = os.path.join(self.cache_dir, key)
+        if os.path.exists(entry_dir):
+            return
+        
+        # Build the entry under a temporary name so readers never see a partial one
+        temp_dir = os.path.join(self.cache_dir, f".{key}.{uuid.uuid4().hex}.tmp")
+        os.makedirs(temp_dir)
+        try:
+            size = 0
+            for suffix in files:
+                destination = os.path.join(temp_dir, suffix)
+                _link_or_copy(os.path.join(output_dir, f"{base_name}_{suffix}"), destination)
+                size += os.path.getsize(destination)
+            
+            entry = {
+                'key': key,
+                'created': time.time(),
+                'files': files,
+                'size': size,
+                'metadata': metadata or {}
+            }
+            with open(os.path.join(temp_dir, 'entry.json'), 'w') as f:
+                json.dump(entry, f)
+            
+            os.rename(temp_dir, entry_dir)
+        except OSError as e:
+            # Another process stored the same key first, or the disk is full
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            if not os.path.exists(entry_dir):
+                logger.warning(f"Could not cache results for {base_name}: {str(e)}")
+            return
+        
+        self.evict()
+    
+    def detach(self, output_dir: str, base_name: str, suffixes: List[str]):
+        """Unlink outputs that share their data with a cache entry before they are overwritten
+        
+        Cached files are hard links, so writing to an output in place would
+        also change the cached copy.
+        """
+        for suffix in suffixes:
+            path = os.path.join(output_dir, f"{base_name}_{suffix}")
+            if os.path.exists(path) and os.stat(path).st_nlink > 1:
+                os.remove(path)
+    
+    def entries(self) -> List[Dict]:
+        """List cache entries as {'key', 'size', 'last_used'}, least recently used first"""
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_path = os.path.join(self.cache_dir, key, 'entry.json')
+            try:
+                with open(entry_path) as f:
+                    size = json.load(f)['size']
+                entries.append({'key': key, 'size': size, 'last_used': os.path.getmtime(entry_path)})
+            except (OSError, ValueError, KeyError):
+                continue
+        return sorted(entries, key=lambda entry: entry['last_used'])
+    
+    def evict(self):
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        with self._lock:
+            entries = self.entries()
+            total = sum(entry['size'] for entry in entries)
+            for entry in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(os.path.join(self.cache_dir, entry['key']), ignore_errors=True)
+                total -= entry['size']
+                logger.info(f"Evicted cached result {entry['key'][:12]} ({entry['size'] / 1024 ** 2:.1f} MB)")
+    
+    def stats(self) -> Dict:
+        """Get entry count and size"""
+        entries = self.entries()
+        return {
+            'entries': len(entries),
+            'size_bytes': sum(entry['size'] for entry in entries),
+            'max_bytes': self.max_bytes
+        }
@@ -127,17 +127,22 @@ class TrinetraApp {
         formData.append('file', file);
 
         try {
-            // Upload and analyze
-            const response = await fetch('/api/analyze', {
+            // Upload and queue the analysis job
+            const response = await fetch('/api/jobs', {
                 method: 'POST',
                 body: formData
             });
 
-            const result = await response.json();
+            const job = await response.json();
+            if (!job.success) {
+                this.showError(job.error || 'Analysis failed');
+                return;
+            }
 
-            if (result.success) {
+            const result = await this.waitForJob(job);
+            if (result && result.success) {
                 this.displayResults(result);
-            } else {
+            } else if (result) {
                 this.showError(result.error || 'Analysis failed');
             }
         } catch (error) {
@@ -148,6 +153,48 @@ class TrinetraApp {
         }
     }
 
+    async waitForJob(job) {
+        // Poll the job until it finishes, showing progress in the loading overlay
+        while (true) {
+            if (job.status === 'completed') {
+                const response = await fetch(job.result_url);
+                return await response.json();
+            }
+            if (job.status === 'failed') {
+                return { success: false, error: job.error || 'Analysis failed' };
+            }
+            if (job.status === 'cancelled') {
+                this.showError('Analysis was cancelled.');
+                return null;
+            }
+
+            this.loadingText.textContent = this.formatJobProgress(job);
+            await new Promise(resolve => setTimeout(resolve, 1000));
+
+            const response = await fetch(job.status_url);
+            job = await response.json();
+        }
+    }
+
+    formatJobProgress(job) {
+        if (job.status === 'queued') {
+            return job.queue_position ? `Queued (${job.queue_position} ahead)...` : 'Queued...';
+        }
+        const progress = job.progress;
+        if (!progress.total_frames || job.type !== 'video') {
+            return 'Analyzing your media...';
+        }
+        let text = `Analyzing frame ${progress.frames_done} of ${progress.total_frames}`;
+        if (progress.fps) {
+            text += ` (${progress.fps.toFixed(1)} fps`;
+            if (progress.eta_seconds !== null) {
+                text += `, about ${Math.ceil(progress.eta_seconds)}s left`;
+            }
+            text += ')';
+        }
+        return text + '...';
+    }
+
     validateFile(file) {
         const maxSize = 100 * 1024 * 1024; // 100MB
         const allowedTypes = [
@@ -283,14 +330,30 @@ class TrinetraApp {
         this.imageRegion.textContent = result.analysis.highest_density_region.replace('_', ' ').toUpperCase();
 
         // Update images
-        this.heatmapImage.src = `data:image/png;base64,${result.images.heatmap}`;
-        this.blendedImage.src = `data:image/jpeg;base64,${result.images.blended}`;
-        this.analysisImage.src = `data:image/png;base64,${result.images.analysis}`;
+        this.heatmapImage.src = result.images.heatmap;
+        this.blendedImage.src = result.images.blended;
+        this.analysisImage.src = result.figures.analysis;
+
+        // Large images come with tile pyramids: zoomable viewers fetch only the tiles in view
+        this.showTiles(this.heatmapImage, result.tiles, 'heatmap', `${result.images.heatmap}?width=640`);
+        this.showTiles(this.blendedImage, result.tiles, 'blended', `${result.images.blended}?width=640`);
 
         // Display road analysis
         this.displayRoadAnalysis(result.analysis.regions);
     }
 
+    showTiles(image, tiles, layer, backdrop) {
+        const container = image.parentElement;
+        const previous = container.querySelector('.tile-viewer');
+        if (previous) {
+            previous.remove();
+        }
+        image.style.display = tiles ? 'none' : '';
+        if (tiles) {
+            new TileViewer(container, tiles, layer, backdrop);
+        }
+    }
+
     displayVideoResults(result) {
         this.analysisType.textContent = 'Video Analysis';
         this.imageAnalysis.style.display = 'none';
@@ -301,21 +364,21 @@ class TrinetraApp {
         this.videoAverage.textContent = result.analysis.average_people_per_frame.toFixed(1);
         this.videoMax.textContent = result.analysis.max_people_in_frame.toLocaleString();
 
-        // Update videos for playback
+        // Update videos for playback (served with byte ranges, so seeking does not re-download)
         this.blendedSource.src = result.videos.blended_video;
         this.heatmapSource.src = result.videos.heatmap_video;
+        this.blendedVideo.poster = result.thumbnails.blended_video;
+        this.heatmapVideo.poster = result.thumbnails.heatmap_video;
         this.blendedVideo.load();
         this.heatmapVideo.load();
 
-        // Update download links (use download route for actual downloads)
-        const blendedFilename = result.videos.blended_video.split('/').pop();
-        const heatmapFilename = result.videos.heatmap_video.split('/').pop();
-        this.blendedDownload.href = `/download/${blendedFilename}`;
-        this.heatmapDownload.href = `/download/${heatmapFilename}`;
+        // Update download links
+        this.blendedDownload.href = `${result.videos.blended_video}?download=1`;
+        this.heatmapDownload.href = `${result.videos.heatmap_video}?download=1`;
 
         // Update final images
-        this.finalHeatmapImage.src = `data:image/png;base64,${result.images.final_heatmap}`;
-        this.finalAnalysisImage.src = `data:image/png;base64,${result.images.final_analysis}`;
+        this.finalHeatmapImage.src = result.images.final_heatmap;
+        this.finalAnalysisImage.src = result.figures.final_analysis;
 
         // Display road analysis
         this.displayRoadAnalysis(result.analysis.final_regions);
@@ -434,6 +497,128 @@ class TrinetraApp {
     }
 }
 
+// Zoomable viewer for an image's XYZ tile pyramid (wheel or double-click to zoom, drag to pan)
+class TileViewer {
+    constructor(container, tiles, layer, backdrop) {
+        this.tiles = tiles;
+        this.template = tiles.layers[layer];
+        this.loaded = new Map();  // 'z/x/y' -> tile element
+
+        this.element = document.createElement('div');
+        this.element.className = 'tile-viewer';
+        this.element.style.aspectRatio = `${tiles.width} / ${tiles.height}`;
+        // Preview shown under the tiles while they load
+        this.backdrop = document.createElement('img');
+        this.backdrop.className = 'tile-backdrop';
+        this.backdrop.src = backdrop;
+        this.backdrop.alt = layer;
+        this.element.appendChild(this.backdrop);
+        container.insertBefore(this.element, container.querySelector('img'));
+
+        this.fit();
+        this.bindEvents();
+        window.addEventListener('resize', () => this.fit());
+    }
+
+    fit() {
+        // Scale is screen pixels per full-size image pixel; origin is the image point at the top left
+        this.minScale = this.element.clientWidth / this.tiles.width;
+        this.scale = this.minScale;
+        this.originX = 0;
+        this.originY = 0;
+        this.render();
+    }
+
+    bindEvents() {
+        this.element.addEventListener('wheel', (event) => {
+            event.preventDefault();
+            this.zoomAt(event, event.deltaY < 0 ? 1.25 : 0.8);
+        }, { passive: false });
+        this.element.addEventListener('dblclick', (event) => this.zoomAt(event, 2));
+
+        let drag = null;
+        this.element.addEventListener('pointerdown', (event) => {
+            drag = { x: event.clientX, y: event.clientY };
+            this.element.setPointerCapture(event.pointerId);
+        });
+        this.element.addEventListener('pointermove', (event) => {
+            if (!drag) {
+                return;
+            }
+            this.originX -= (event.clientX - drag.x) / this.scale;
+            this.originY -= (event.clientY - drag.y) / this.scale;
+            drag = { x: event.clientX, y: event.clientY };
+            this.render();
+        });
+        this.element.addEventListener('pointerup', () => { drag = null; });
+    }
+
+    zoomAt(event, factor) {
+        const bounds = this.element.getBoundingClientRect();
+        const x = event.clientX - bounds.left;
+        const y = event.clientY - bounds.top;
+        // Keep the image point under the cursor in place; never zoom past 4 screen pixels per image pixel
+        const scale = Math.min(4, Math.max(this.minScale, this.scale * factor));
+        this.originX += x / this.scale - x / scale;
+        this.originY += y / this.scale - y / scale;
+        this.scale = scale;
+        this.render();
+    }
+
+    render() {
+        const { width, height, tile_size: tileSize, max_zoom: maxZoom } = this.tiles;
+        const viewWidth = this.element.clientWidth / this.scale;
+        const viewHeight = this.element.clientHeight / this.scale;
+        this.originX = Math.min(Math.max(0, this.originX), Math.max(0, width - viewWidth));
+        this.originY = Math.min(Math.max(0, this.originY), Math.max(0, height - viewHeight));
+
+        this.backdrop.style.left = `${-this.originX * this.scale}px`;
+        this.backdrop.style.top = `${-this.originY * this.scale}px`;
+        this.backdrop.style.width = `${width * this.scale}px`;
+        this.backdrop.style.height = `${height * this.scale}px`;
+
+        // Coarsest zoom with at least one tile pixel per screen pixel; each zoom below max halves the image
+        const zoom = Math.max(0, Math.min(maxZoom, maxZoom - Math.floor(Math.log2(1 / this.scale))));
+        const factor = 2 ** (maxZoom - zoom);
+        const levelWidth = Math.ceil(width / factor);
+        const levelHeight = Math.ceil(height / factor);
+        const span = tileSize * factor;
+        const firstX = Math.floor(this.originX / span);
+        const lastX = Math.min(Math.ceil(levelWidth / tileSize) - 1, Math.floor((this.originX + viewWidth) / span));
+        const firstY = Math.floor(this.originY / span);
+        const lastY = Math.min(Math.ceil(levelHeight / tileSize) - 1, Math.floor((this.originY + viewHeight) / span));
+
+        const visible = new Set();
+        for (let y = firstY; y <= lastY; y++) {
+            for (let x = firstX; x <= lastX; x++) {
+                const key = `${zoom}/${x}/${y}`;
+                visible.add(key);
+                let tile = this.loaded.get(key);
+                if (!tile) {
+                    tile = document.createElement('img');
+                    tile.className = 'tile';
+                    tile.src = this.template.replace('{z}', zoom).replace('{x}', x).replace('{y}', y);
+                    this.element.appendChild(tile);
+                    this.loaded.set(key, tile);
+                }
+                // Edge tiles are cropped to the image
+                tile.style.left = `${(x * span - this.originX) * this.scale}px`;
+                tile.style.top = `${(y * span - this.originY) * this.scale}px`;
+                tile.style.width = `${Math.min(tileSize, levelWidth - x * tileSize) * factor * this.scale}px`;
+                tile.style.height = `${Math.min(tileSize, levelHeight - y * tileSize) * factor * this.scale}px`;
+            }
+        }
+
+        // Drop tiles out of view or from other zooms (the browser cache keeps them for later)
+        this.loaded.forEach((tile, key) => {
+            if (!visible.has(key)) {
+                tile.remove();
+                this.loaded.delete(key);
+            }
+        });
+    }
+}
+
 // Add CSS for animations
 const style = document.createElement('style');
 style.textContent = `
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Live stream sessions for the Trinetra web application
+Runs streaming analysis on background threads and fans updates out to subscribers
+"""
+
+import queue
+import threading
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+class StreamLimitReached(Exception):
+    """Raised when the maximum number of live streams are already running"""
+
+class StreamSession:
+    def __init__(self, source, camera: str = None, frame_budget: float = 0.5):
+        """Initialize a live analysis session for a camera index or stream URL"""
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.camera = camera
+        self.frame_budget = frame_budget
+        
+        self.status = 'connecting'  # connecting, running, stopped or failed
+        self.started_at = time.time()
+        self.finished_at = None
+        self.update = None  # Latest analysis update
+        self.jpeg = None  # Latest blended heatmap
+        self.counters = None
+        self.error = None
+        self.stop_event = threading.Event()
+        self._subscribers = []
+        self._lock = threading.Lock()
+    
+    @property
+    def finished(self) -> bool:
+        return self.status in ('stopped', 'failed')
+    
+    def finished_before(self, cutoff: float) -> bool:
+        """Check whether the session finished before cutoff (a time.time() value)"""
+        with self._lock:
+            return self.finished and self.finished_at < cutoff
+    
+    def publish(self, update: Dict, jpeg: bytes):
+        """Store the latest update and push it to every subscriber
+        
+        A subscriber that has fallen behind loses its oldest pending update,
+        so slow clients always catch up to the newest one.
+        """
+        with self._lock:
+            self.status = 'running'
+            self.update = update
+            self.jpeg = jpeg
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            self._offer(subscriber, update)
+    
+    def finish(self, status: str, error: str = None):
+        """Mark the session finished and wake subscribers with a final None"""
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            self._offer(subscriber, None)
+    
+    @staticmethod
+    def _offer(subscriber: queue.Queue, item):
+        while True:
+            try:
+                subscriber.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+    
+    def subscribe(self, depth: int = 4) -> queue.Queue:
+        """Get a queue receiving updates (None once the session finishes), starting with the latest"""
+        subscriber = queue.Queue(maxsize=depth)
+        with self._lock:
+            if self.update is not None:
+                subscriber.put_nowait(self.update)
+            if self.finished:
+                subscriber.put_nowait(None)
+            else:
+                self._subscribers.append(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+    
+    def to_dict(self) -> Dict:
+        """Get the session status with its latest update"""
+        return {
+            'stream_id': self.id,
+            'status': self.status,
+            'source': self.source,
+            'camera': self.camera,
+            'frame_budget_ms': self.frame_budget * 1000,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'subscribers': len(self._subscribers),
+            'latest': self.update,
+            'counters': self.counters,
+            'error': self.error
+        }
+
+class StreamManager:
+    def __init__(self, run_stream, max_streams: int = 4, retention: float = 600):
+        """Initialize the live stream registry
+        
+        run_stream(session) runs the analysis until session.stop_event is set,
+        publishing updates with session.publish, and returns the final capture
+        counters. At most max_streams sessions run at once; finished sessions
+        are forgotten after retention seconds.
+        """
+        self.run_stream = run_stream
+        self.max_streams = max_streams
+        self.retention = retention
+        self._sessions = OrderedDict()  # Stream ID -> StreamSession, in start order
+        self._lock = threading.Lock()
+    
+    def start(self, session: StreamSession) -> StreamSession:
+        """Start a session on its own thread, raising StreamLimitReached at the stream limit"""
+        with self._lock:
+            self._prune()
+            if sum(1 for other in self._sessions.values() if not other.finished) >= self.max_streams:
+                raise StreamLimitReached(f"Stream limit reached ({self.max_streams} live streams running)")
+            self._sessions[session.id] = session
+        threading.Thread(target=self._run, args=(session,), name=f'crowd-stream-{session.id[:8]}',
+                         daemon=True).start()
+        logger.info(f"Started stream {session.id} for {session.source}")
+        return session
+    
+    def get(self, stream_id: str) -> StreamSession:
+        """Get a session by ID (None if unknown or expired)"""
+        with self._lock:
+            return self._sessions.get(stream_id)
+    
+    def sessions(self):
+        """Get all sessions not yet forgotten, in start order"""
+        with self._lock:
+            self._prune()
+            return list(self._sessions.values())
+    
+    def stop(self, stream_id: str) -> StreamSession:
+        """Request a session to stop; it finishes after the frame in progress"""
+        session = self.get(stream_id)
+        if session is not None:
+            session.stop_event.set()
+        return session
+    
+    def stats(self) -> Dict:
+        """Get session counts by status"""
+        counts = {}
+        for session in self.sessions():
+            counts[session.status] = counts.get(session.status, 0) + 1
+        return {'max_streams': self.max_streams, 'streams': counts}
+    
+    def _prune(self):
+        """Forget finished sessions older than the retention period (lock held)"""
+        cutoff = time.time() - self.retention
+        for stream_id in [stream_id for stream_id, session in self._sessions.items()
+                          if session.finished_before(cutoff)]:
+            del self._sessions[stream_id]
+    
+    def _run(self, session: StreamSession):
+        """Session thread: run the analysis and record how it ended"""
+        try:
+            session.counters = self.run_stream(session)
+            session.finish('stopped')
+        except Exception as e:
+            logger.exception(f"Stream {session.id} failed")
+            session.finish('failed', str(e))
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Tests for the crowd analyzer's deterministic building blocks
+Run with python test_crowd_analyzer.py (or pytest)
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from crowd_analyzer import (CROWD_LEVELS, BatchProcessor, CrowdDensityAnalyzer, FrameSeries, VideoProcessor, VideoRange,
+                            ZoneLayout, convert_numpy_types, parse_timestamp)
+from benchmarks.synthetic import SyntheticCrowd
+
+def write_synthetic_video(path: str, size=(320, 240), frame_count: int = 12, fps: int = 10):
+    """Write a small synthetic crowd video"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    scene = SyntheticCrowd(size, seed=1, people_per_megapixel=20000)
+    for _ in range(frame_count):
+        writer.write(scene.frame())
+        scene.step()
+    writer.release()
+
+class TestFusedDensity(unittest.TestCase):
+    def test_fused_matches_per_method(self):
+        # The single-pass float32 kernel matches the per-method maps on the normalized map
+        for size in ((640, 480), (1920, 1080)):
+            frame = SyntheticCrowd(size, seed=0).frame()
+            fused, _ = CrowdDensityAnalyzer().analyze_frame(frame)
+            per_method, _ = CrowdDensityAnalyzer(fused=False).analyze_frame(frame)
+            self.assertLessEqual(float(np.abs(fused - per_method).max()), 1e-5, size)
+
+class TestVideoWorkers(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.video_path = os.path.join(self.directory, 'crowd.mp4')
+        write_synthetic_video(self.video_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def process(self, workers: int) -> dict:
+        processor = VideoProcessor(CrowdDensityAnalyzer(), workers=workers, flow_max_side=160)
+        return processor.process_video(self.video_path)
+
+    def test_workers_match_serial(self):
+        serial = self.process(1)
+        threaded = self.process(3)
+
+        self.assertEqual(serial['total_frames'], 12)
+        self.assertEqual(threaded['total_frames'], 12)
+        self.assertEqual(json.dumps(convert_numpy_types(threaded['frame_analyses']), sort_keys=True),
+                         json.dumps(convert_numpy_types(serial['frame_analyses']), sort_keys=True))
+        self.assertIn('flow', serial['frame_analyses'][-1])
+        for expected, actual in zip(serial['heatmap_frames'], threaded['heatmap_frames']):
+            np.testing.assert_array_equal(actual, expected)
+        np.testing.assert_array_equal(threaded['final_density_map'], serial['final_density_map'])
+        self.assertEqual(convert_numpy_types(threaded['statistics']), convert_numpy_types(serial['statistics']))
+
+class TestZoneLayout(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.density = rng.random((97, 131)).astype(np.float32)
+        self.integral = cv2.integral(self.density, sdepth=cv2.CV_64F)
+        self.layout = ZoneLayout([
+            {'name': 'left', 'rect': [0, 0, 1 / 3, 1]},
+            {'name': 'corner', 'rect': [0.9, 0.95, 1, 1]},
+            {'name': 'box', 'polygon': [[0.2, 0.3], [0.7, 0.3], [0.7, 0.8], [0.2, 0.8]]},
+            {'name': 'triangle', 'polygon': [[0.1, 0.1], [0.9, 0.2], [0.5, 0.9]]}
+        ])
+
+    @staticmethod
+    def classify(mean: float) -> str:
+        return 'High' if mean > 0.5 else 'Low'
+
+    def test_measure_matches_brute_force(self):
+        count_map = (self.density > 0.7).astype(np.float32)
+        stats = self.layout.measure(self.density, self.integral, 2.0, self.classify, count_map=count_map,
+                                    estimated_count=1000)
+        self.assertEqual(list(stats), ['left', 'corner', 'box', 'triangle'])
+
+        for name, mask in self.layout.masks(self.density.shape):
+            inside = mask > 0
+            values = self.density[inside]
+            self.assertAlmostEqual(stats[name]['mean_density'], values.mean(), places=5, msg=name)
+            self.assertAlmostEqual(stats[name]['max_density'], values.max(), places=6, msg=name)
+            self.assertAlmostEqual(stats[name]['total_density'], 2.0 * values.sum(dtype=np.float64), places=2, msg=name)
+            self.assertEqual(stats[name]['crowd_level'], self.classify(values.mean()), name)
+            share = count_map[inside].sum() / count_map.sum()
+            self.assertEqual(stats[name]['estimated_count'], int(round(1000 * share)), name)
+
+    def test_rect_bounds(self):
+        # 1/3 of 131 columns floors to 43; the thin corner zone still covers at least one pixel per side
+        (_, left), (_, corner) = self.layout.masks(self.density.shape)[:2]
+        self.assertEqual(np.argwhere(left.any(axis=0)).ravel().tolist(), list(range(43)))
+        self.assertEqual(np.count_nonzero(left), 43 * 97)
+        self.assertTrue(corner.any())
+
+    def test_polygon_matches_equal_rect(self):
+        # A polygon covering the same area as a rect selects the same pixels at any map size
+        layout = ZoneLayout([
+            {'name': 'rect', 'rect': [0.25, 1 / 3, 0.75, 0.9]},
+            {'name': 'polygon', 'polygon': [[0.25, 1 / 3], [0.75, 1 / 3], [0.75, 0.9], [0.25, 0.9]]}
+        ])
+        for shape in ((97, 131), (30, 40), (7, 5), (480, 640)):
+            (_, rect), (_, polygon) = layout.masks(shape)
+            np.testing.assert_array_equal(rect > 0, polygon > 0, err_msg=str(shape))
+
+    def test_invalid_zones(self):
+        with self.assertRaises(ValueError):
+            ZoneLayout([{'name': 'a', 'rect': [0.5, 0, 0.4, 1]}])
+        with self.assertRaises(ValueError):
+            ZoneLayout([{'name': 'a', 'rect': [0, 0, 1, 1]}, {'name': 'a', 'rect': [0, 0, 1, 1]}])
+        with self.assertRaises(ValueError):
+            ZoneLayout([{'name': 'a', 'polygon': [[0, 0], [1, 1]]}])
+
+class TestNormalization(unittest.TestCase):
+    def test_histogram_percentiles_match_numpy(self):
+        analyzer = CrowdDensityAnalyzer()
+        rng = np.random.default_rng(0)
+        maps = [analyzer._calculate_combined_density(cv2.cvtColor(SyntheticCrowd(size, seed=seed).frame(),
+                                                                  cv2.COLOR_BGR2GRAY))
+                for seed, size in enumerate(((320, 240), (1280, 720)))]
+        maps.append(rng.exponential(size=(300, 400)).astype(np.float32))
+        # Many equal values, as in flat background
+        skewed = rng.random((200, 300)).astype(np.float32)
+        skewed[:150] = 0.25
+        maps.append(skewed)
+
+        for density in maps:
+            estimated = analyzer._estimate_percentiles(density, (5, 95))
+            exact = np.percentile(density, (5, 95))
+            value_range = float(density.max() - density.min())
+            np.testing.assert_allclose(estimated, exact, rtol=0, atol=4e-4 * value_range)
+
+    def test_flat_map_normalizes_to_zeros(self):
+        normalized = CrowdDensityAnalyzer()._normalize_density(np.full((60, 80), 3.5, dtype=np.float32))
+        self.assertEqual(normalized.shape, (60, 80))
+        self.assertFalse(np.isnan(normalized).any())
+        self.assertEqual(float(np.abs(normalized).max()), 0.0)
+
+class TestFrameSeries(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    @staticmethod
+    def analysis(i: int) -> dict:
+        regions = ['left_side', 'center', 'right_side']
+        return {
+            'estimated_count': {'estimated_count': 10 * i, 'confidence': 0.5 + i / 100},
+            'overall': {'mean_density': i / 20, 'max_density': i / 10,
+                        'crowd_level': CROWD_LEVELS[i % len(CROWD_LEVELS)]},
+            'regions': {name: {'mean_density': (i + j) / 30} for j, name in enumerate(regions)},
+            'highest_density_region': regions[i % len(regions)],
+            'zones': {'gate': {'mean_density': i / 40, 'estimated_count': i}}
+        }
+
+    def test_npz_round_trip(self):
+        # A small capacity makes the columns grow several times
+        series = FrameSeries(fps=25.0, capacity=4)
+        for i in range(11):
+            series.add(2 * i + 1, self.analysis(i), analyzed=i % 2 == 0)
+
+        path = os.path.join(self.directory, 'series.npz')
+        series.save(path)
+        loaded = FrameSeries.load(path)
+
+        self.assertEqual(loaded.length, 11)
+        self.assertEqual(loaded.fps, 25.0)
+        self.assertEqual(loaded.region_names, series.region_names)
+        self.assertEqual(loaded.zone_names, ['gate'])
+        expected = series.columns()
+        actual = loaded.columns()
+        self.assertEqual(set(actual), set(expected))
+        for name, column in expected.items():
+            self.assertEqual(actual[name].dtype, column.dtype, name)
+            np.testing.assert_array_equal(actual[name], column, err_msg=name)
+        self.assertEqual(actual['frame'].tolist(), list(range(1, 22, 2)))
+        self.assertEqual(loaded.downsample(5), series.downsample(5))
+
+    def test_unknown_format(self):
+        series = FrameSeries()
+        series.add(1, self.analysis(0))
+        with self.assertRaises(ValueError):
+            series.save(os.path.join(self.directory, 'series.csv'))
+
+class TestTimestamps(unittest.TestCase):
+    def test_parse_timestamp(self):
+        self.assertEqual(parse_timestamp('90'), 90.0)
+        self.assertEqual(parse_timestamp('1:30'), 90.0)
+        self.assertEqual(parse_timestamp('01:02:03.5'), 3723.5)
+        self.assertEqual(parse_timestamp(' 0:00.25 '), 0.25)
+
+    def test_parse_timestamp_rejects_invalid(self):
+        for value in ('', 'abc', '-1', '1:60', '1:2:3:4', '1::2'):
+            with self.assertRaises(ValueError, msg=value):
+                parse_timestamp(value)
+
+    def test_time_range(self):
+        # Frame n is shown at (n - 1) / fps: 1.0 s is frame 11, and frames before 2.0 s end at frame 20
+        self.assertEqual(VideoRange(start=1.0, end=2.0).resolve(10.0, 100), (11, 20))
+        self.assertEqual(VideoRange(start=1.05).resolve(10.0, 100), (12, 100))
+        self.assertEqual(VideoRange(end=100.0).resolve(10.0, 100), (1, 100))
+
+    def test_frame_range(self):
+        self.assertEqual(VideoRange(start_frame=5, end_frame=8).resolve(10.0, 100), (5, 8))
+        self.assertEqual(VideoRange(start_frame=5, end_frame=500).resolve(10.0, 100), (5, 100))
+        # Frame ranges work without a frame rate or frame count
+        self.assertEqual(VideoRange(start_frame=5).resolve(0.0, 0), (5, None))
+
+    def test_invalid_ranges(self):
+        with self.assertRaises(ValueError):
+            VideoRange(start=1.0, start_frame=5)
+        with self.assertRaises(ValueError):
+            VideoRange(start=-1.0)
+        with self.assertRaises(ValueError):
+            VideoRange(end_frame=0)
+        with self.assertRaises(ValueError):
+            VideoRange(start=1.0).resolve(0.0, 100)
+        with self.assertRaises(ValueError):
+            VideoRange(start=20.0).resolve(10.0, 100)
+
+class TestBatchProcessor(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.directory, 'images')
+        self.output_dir = os.path.join(self.directory, 'results')
+        os.makedirs(os.path.join(self.input_dir, 'sub'))
+        self.images = []
+        for i, name in enumerate(['a.png', 'b.jpg', os.path.join('sub', 'c.png')]):
+            path = os.path.join(self.input_dir, name)
+            cv2.imwrite(path, SyntheticCrowd((160, 120), seed=i, people_per_megapixel=20000).frame())
+            self.images.append(path)
+        # Not an image despite its extension
+        self.broken = os.path.join(self.input_dir, 'broken.jpg')
+        with open(self.broken, 'wb') as f:
+            f.write(b'not a jpeg')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def run_batch(self, processes: int = 1, **options) -> dict:
+        processor = BatchProcessor(self.output_dir, processes=processes, **options)
+        return processor.run(BatchProcessor.find_images(self.input_dir))
+
+    def summary_lines(self) -> list:
+        with open(os.path.join(self.output_dir, 'batch_summary.jsonl')) as f:
+            return f.read().splitlines()
+
+    def test_find_images(self):
+        with open(os.path.join(self.input_dir, 'notes.txt'), 'w') as f:
+            f.write('not an image')
+        found = BatchProcessor.find_images(self.input_dir)
+        self.assertEqual(found, sorted(self.images + [self.broken]))
+        self.assertEqual(BatchProcessor.find_images(os.path.join(self.input_dir, '*.png')), [self.images[0]])
+
+    def test_resume_skips_summarized_images(self):
+        result = self.run_batch()
+        self.assertEqual((result['images'], result['skipped'], result['processed'], result['failed']), (4, 0, 3, 1))
+        records = BatchProcessor(self.output_dir).load_summary()
+        self.assertEqual(records[os.path.abspath(self.broken)]['status'], 'failed')
+        self.assertEqual(records[os.path.abspath(self.images[2])]['file'], os.path.join('sub', 'c.png'))
+
+        # Done images are skipped; the failed one is tried again
+        result = self.run_batch()
+        self.assertEqual((result['skipped'], result['processed'], result['failed']), (3, 0, 1))
+
+        # A changed image is analyzed again
+        stat = os.stat(self.images[1])
+        os.utime(self.images[1], (stat.st_atime, stat.st_mtime + 10))
+        result = self.run_batch()
+        self.assertEqual((result['skipped'], result['processed'], result['failed']), (2, 1, 1))
+        self.assertEqual(len(self.summary_lines()), 4 + 1 + 2)
+
+    def test_resume_after_cut_off_record(self):
+        self.run_batch()
+        summary_path = os.path.join(self.output_dir, 'batch_summary.jsonl')
+        with open(summary_path, 'a') as f:
+            f.write('{"file": "a.png", "path": ')
+
+        result = self.run_batch()
+        self.assertEqual((result['skipped'], result['processed'], result['failed']), (3, 0, 1))
+        # The next record starts on its own line
+        lines = self.summary_lines()
+        self.assertEqual(lines[-2], '{"file": "a.png", "path": ')
+        self.assertEqual(json.loads(lines[-1])['path'], os.path.abspath(self.broken))
+        self.assertEqual(len(BatchProcessor(self.output_dir).load_summary()), 4)
+
+    def test_artifacts_keep_extension(self):
+        self.run_batch(artifacts=True)
+        self.assertTrue(os.path.isdir(os.path.join(self.output_dir, 'a.png')))
+        self.assertTrue(os.path.isdir(os.path.join(self.output_dir, 'b.jpg')))
+        self.assertTrue(os.path.isdir(os.path.join(self.output_dir, 'sub', 'c.png')))
+
+    def test_process_pool_matches_serial(self):
+        self.run_batch(processes=1)
+        serial = BatchProcessor(self.output_dir).load_summary()
+        shutil.rmtree(self.output_dir)
+        result = self.run_batch(processes=2)
+        self.assertEqual((result['processed'], result['failed']), (3, 1))
+        pooled = BatchProcessor(self.output_dir).load_summary()
+
+        self.assertEqual(set(pooled), set(serial))
+        for path, record in serial.items():
+            for key in ('status', 'estimated_count', 'crowd_level', 'mean_density', 'max_density', 'hotspots'):
+                self.assertEqual(pooled[path].get(key), record.get(key), f"{path} {key}")
+
+if __name__ == '__main__':
+    unittest.main()